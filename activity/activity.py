@@ -1,89 +1,290 @@
-import glob
+import asyncio
 import json
-import os.path
-from datetime import datetime
+import logging
+from datetime import datetime, timezone
+from typing import Literal
 
-from fastapi import FastAPI, Response, status
-from pydantic import BaseModel
+from fastapi import FastAPI, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+from common.metrics import instrument, metrics
+from common.metrics import router as metrics_router
+from common.ndjson import iter_batches, iter_ndjson_lines
+
+from .async_storage import AsyncStorage
+from .models import Activity
+from .rollup import ActivityRollup, Granularity
+from .settings import StorageSettings
+from .storage import create_storage
 
 app = FastAPI()
-ACTIVITY_FOLDER = 'activity'
+app.include_router(metrics_router)
+settings = StorageSettings()
+ACTIVITY_FOLDER = settings.folder
+storage = create_storage(settings)
+rollup = ActivityRollup(parse=lambda data: Activity.model_validate_json(data))
+async_storage = AsyncStorage(storage, listeners=[rollup.apply])
+background_tasks = set()
+logger = logging.getLogger(__name__)
+
+
+class ActivityBulkItem(BaseModel):
+    line: int
+    id: int | None = None
+    status: Literal['created', 'updated', 'exists', 'duplicate', 'invalid']
+    detail: str | list | None = None
 
 
-class Activity(BaseModel):
-    id: int
+class ActivityBulkReport(BaseModel):
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    items: list[ActivityBulkItem] = []
+
+
+class ActivityStat(BaseModel):
+    bucket: datetime
     name: str
-    date: datetime
+    count: int
+
+
+@app.on_event('startup')
+async def on_startup():
+    metrics.start()
+    storage.load()
+    snapshot = settings.rollup_snapshot_path
+    if not (snapshot and rollup.restore(snapshot, storage.ids())):
+        rollup.build(storage.scan())
+    compaction = async_storage.compact_periodically(
+        interval=settings.compaction_interval,
+        ratio=settings.compaction_ratio
+    )
+    background_tasks.add(asyncio.create_task(compaction))
+
+
+@app.on_event('shutdown')
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await async_storage.close()
+    if settings.rollup_snapshot_path:
+        rollup.save(settings.rollup_snapshot_path)
+    metrics.stop()
+
+
+def as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def iter_activities(*, after=None, limit=None, date_from=None, date_to=None):
+    """
+       Yields stored activities in id order, one record in memory at a time.
 
+       ``after`` is the cursor: the id of the last activity of the previous page.
+       ``date_from`` and ``date_to`` bound ``Activity.date`` inclusively, naive datetimes are UTC.
+       """
+    date_from = date_from and as_utc(date_from)
+    date_to = date_to and as_utc(date_to)
+    count = 0
+    for activity_id, data in storage.scan(after=after):
+        if limit is not None and count >= limit:
+            return
+        try:
+            activity = Activity.model_validate_json(data)
+        except ValidationError as e:
+            # Raising here would cut a streamed response off mid-document.
+            logger.warning('Skipping invalid activity %d: %s', activity_id, e)
+            continue
+        date = as_utc(activity.date)
+        if (date_from and date < date_from) or (date_to and date > date_to):
+            continue
+        count += 1
+        yield activity
 
-def find_activity(activity_id=0):
-    return glob.glob(os.path.join(ACTIVITY_FOLDER, f"*{activity_id if activity_id else ''}.json"))
 
+def ndjson_stream(activities):
+    for activity in activities:
+        yield activity.model_dump_json().encode() + b'\n'
 
-def write_to_json(activity_id, activity):
-    with open(os.path.join(ACTIVITY_FOLDER, f'activity_{activity_id}.json'), 'w') as file:
-        file.write(activity.json())
+
+def json_array_stream(activities):
+    yield b'['
+    separator = b''
+    for activity in activities:
+        yield separator + activity.model_dump_json().encode()
+        separator = b','
+    yield b']'
 
 
 @app.get('/activity/get/all')
-def get_activities():
-    res = []
-    files = find_activity()
-    if files:
-        for file in files:
-            with open(file) as f:
-                data = f.read()
-                activity = Activity(**json.loads(data))
-                res.append(activity)
-    return res
+def get_activities(
+        request: Request,
+        after: int | None = None,
+        limit: int | None = Query(default=None, ge=1),
+        date_from: datetime | None = None,
+        date_to: datetime | None = None
+):
+    """
+       Streams the activities as a JSON array, or as NDJSON when the client accepts
+       ``application/x-ndjson``.
+
+       Without ``limit`` every activity is streamed. With it, the next page is requested
+       with ``after`` set to the id of the last activity received, a page shorter than
+       ``limit`` is the last one.
+       """
+    activities = iter_activities(after=after, limit=limit, date_from=date_from, date_to=date_to)
+    if 'application/x-ndjson' in request.headers.get('accept', ''):
+        return StreamingResponse(ndjson_stream(activities), media_type='application/x-ndjson')
+    return StreamingResponse(json_array_stream(activities), media_type='application/json')
 
 
 @app.get('/activity/get/{activity_id}')
-def get_activity(activity_id: int, response: Response):
-    file = find_activity(activity_id)
-    if file:
-        with open(file[0]) as f:
-            data = f.read()
-            return Activity(**json.loads(data))
+@instrument()
+async def get_activity(activity_id: int, response: Response):
+    data = await async_storage.read(activity_id)
+    if data is not None:
+        return Activity.model_validate_json(data)
     response.status_code = status.HTTP_404_NOT_FOUND
     return {}
 
 
 @app.post('/activity/add/{activity_id}')
-def add_activity(activity_id: int, activity: Activity, response: Response):
-    file = find_activity(activity_id)
-    if file:
-        response.status_code = status.HTTP_302_FOUND
-        return False
-    else:
-        write_to_json(activity_id, activity)
+@instrument()
+async def add_activity(activity_id: int, activity: Activity, response: Response):
+    async with async_storage.lock(activity_id):
+        if await async_storage.contains(activity_id):
+            response.status_code = status.HTTP_302_FOUND
+            return False
+        await async_storage.write(activity_id, activity.model_dump_json().encode())
     return True
 
 
 @app.put('/activity/update/{activity_id}')
-def update_activity(activity_id: int, activity: Activity, response: Response):
-    file = find_activity(activity_id)
-    if file:
-        with open(file[0]) as f:
-            data = f.read()
-            act = Activity(**json.loads(data))
-            act.name = activity.name
-            act.date = activity.date
-            write_to_json(activity_id, activity)
-        return True
+@instrument()
+async def update_activity(activity_id: int, activity: Activity, response: Response):
+    async with async_storage.lock(activity_id):
+        if await async_storage.contains(activity_id):
+            await async_storage.write(activity_id, activity.model_dump_json().encode())
+            return True
     response.status_code = status.HTTP_404_NOT_FOUND
     return False
 
 
 @app.delete('/activity/delete/{activity_id}')
-def delete_activity(activity_id: int, response: Response):
-    file = find_activity(activity_id)
-    if file:
-        os.remove(file[0])
-        return True
+@instrument()
+async def delete_activity(activity_id: int, response: Response):
+    async with async_storage.lock(activity_id):
+        if await async_storage.contains(activity_id):
+            await async_storage.delete(activity_id)
+            return True
     response.status_code = status.HTTP_404_NOT_FOUND
     return False
 
 
+def parse_bulk_rows(rows, seen):
+    """
+       Validates NDJSON rows into an ``id -> (line, data)`` mapping of the activities to write.
+
+       An id already ``seen`` earlier in the import is reported as a duplicate, the first
+       occurrence wins. Returns the mapping and the items of the rejected rows.
+       """
+    changes = {}
+    items = []
+    for line, raw in rows:
+        try:
+            activity = Activity.model_validate_json(raw)
+        except ValidationError as e:
+            detail = [{'loc': list(err['loc']), 'msg': err['msg']} for err in e.errors()]
+            items.append(ActivityBulkItem(line=line, status='invalid', detail=detail))
+            continue
+        if activity.id in seen:
+            items.append(ActivityBulkItem(line=line, id=activity.id, status='duplicate'))
+            continue
+        seen.add(activity.id)
+        changes[activity.id] = (line, activity.model_dump_json().encode())
+    return changes, items
+
+
+async def write_bulk_rows(changes, *, upsert):
+    """Writes a chunk of parsed rows as a single group-committed batch and returns their items."""
+    items = []
+    async with async_storage.lock_many(changes):
+        existing = await async_storage.contains_many(changes)
+        batch = []
+        for activity_id, (line, data) in changes.items():
+            if activity_id in existing and not upsert:
+                items.append(ActivityBulkItem(line=line, id=activity_id, status='exists'))
+                continue
+            batch.append((activity_id, data))
+            outcome = 'updated' if activity_id in existing else 'created'
+            items.append(ActivityBulkItem(line=line, id=activity_id, status=outcome))
+        if batch:
+            await async_storage.submit(batch)
+    return items
+
+
+@app.post('/activity/bulk', response_model=ActivityBulkReport)
+@instrument()
+async def bulk_activities(
+        request: Request,
+        upsert: bool = False,
+        chunk_size: int = Query(default=1000, ge=1, le=10000)
+):
+    """
+       Imports activities from an NDJSON document, one ``Activity`` per line.
+
+       Every ``chunk_size`` rows are written with a single storage batch. Existing ids are
+       reported as ``exists`` unless ``upsert`` is set, then they are replaced.
+       """
+    report = ActivityBulkReport()
+    seen = set()
+    async for rows in iter_batches(iter_ndjson_lines(request), chunk_size):
+        changes, items = parse_bulk_rows(rows, seen)
+        items.extend(await write_bulk_rows(changes, upsert=upsert))
+        for item in sorted(items, key=lambda item: item.line):
+            if item.status == 'created':
+                report.created += 1
+            elif item.status == 'updated':
+                report.updated += 1
+            else:
+                report.failed += 1
+            report.items.append(item)
+    return report
+
+
+def export_stream():
+    for _, data in storage.scan():
+        data = data.strip()
+        if b'\n' in data:
+            data = json.dumps(json.loads(data), separators=(',', ':')).encode()
+        yield data + b'\n'
+
+
+@app.get('/activity/export')
+def export_activities():
+    """Streams every stored activity as NDJSON, the format ``POST /activity/bulk`` imports."""
+    return StreamingResponse(
+        export_stream(),
+        media_type='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename="activities.ndjson"'}
+    )
+
 
+@app.get('/activity/stats', response_model=list[ActivityStat])
+@instrument()
+def get_activity_stats(
+        granularity: Granularity = 'day',
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        name: str | None = None
+):
+    """
+       Activity counts per name and ``granularity`` bucket (weeks start on Monday, UTC).
 
+       Served from the rollup built at startup and updated by every write, no activity is read.
+       """
+    rows = rollup.stats(granularity=granularity, date_from=date_from, date_to=date_to, name=name)
+    return [ActivityStat(bucket=bucket, name=activity_name, count=count) for bucket, activity_name, count in rows]
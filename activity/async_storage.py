@@ -0,0 +1,107 @@
+import asyncio
+import collections
+import contextlib
+
+from fastapi.concurrency import run_in_threadpool
+
+from .storage import ActivityStorage
+
+
+class AsyncStorage:
+    """
+       Event-loop side of an ``ActivityStorage``.
+
+       Blocking reads and writes run in the threadpool. Writes are group committed:
+       changes submitted while a batch is being written are queued and applied together
+       as the next batch, so concurrent requests share one sync. ``lock`` serializes the
+       check-then-write sequences of requests targeting the same id. ``listeners`` are
+       called with every batch once it is durable, e.g. to maintain derived indexes.
+       """
+
+    def __init__(self, storage: ActivityStorage, max_batch=256, listeners=()):
+        self.storage = storage
+        self.listeners = list(listeners)
+        self.max_batch = max_batch
+        self._pending = collections.deque()
+        self._flusher = None
+        self._locks = {}
+
+    @contextlib.asynccontextmanager
+    async def lock(self, activity_id):
+        entry = self._locks.setdefault(activity_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[activity_id]
+
+    @contextlib.asynccontextmanager
+    async def lock_many(self, activity_ids):
+        """Holds the locks of all ``activity_ids``, taken in id order so batches cannot deadlock."""
+        async with contextlib.AsyncExitStack() as stack:
+            for activity_id in sorted(set(activity_ids)):
+                await stack.enter_async_context(self.lock(activity_id))
+            yield
+
+    async def contains(self, activity_id):
+        return await run_in_threadpool(self.storage.__contains__, activity_id)
+
+    async def contains_many(self, activity_ids):
+        """The subset of ``activity_ids`` already stored, checked in one threadpool call."""
+        activity_ids = list(activity_ids)
+        return await run_in_threadpool(lambda: {i for i in activity_ids if i in self.storage})
+
+    async def read(self, activity_id):
+        return await run_in_threadpool(self.storage.read, activity_id)
+
+    async def write(self, activity_id, data):
+        await self.submit([(activity_id, data)])
+
+    async def delete(self, activity_id):
+        await self.submit([(activity_id, None)])
+
+    async def submit(self, changes):
+        """Queues ``(id, data)`` changes and returns once the batch holding them is durable."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((changes, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self.flush())
+        await future
+
+    def apply(self, changes):
+        self.storage.apply(changes)
+        for listener in self.listeners:
+            listener(changes)
+
+    async def flush(self):
+        while self._pending:
+            batch, size = [], 0
+            while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch):
+                changes, future = self._pending.popleft()
+                batch.append((changes, future))
+                size += len(changes)
+            try:
+                await run_in_threadpool(self.apply, [change for changes, _ in batch for change in changes])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+    async def compact_periodically(self, *, interval, ratio):
+        """Compacts the storage in the threadpool whenever ``ratio`` of it is stale."""
+        while True:
+            await asyncio.sleep(interval)
+            if self.storage.garbage_ratio() >= ratio:
+                await run_in_threadpool(self.storage.compact)
+
+    async def close(self):
+        if self._flusher is not None:
+            await self._flusher
+        await run_in_threadpool(self.storage.close)
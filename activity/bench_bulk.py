@@ -0,0 +1,55 @@
+"""
+Compares ``POST /activity/bulk`` with one ``POST /activity/add/{id}`` per activity::
+
+    python -m activity.bench_bulk
+
+Both runs write as many activities into a temporary storage of the configured backend,
+timings are printed and appended to ``t.txt`` by ``another.timer.outer``.
+"""
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from another.timer import outer
+
+ACTIVITIES = 2000
+
+
+def make_activities(first, count):
+    start = datetime(2024, 1, 1)
+    return [
+        {'id': i, 'name': f'activity {i % 7}', 'date': (start + timedelta(minutes=i)).isoformat()}
+        for i in range(first, first + count)
+    ]
+
+
+@outer(1, flag=True)
+def post_one_by_one(client, activities):
+    for activity in activities:
+        client.post(f'/activity/add/{activity["id"]}', json=activity)
+
+
+@outer(1, flag=True)
+def post_bulk(client, activities):
+    body = '\n'.join(json.dumps(activity) for activity in activities)
+    return client.post('/activity/bulk', content=body).json()
+
+
+def main():
+    folder = tempfile.mkdtemp()
+    os.environ['ACTIVITY_STORAGE_FOLDER'] = folder
+    os.environ['ACTIVITY_STORAGE_SQLITE_PATH'] = os.path.join(folder, 'activity.sqlite3')
+    os.environ['ACTIVITY_STORAGE_SEGMENTS_PATH'] = os.path.join(folder, 'segments')
+    from .activity import app
+
+    with TestClient(app) as client:
+        post_one_by_one(client, make_activities(0, ACTIVITIES))
+        report = post_bulk(client, make_activities(ACTIVITIES, ACTIVITIES))
+    print(f'bulk: created {report["created"]}, failed {report["failed"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Copies every activity from one storage backend into another, e.g. the ``activity_*.json``
+folder into segment files::
+
+    python -m activity.migrate --source folder --target segments
+
+``--source log`` reads the log file of the former ``log`` backend. Paths are taken from
+the ``ACTIVITY_STORAGE_*`` settings. Activities already present in the target are
+overwritten, so an interrupted migration can simply be run again.
+"""
+import argparse
+import logging
+import typing
+
+from pydantic import ValidationError
+
+from .models import Activity
+from .settings import StorageSettings
+from .storage import LogStorage, create_storage
+
+BACKENDS = typing.get_args(StorageSettings.model_fields['backend'].annotation)
+SOURCES = BACKENDS + ('log',)
+logger = logging.getLogger(__name__)
+
+
+def open_storage(settings, backend):
+    if backend == 'log':
+        return LogStorage(settings.log_path)
+    return create_storage(settings.model_copy(update={'backend': backend}))
+
+
+def migrate(source, target, batch_size=1000):
+    """
+       Streams ``source`` into ``target`` in batches of ``batch_size`` and returns the number copied.
+
+       Every payload is validated as an ``Activity`` and re-encoded as compact JSON, so
+       pretty-printed files or trailing newlines never reach line-based backends. Invalid
+       payloads are logged and skipped.
+       """
+    copied = 0
+    batch = []
+    for activity_id, data in source.scan():
+        try:
+            data = Activity.model_validate_json(data).model_dump_json().encode()
+        except ValidationError as e:
+            logger.warning('Skipping activity %d: %s', activity_id, e)
+            continue
+        batch.append((activity_id, data))
+        if len(batch) >= batch_size:
+            target.apply(batch)
+            copied += len(batch)
+            batch = []
+    if batch:
+        target.apply(batch)
+        copied += len(batch)
+    return copied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Copy activities between storage backends.')
+    parser.add_argument('--source', choices=SOURCES, default='folder')
+    parser.add_argument('--target', choices=BACKENDS, default='segments')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+    if args.source == args.target:
+        parser.error('source and target must be different backends')
+
+    settings = StorageSettings()
+    source = open_storage(settings, args.source)
+    target = open_storage(settings, args.target)
+    source.load()
+    target.load()
+    try:
+        copied = migrate(source, target, batch_size=args.batch_size)
+    finally:
+        source.close()
+        target.close()
+    print(f'Copied {copied} activities from {args.source} to {args.target}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class Activity(BaseModel):
+    id: int
+    name: str
+    date: datetime
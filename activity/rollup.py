@@ -0,0 +1,150 @@
+import bisect
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Literal
+
+from .storage import write_atomic
+
+Granularity = Literal['hour', 'day', 'week']
+
+HOUR = 3600
+logger = logging.getLogger(__name__)
+
+
+def hour_of(value: datetime):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() // HOUR)
+
+
+def bucket_start(hour, granularity: Granularity):
+    start = datetime.fromtimestamp(hour * HOUR, tz=timezone.utc)
+    if granularity == 'hour':
+        return start
+    start = start.replace(hour=0)
+    if granularity == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+class ActivityRollup:
+    """
+       Activity counts per hour and name, maintained as activities are written.
+
+       Every id remembers the ``(hour, name)`` it is counted under, so replacing or deleting
+       an activity moves its count without rescanning anything. Hours are kept in a sorted
+       list, a range query only visits the hours it covers and day or week buckets are
+       summed from them.
+
+       Records ``parse`` rejects with a ``ValueError`` are logged and left uncounted. ``save``
+       writes the counted entries to a snapshot that ``restore`` reads on the next startup
+       instead of parsing every stored activity again.
+       """
+
+    def __init__(self, parse):
+        self.parse = parse
+        self._entries = {}
+        self._counts = {}
+        self._hours = []
+        self._lock = threading.Lock()
+
+    def build(self, records, batch_size=1000):
+        """Counts ``(id, data)`` records, e.g. a storage scan at startup, ``batch_size`` at a time."""
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self.apply(batch)
+                batch = []
+        self.apply(batch)
+
+    def apply(self, changes):
+        """Follows ``(id, data)`` storage changes, ``None`` data deleting the id."""
+        entries = [(activity_id, self.entry(activity_id, data)) for activity_id, data in changes]
+        with self._lock:
+            for activity_id, entry in entries:
+                previous = self._entries.pop(activity_id, None)
+                if previous is not None:
+                    self.discount(*previous)
+                if entry is not None:
+                    self._entries[activity_id] = entry
+                    self.count(*entry)
+
+    def entry(self, activity_id, data):
+        """The ``(hour, name)`` ``data`` is counted under, ``None`` if it is missing or invalid."""
+        if data is None:
+            return None
+        try:
+            activity = self.parse(data)
+        except ValueError as e:
+            logger.warning('Activity %d is not counted: %s', activity_id, e)
+            return None
+        return hour_of(activity.date), activity.name
+
+    def save(self, path):
+        """Writes the counted entries to ``path``, for ``restore`` on the next startup."""
+        with self._lock:
+            entries = [[activity_id, hour, name] for activity_id, (hour, name) in self._entries.items()]
+        write_atomic(path, json.dumps(entries, separators=(',', ':')).encode())
+
+    def restore(self, path, ids):
+        """
+           Loads the snapshot at ``path`` if it covers exactly ``ids`` and returns whether it did.
+
+           The snapshot is removed once read, so it is only ever trusted for the state it was
+           saved from: a crash before the next ``save`` leaves none and ``build`` runs instead.
+           """
+        try:
+            with open(path, 'rb') as file:
+                entries = json.load(file)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            logger.warning('Ignoring rollup snapshot %s: %s', path, e)
+            entries = None
+        os.remove(path)
+        if entries is None or sorted(activity_id for activity_id, _, _ in entries) != list(ids):
+            return False
+        with self._lock:
+            for activity_id, hour, name in entries:
+                self._entries[activity_id] = (hour, name)
+                self.count(hour, name)
+        return True
+
+    def count(self, hour, name):
+        counts = self._counts.get(hour)
+        if counts is None:
+            counts = self._counts[hour] = Counter()
+            bisect.insort(self._hours, hour)
+        counts[name] += 1
+
+    def discount(self, hour, name):
+        counts = self._counts[hour]
+        counts[name] -= 1
+        if not counts[name]:
+            del counts[name]
+        if not counts:
+            del self._counts[hour]
+            del self._hours[bisect.bisect_left(self._hours, hour)]
+
+    def stats(self, *, granularity: Granularity, date_from=None, date_to=None, name=None):
+        """
+           Returns ``(bucket_start, name, count)`` rows ordered by bucket and name.
+
+           ``date_from`` and ``date_to`` select whole hours, naive datetimes are UTC.
+           """
+        buckets = {}
+        with self._lock:
+            low = 0 if date_from is None else bisect.bisect_left(self._hours, hour_of(date_from))
+            high = len(self._hours) if date_to is None else bisect.bisect_right(self._hours, hour_of(date_to))
+            for hour in self._hours[low:high]:
+                start = bucket_start(hour, granularity)
+                for activity_name, count in self._counts[hour].items():
+                    if name is None or activity_name == name:
+                        key = (start, activity_name)
+                        buckets[key] = buckets.get(key, 0) + count
+        return [(start, activity_name, count) for (start, activity_name), count in sorted(buckets.items())]
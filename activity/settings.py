@@ -0,0 +1,40 @@
+from typing import Literal
+
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class StorageSettings(BaseSettings):
+    """
+       Activity storage configuration read from ``ACTIVITY_STORAGE_*`` environment variables.
+
+       ``backend`` selects where activities live: one ``activity_{id}.json`` file per
+       activity in ``folder``, a SQLite database at ``sqlite_path`` or append-only segment
+       files in ``segments_path``. Segments are compacted in the background every
+       ``compaction_interval`` seconds once ``compaction_ratio`` of their bytes are stale.
+       ``log_path`` is the append-only log of the former ``log`` backend, it can only be
+       read by ``python -m activity.migrate --source log``. When ``rollup_snapshot_path`` is
+       set the stats rollup is saved there on shutdown and restored on startup, rather than
+       rebuilt from every stored activity.
+       """
+    model_config = SettingsConfigDict(env_prefix='ACTIVITY_STORAGE_', env_file='.env', extra='ignore')
+
+    backend: Literal['folder', 'sqlite', 'segments'] = 'folder'
+    folder: str = 'activity'
+    sqlite_path: str = 'activity/activity.sqlite3'
+    segments_path: str = 'activity/segments'
+    segment_size: int = 64 * 1024 * 1024
+    compaction_interval: float = 60
+    compaction_ratio: float = 0.5
+    log_path: str = 'activity/activity.log'
+    rollup_snapshot_path: str | None = None
+
+    @field_validator('backend', mode='before')
+    @classmethod
+    def reject_log_backend(cls, value):
+        if value == 'log':
+            raise ValueError(
+                "the log backend was replaced by segments, convert its data with "
+                "'python -m activity.migrate --source log --target segments'"
+            )
+        return value
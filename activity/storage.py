@@ -0,0 +1,589 @@
+import abc
+import bisect
+import contextlib
+import itertools
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+
+from .settings import StorageSettings
+
+ACTIVITY_FILE = re.compile(r'activity_(\d+)\.json')
+SEGMENT_FILE = re.compile(r'segment_(\d{8})\.(log|compact)')
+TEMPORARY_FILE = re.compile(r'\.activity_\d+\.json\.\w+\.tmp')
+logger = logging.getLogger(__name__)
+
+UPSERT = 'INSERT INTO activity (id, data) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET data = excluded.data'
+
+
+def write_atomic(path, data):
+    """Replaces ``path`` with ``data`` through an fsynced temporary file in the same folder."""
+    folder, name = os.path.split(path)
+    fd, temporary = tempfile.mkstemp(dir=folder, prefix=f'.{name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temporary)
+        raise
+
+
+def fsync_directory(folder):
+    """Persists renames and removals in ``folder``, directories cannot be opened on Windows."""
+    if os.name != 'posix':
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SortedIds:
+    """
+       Ascending ids kept sorted as they are added and discarded.
+
+       Scans bisect into the list instead of sorting every id for each request. ``after``
+       bisects again for every id it yields, so ids added or discarded while a scan is
+       paused are seen or skipped consistently.
+       """
+
+    def __init__(self, ids=()):
+        self._ids = sorted(ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def add(self, activity_id):
+        index = bisect.bisect_left(self._ids, activity_id)
+        if index == len(self._ids) or self._ids[index] != activity_id:
+            self._ids.insert(index, activity_id)
+
+    def discard(self, activity_id):
+        index = bisect.bisect_left(self._ids, activity_id)
+        if index < len(self._ids) and self._ids[index] == activity_id:
+            del self._ids[index]
+
+    def after(self, after=None):
+        ids = self._ids
+        index = 0 if after is None else bisect.bisect_right(ids, after)
+        while index < len(ids):
+            activity_id = ids[index]
+            yield activity_id
+            index = bisect.bisect_right(ids, activity_id)
+
+
+class ActivityStorage(abc.ABC):
+    """
+       Store of serialized activities (JSON bytes) keyed by activity id.
+
+       Backends keep an index of the stored ids, so lookups never scan the storage.
+       ``load`` opens the storage and builds that index, it is called once at startup.
+       A backend missing one of the abstract methods fails when it is instantiated.
+       """
+
+    def load(self):
+        pass
+
+    def close(self):
+        pass
+
+    @abc.abstractmethod
+    def __contains__(self, activity_id):
+        """Whether ``activity_id`` is stored."""
+
+    @abc.abstractmethod
+    def read(self, activity_id):
+        """Returns the stored JSON of ``activity_id`` or ``None``."""
+
+    @abc.abstractmethod
+    def apply(self, changes):
+        """
+           Applies ``(id, data)`` changes in order, ``None`` data deleting the id.
+
+           The whole batch is made durable before returning, so it costs a single
+           sync no matter how many changes it holds (group commit).
+           """
+
+    def write(self, activity_id, data):
+        """Stores ``data`` as ``activity_id``, replacing a previous version."""
+        self.apply([(activity_id, data)])
+
+    def delete(self, activity_id):
+        """Removes ``activity_id`` and returns whether it was stored."""
+        if activity_id not in self:
+            return False
+        self.apply([(activity_id, None)])
+        return True
+
+    @abc.abstractmethod
+    def ids(self):
+        """Stored ids in ascending order."""
+
+    def garbage_ratio(self):
+        """Share of the storage wasted by stale records, ``compact`` reclaims it."""
+        return 0
+
+    def compact(self):
+        pass
+
+    def ids_after(self, after=None):
+        """Stored ids greater than ``after`` in ascending order, ``SortedIds`` backends yield them lazily."""
+        ids = self.ids()
+        start = 0 if after is None else bisect.bisect_right(ids, after)
+        return itertools.islice(ids, start, None)
+
+    def scan(self, after=None):
+        """Lazily yields ``(id, data)`` pairs in ascending id order, starting after the id ``after``."""
+        for activity_id in self.ids_after(after):
+            data = self.read(activity_id)
+            if data is not None:
+                yield activity_id, data
+
+
+class FolderStorage(ActivityStorage):
+    """
+       One ``activity_{id}.json`` file per activity with an in-memory id -> path index.
+
+       The folder is listed once by ``load``, afterwards the index and the sorted ids are
+       maintained by ``apply``. Files are replaced atomically: the new content is written and fsynced
+       to a temporary file that is then renamed over the old one, so a crash leaves
+       either version but never a truncated file.
+       """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._paths = {}
+        self._ids = SortedIds()
+        self._lock = threading.Lock()
+
+    def path(self, activity_id):
+        return os.path.join(self.folder, f'activity_{activity_id}.json')
+
+    def load(self):
+        paths = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                match = ACTIVITY_FILE.fullmatch(entry.name)
+                if match and entry.is_file():
+                    paths[int(match[1])] = entry.path
+                elif TEMPORARY_FILE.fullmatch(entry.name):
+                    # Left behind by a write interrupted before its rename.
+                    os.remove(entry.path)
+        self._paths = paths
+        self._ids = SortedIds(paths)
+
+    def __contains__(self, activity_id):
+        return activity_id in self._paths
+
+    def read(self, activity_id):
+        path = self._paths.get(activity_id)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            with self._lock:
+                self._paths.pop(activity_id, None)
+                self._ids.discard(activity_id)
+            return None
+
+    def apply(self, changes):
+        for activity_id, data in changes:
+            if data is None:
+                with self._lock:
+                    path = self._paths.pop(activity_id, None)
+                    self._ids.discard(activity_id)
+                if path is not None:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+            else:
+                path = self._paths.get(activity_id) or self.path(activity_id)
+                write_atomic(path, data)
+                with self._lock:
+                    self._paths[activity_id] = path
+                    self._ids.add(activity_id)
+        fsync_directory(self.folder)
+
+    def ids(self):
+        return list(self._ids)
+
+    def ids_after(self, after=None):
+        return self._ids.after(after)
+
+
+class SQLiteStorage(ActivityStorage):
+    """Activities as rows of an ``activity (id INTEGER PRIMARY KEY, data BLOB)`` table."""
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=FULL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS activity (id INTEGER PRIMARY KEY, data BLOB NOT NULL)')
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def execute(self, sql, parameters=()):
+        with self._lock:
+            cursor = self._connection.execute(sql, parameters)
+            return cursor.fetchall(), cursor.rowcount
+
+    def __contains__(self, activity_id):
+        rows, _ = self.execute('SELECT 1 FROM activity WHERE id = ?', (activity_id,))
+        return bool(rows)
+
+    def read(self, activity_id):
+        rows, _ = self.execute('SELECT data FROM activity WHERE id = ?', (activity_id,))
+        return bytes(rows[0][0]) if rows else None
+
+    def apply(self, changes):
+        """Runs the batch in one transaction, committed with a single WAL sync."""
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                for activity_id, data in changes:
+                    if data is None:
+                        self._connection.execute('DELETE FROM activity WHERE id = ?', (activity_id,))
+                    else:
+                        self._connection.execute(UPSERT, (activity_id, data))
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+
+    def ids(self):
+        rows, _ = self.execute('SELECT id FROM activity ORDER BY id')
+        return [row[0] for row in rows]
+
+    def scan(self, after=None, batch_size=500):
+        """Reads the table in keyset batches, so only ``batch_size`` rows are held at once."""
+        last_id = after
+        while True:
+            if last_id is None:
+                rows, _ = self.execute('SELECT id, data FROM activity ORDER BY id LIMIT ?', (batch_size,))
+            else:
+                rows, _ = self.execute(
+                    'SELECT id, data FROM activity WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, batch_size)
+                )
+            for activity_id, data in rows:
+                yield activity_id, bytes(data)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+
+class Segment:
+    """
+       Segment file of ``{id}\t{json}\n`` records, an empty payload deletes the id.
+
+       Records are read through a shared ``mmap`` of the file. Only the active segment
+       grows, its map is recreated when a record lies past the mapped size.
+       """
+
+    def __init__(self, path, number):
+        self.path = path
+        self.number = number
+        self.size = os.path.getsize(path)
+        self._map = None
+        self._lock = threading.Lock()
+
+    def read(self, offset, length):
+        mapped = self._map
+        if mapped is None or offset + length > len(mapped):
+            with self._lock:
+                mapped = self._map
+                if mapped is None or offset + length > len(mapped):
+                    with open(self.path, 'rb') as file:
+                        mapped = self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped[offset:offset + length]
+
+    def records(self):
+        return self.parse(self.path)
+
+    @staticmethod
+    def parse(path):
+        """
+           Yields the ``(id, offset, length)`` of the complete records, ``length`` is 0 for deletions.
+
+           Lines that are not ``{id}\t...`` records are logged and skipped, so one damaged
+           record does not make the rest of the file unreadable.
+           """
+        offset = 0
+        with open(path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    return
+                key, tab, payload = line.partition(b'\t')
+                if tab and key.isdigit():
+                    yield int(key), offset + len(key) + 1, len(payload) - 1
+                else:
+                    logger.warning('Skipping invalid record at offset %d of %s', offset, path)
+                offset += len(line)
+
+
+class SegmentStorage(ActivityStorage):
+    """
+       Append-only log split into ``segment_{n}.log`` files of about ``segment_size`` bytes.
+
+       ``load`` replays the segments into an id -> (segment, offset, length) index, so a read
+       is a slice of the segment map, and the stored ids into a ``SortedIds``. Writes go to
+       the last (active) segment, which is sealed once it exceeds ``segment_size``.
+       ``compact`` rewrites the sealed segments into a single ``segment_{n}.compact`` file
+       that keeps only their live records; segments numbered up to ``n`` are ignored and
+       removed from then on, so a crash at any point of a compaction leaves either the old
+       segments or the compacted one.
+       """
+
+    def __init__(self, folder, segment_size=64 * 1024 * 1024):
+        self.folder = folder
+        self.segment_size = segment_size
+        self._segments = []
+        self._index = {}
+        self._ids = SortedIds()
+        self._live = {}
+        self._fd = None
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+
+    def segment_path(self, number, kind='log'):
+        return os.path.join(self.folder, f'segment_{number:08d}.{kind}')
+
+    def load(self):
+        os.makedirs(self.folder, exist_ok=True)
+        numbers = {'log': [], 'compact': []}
+        for name in os.listdir(self.folder):
+            match = SEGMENT_FILE.fullmatch(name)
+            if match is not None:
+                numbers[match[2]].append(int(match[1]))
+            elif name.startswith('segment_') and name.endswith('.tmp'):
+                os.remove(os.path.join(self.folder, name))
+        base = max(numbers['compact'], default=None)
+        segments = [] if base is None else [Segment(self.segment_path(base, 'compact'), base)]
+        for kind, stale in (('compact', numbers['compact']), ('log', numbers['log'])):
+            for number in stale:
+                if base is not None and (number < base or kind == 'log' and number == base):
+                    os.remove(self.segment_path(number, kind))
+        logs = sorted(number for number in numbers['log'] if base is None or number > base)
+        segments.extend(Segment(self.segment_path(number), number) for number in logs)
+        if not logs:
+            segments.append(self.create_segment(max(numbers['compact'] + numbers['log'], default=-1) + 1))
+
+        self._index, self._live = {}, {segment: 0 for segment in segments}
+        end = 0
+        for segment in segments:
+            end = 0
+            for activity_id, offset, length in segment.records():
+                self.set_location(activity_id, (segment, offset, length) if length else None)
+                end = offset + length + 1
+        active = segments[-1]
+        if end < active.size:
+            # A torn last record is dropped, it was never acknowledged.
+            with open(active.path, 'r+b') as file:
+                file.truncate(end)
+            active.size = end
+        self._segments = segments
+        self._ids = SortedIds(self._index)
+        self._fd = os.open(active.path, os.O_WRONLY | os.O_APPEND)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def create_segment(self, number):
+        path = self.segment_path(number)
+        open(path, 'ab').close()
+        fsync_directory(self.folder)
+        return Segment(path, number)
+
+    def set_location(self, activity_id, location):
+        """
+           Points the index at ``location``, ``None`` deletes the id, the caller holds the lock.
+
+           ``_live`` counts whole ``{id}\t{json}\n`` records, so it adds up to the segment size
+           when nothing in it was overwritten; deletion records are never live.
+           """
+        key_size = len(str(activity_id)) + 2
+        previous = self._index.pop(activity_id, None)
+        if previous is not None:
+            self._live[previous[0]] -= key_size + previous[2]
+        if location is not None:
+            self._index[activity_id] = location
+            self._live[location[0]] += key_size + location[2]
+
+    def apply(self, changes):
+        """
+           Appends the batch with one ``write`` and one ``fsync``, then points the index at it.
+
+           Records are separated by newlines, a payload containing one is rejected with
+           ``ValueError`` before anything of the batch is written.
+           """
+        for activity_id, data in changes:
+            if data and b'\n' in data:
+                raise ValueError(f'Activity {activity_id} payload contains a newline')
+        with self._lock:
+            active = self._segments[-1]
+            records = []
+            locations = {}
+            position = active.size
+            for activity_id, data in changes:
+                key = str(activity_id).encode()
+                records.append(key + b'\t' + (data or b'') + b'\n')
+                locations[activity_id] = (active, position + len(key) + 1, len(data)) if data else None
+                position += len(records[-1])
+            os.write(self._fd, b''.join(records))
+            os.fsync(self._fd)
+            active.size = position
+            for activity_id, location in locations.items():
+                self.set_location(activity_id, location)
+                if location is None:
+                    self._ids.discard(activity_id)
+                else:
+                    self._ids.add(activity_id)
+            if active.size >= self.segment_size:
+                self.rotate()
+
+    def rotate(self):
+        """Seals the active segment and starts the next one, the caller holds the lock."""
+        segment = self.create_segment(self._segments[-1].number + 1)
+        os.close(self._fd)
+        self._fd = os.open(segment.path, os.O_WRONLY | os.O_APPEND)
+        self._segments.append(segment)
+        self._live[segment] = 0
+
+    def __contains__(self, activity_id):
+        return activity_id in self._index
+
+    def read(self, activity_id):
+        location = self._index.get(activity_id)
+        if location is None:
+            return None
+        segment, offset, length = location
+        return segment.read(offset, length)
+
+    def ids(self):
+        return list(self._ids)
+
+    def ids_after(self, after=None):
+        return self._ids.after(after)
+
+    def garbage_ratio(self):
+        """Share of the sealed segments taken by overwritten and deleted records."""
+        sealed = self._segments[:-1]
+        size = sum(segment.size for segment in sealed)
+        if not size:
+            return 0
+        return 1 - sum(self._live.get(segment, 0) for segment in sealed) / size
+
+    def compact(self):
+        with self._compaction_lock:
+            sealed = self._segments[:-1]
+            if not sealed:
+                return
+            number = sealed[-1].number
+            path = self.segment_path(number, 'compact')
+            moved = []
+            offset = 0
+            with open(path + '.tmp', 'wb') as file:
+                for segment in sealed:
+                    for activity_id, record_offset, length in segment.records():
+                        location = (segment, record_offset, length)
+                        if self._index.get(activity_id) != location:
+                            continue
+                        key = str(activity_id).encode()
+                        file.write(key + b'\t' + segment.read(record_offset, length) + b'\n')
+                        moved.append((activity_id, location, offset + len(key) + 1))
+                        offset += len(key) + length + 2
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(path + '.tmp', path)
+            fsync_directory(self.folder)
+
+            compacted = Segment(path, number)
+            with self._lock:
+                self._live[compacted] = 0
+                for activity_id, location, new_offset in moved:
+                    # Records written in the meantime went to the active segment and win.
+                    if self._index.get(activity_id) == location:
+                        self.set_location(activity_id, (compacted, new_offset, location[2]))
+                self._segments = [compacted] + self._segments[len(sealed):]
+                for segment in sealed:
+                    del self._live[segment]
+            for segment in sealed:
+                if segment.path != path:
+                    os.remove(segment.path)
+
+
+class LogStorage(ActivityStorage):
+    """
+       Read-only view of the ``{id}\t{json}\n`` log of the former ``log`` backend.
+
+       It is kept so ``activity.migrate`` can convert existing logs, writes are refused. A
+       torn last record is ignored but left in the file.
+       """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._offsets = {}
+
+    def load(self):
+        offsets = {}
+        if os.path.exists(self.path):
+            for activity_id, offset, length in Segment.parse(self.path):
+                if length:
+                    offsets[activity_id] = (offset, length)
+                else:
+                    offsets.pop(activity_id, None)
+            self._fd = os.open(self.path, os.O_RDONLY)
+        self._offsets = offsets
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __contains__(self, activity_id):
+        return activity_id in self._offsets
+
+    def read(self, activity_id):
+        location = self._offsets.get(activity_id)
+        if location is None:
+            return None
+        offset, length = location
+        return os.pread(self._fd, length, offset)
+
+    def apply(self, changes):
+        raise PermissionError(f'{self.path} is read-only, migrate it with python -m activity.migrate --source log')
+
+    def ids(self):
+        return sorted(self._offsets)
+
+
+def create_storage(settings: StorageSettings) -> ActivityStorage:
+    if settings.backend == 'sqlite':
+        return SQLiteStorage(settings.sqlite_path)
+    if settings.backend == 'segments':
+        return SegmentStorage(settings.segments_path, segment_size=settings.segment_size)
+    return FolderStorage(settings.folder)
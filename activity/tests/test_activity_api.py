@@ -0,0 +1,96 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from activity import activity as activity_app
+from activity.async_storage import AsyncStorage
+from activity.rollup import ActivityRollup
+from activity.storage import FolderStorage
+
+
+def make_activity(activity_id, date='2024-01-01T10:00:00', name='run'):
+    return {'id': activity_id, 'name': name, 'date': date}
+
+
+@pytest.fixture(name='client')
+def client_fixture(tmp_path, monkeypatch):
+    storage = FolderStorage(str(tmp_path))
+    rollup = ActivityRollup(parse=lambda data: activity_app.Activity.model_validate_json(data))
+    monkeypatch.setattr(activity_app, 'storage', storage)
+    monkeypatch.setattr(activity_app, 'rollup', rollup)
+    monkeypatch.setattr(activity_app, 'async_storage', AsyncStorage(storage, listeners=[rollup.apply]))
+    with TestClient(activity_app.app) as client:
+        yield client
+
+
+def test_get_all_pages_with_cursor(client: TestClient):
+    for activity_id in (3, 1, 2):
+        assert client.post(f'/activity/add/{activity_id}', json=make_activity(activity_id)).json() is True
+
+    first = client.get('/activity/get/all', params={'limit': 2})
+    assert first.headers['content-type'] == 'application/json'
+    assert [a['id'] for a in first.json()] == [1, 2]
+    rest = client.get('/activity/get/all', params={'limit': 2, 'after': 2}).json()
+    assert [a['id'] for a in rest] == [3]
+    assert client.get('/activity/get/all', params={'after': 3}).json() == []
+
+
+def test_get_all_streams_ndjson_and_filters_dates(client: TestClient):
+    client.post('/activity/add/1', json=make_activity(1, date='2024-01-01T10:00:00'))
+    client.post('/activity/add/2', json=make_activity(2, date='2024-02-01T10:00:00'))
+    client.post('/activity/add/3', json=make_activity(3, date='2024-03-01T10:00:00+00:00'))
+
+    response = client.get(
+        '/activity/get/all',
+        params={'date_from': '2024-01-15T00:00:00', 'date_to': '2024-03-01T10:00:00Z'},
+        headers={'Accept': 'application/x-ndjson'}
+    )
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert [json.loads(line)['id'] for line in response.text.splitlines()] == [2, 3]
+
+
+def test_bulk_reports_every_line(client: TestClient):
+    client.post('/activity/add/3', json=make_activity(3))
+    body = '\n'.join([
+        json.dumps(make_activity(1)),
+        '{"id": "x"}',
+        json.dumps(make_activity(1, name='swim')),
+        '',
+        json.dumps(make_activity(2)),
+        json.dumps(make_activity(3, name='swim')),
+    ])
+
+    report = client.post('/activity/bulk', params={'chunk_size': 2}, content=body).json()
+    assert (report['created'], report['updated'], report['failed']) == (2, 0, 3)
+    assert [(item['line'], item['status']) for item in report['items']] == [
+        (1, 'created'), (2, 'invalid'), (3, 'duplicate'), (5, 'created'), (6, 'exists')
+    ]
+    assert client.get('/activity/get/1').json()['name'] == 'run'
+
+    report = client.post('/activity/bulk', params={'upsert': True}, content=body.splitlines()[-1]).json()
+    assert report['items'] == [{'line': 1, 'id': 3, 'status': 'updated', 'detail': None}]
+    assert client.get('/activity/get/3').json()['name'] == 'swim'
+
+
+def test_export_round_trips_through_bulk(client: TestClient):
+    for activity_id in (2, 1):
+        client.post(f'/activity/add/{activity_id}', json=make_activity(activity_id))
+
+    exported = client.get('/activity/export')
+    assert exported.headers['content-type'] == 'application/x-ndjson'
+    lines = exported.text.splitlines()
+    assert [json.loads(line)['id'] for line in lines] == [1, 2]
+
+    client.delete('/activity/delete/1')
+    report = client.post('/activity/bulk', files={'file': ('activities.ndjson', exported.content)}).json()
+    assert (report['created'], report['failed']) == (1, 1)
+
+
+def test_get_all_skips_invalid_stored_records(client: TestClient):
+    client.post('/activity/add/1', json=make_activity(1))
+    activity_app.storage.write(2, b'{"id": 2}')
+    client.post('/activity/add/3', json=make_activity(3))
+
+    response = client.get('/activity/get/all')
+    assert [activity['id'] for activity in response.json()] == [1, 3]
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+
+import pytest
+
+from activity.async_storage import AsyncStorage
+from activity.storage import ActivityStorage
+
+
+class RecordingStorage(ActivityStorage):
+    """Dict storage remembering every applied batch, ``gate`` holds the first one back."""
+
+    def __init__(self):
+        self.data = {}
+        self.batches = []
+        self.gate = threading.Event()
+        self.fail = False
+
+    def __contains__(self, activity_id):
+        return activity_id in self.data
+
+    def read(self, activity_id):
+        return self.data.get(activity_id)
+
+    def apply(self, changes):
+        if not self.batches:
+            self.gate.wait(5)
+        self.batches.append(list(changes))
+        if self.fail:
+            raise OSError('disk full')
+        for activity_id, data in changes:
+            if data is None:
+                self.data.pop(activity_id, None)
+            else:
+                self.data[activity_id] = data
+
+    def ids(self):
+        return sorted(self.data)
+
+
+def test_group_commit_batches_pending_writes():
+    storage = RecordingStorage()
+    heard = []
+    async_storage = AsyncStorage(storage, max_batch=3, listeners=[heard.append])
+
+    async def scenario():
+        first = asyncio.create_task(async_storage.write(1, b'a'))
+        await asyncio.sleep(0.05)
+        # Queued while the first batch is being written, flushed as following batches.
+        rest = [asyncio.create_task(async_storage.write(i, b'x')) for i in range(2, 6)]
+        await asyncio.sleep(0.05)
+        storage.gate.set()
+        await asyncio.gather(first, *rest)
+        await async_storage.delete(2)
+
+    asyncio.run(scenario())
+
+    assert storage.batches == [
+        [(1, b'a')],
+        [(2, b'x'), (3, b'x'), (4, b'x')],
+        [(5, b'x')],
+        [(2, None)],
+    ]
+    assert heard == storage.batches
+    assert storage.ids() == [1, 3, 4, 5]
+
+
+def test_group_commit_failure_reaches_every_writer():
+    storage = RecordingStorage()
+    storage.gate.set()
+    storage.fail = True
+    heard = []
+    async_storage = AsyncStorage(storage, listeners=[heard.append])
+
+    async def scenario():
+        return await asyncio.gather(
+            async_storage.write(1, b'a'),
+            async_storage.write(2, b'b'),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, OSError) for result in results)
+    assert heard == []
+
+
+def test_lock_serializes_same_id():
+    async_storage = AsyncStorage(RecordingStorage())
+    events = []
+
+    async def worker(name, activity_id):
+        async with async_storage.lock(activity_id):
+            events.append(f'{name} in')
+            await asyncio.sleep(0.01)
+            events.append(f'{name} out')
+
+    async def scenario():
+        await asyncio.gather(worker('a', 1), worker('b', 1), worker('c', 2))
+
+    asyncio.run(scenario())
+
+    assert events.index('a out') < events.index('b in')
+    assert events.index('c in') < events.index('a out')
+    assert async_storage._locks == {}
+
+
+@pytest.mark.parametrize('ids', [[3, 1, 2], [1, 1, 2]])
+def test_lock_many_releases_all(ids):
+    async_storage = AsyncStorage(RecordingStorage())
+
+    async def scenario():
+        async with async_storage.lock_many(ids):
+            assert sorted(async_storage._locks) == sorted(set(ids))
+
+    asyncio.run(scenario())
+    assert async_storage._locks == {}
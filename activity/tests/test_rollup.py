@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from activity.models import Activity
+from activity.rollup import ActivityRollup
+
+
+def encode(activity_id, date, name='run'):
+    return Activity(id=activity_id, name=name, date=date).model_dump_json().encode()
+
+
+@pytest.fixture(name='rollup')
+def rollup_fixture():
+    return ActivityRollup(parse=Activity.model_validate_json)
+
+
+def day(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def test_rollup_moves_counts_on_update_and_delete(rollup: ActivityRollup):
+    rollup.build([(1, encode(1, '2024-01-01T10:00:00')), (2, encode(2, '2024-01-01T11:00:00'))])
+    assert rollup.stats(granularity='day') == [(day('2024-01-01'), 'run', 2)]
+
+    rollup.apply([(2, encode(2, '2024-01-02T10:00:00', name='swim'))])
+    assert rollup.stats(granularity='day') == [(day('2024-01-01'), 'run', 1), (day('2024-01-02'), 'swim', 1)]
+    assert rollup.stats(granularity='hour', name='run') == [(day('2024-01-01T10:00:00'), 'run', 1)]
+
+    rollup.apply([(1, None), (3, None)])
+    assert rollup.stats(granularity='week') == [(day('2024-01-01'), 'swim', 1)]
+
+
+def test_rollup_skips_invalid_records(rollup: ActivityRollup, caplog):
+    rollup.build([(1, encode(1, '2024-01-01T10:00:00')), (2, b'{"id":2}'), (3, b'not json')])
+    assert rollup.stats(granularity='day') == [(day('2024-01-01'), 'run', 1)]
+    assert 'Activity 2 is not counted' in caplog.text
+
+    # A record replaced by an invalid one stops being counted.
+    rollup.apply([(1, b'{}')])
+    assert rollup.stats(granularity='day') == []
+
+
+def test_rollup_restores_snapshot(rollup: ActivityRollup, tmp_path):
+    path = str(tmp_path / 'rollup.json')
+    rollup.build([(1, encode(1, '2024-01-01T10:00:00')), (2, encode(2, '2024-01-02T10:00:00'))])
+    rollup.save(path)
+
+    restored = ActivityRollup(parse=Activity.model_validate_json)
+    assert restored.restore(path, [1, 2])
+    assert restored.stats(granularity='day') == rollup.stats(granularity='day')
+    assert not (tmp_path / 'rollup.json').exists()
+    assert not restored.restore(path, [1, 2])
+
+
+def test_rollup_ignores_stale_snapshot(rollup: ActivityRollup, tmp_path):
+    path = str(tmp_path / 'rollup.json')
+    rollup.build([(1, encode(1, '2024-01-01T10:00:00'))])
+    rollup.save(path)
+
+    restored = ActivityRollup(parse=Activity.model_validate_json)
+    assert not restored.restore(path, [1, 2])
+    assert restored.stats(granularity='day') == []
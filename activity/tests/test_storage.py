@@ -0,0 +1,250 @@
+import pytest
+from pydantic import ValidationError
+
+from activity.migrate import migrate
+from activity.settings import StorageSettings
+from activity.storage import (ActivityStorage, FolderStorage, LogStorage,
+                              SegmentStorage, SortedIds, SQLiteStorage,
+                              create_storage)
+
+
+def make_storage(backend, path):
+    settings = StorageSettings(
+        backend=backend,
+        folder=str(path),
+        sqlite_path=str(path / 'activity.sqlite3'),
+        segments_path=str(path / 'segments'),
+    )
+    return create_storage(settings)
+
+
+@pytest.fixture(name='backend', params=['folder', 'sqlite', 'segments'])
+def backend_fixture(request):
+    return request.param
+
+
+@pytest.fixture(name='storage')
+def storage_fixture(backend, tmp_path):
+    storage = make_storage(backend, tmp_path)
+    storage.load()
+    yield storage
+    storage.close()
+
+
+def test_storage_round_trip(storage: ActivityStorage):
+    storage.write(2, b'{"id":2}')
+    storage.apply([(1, b'{"id":1}'), (3, b'{"id":3}'), (3, b'{"id":3,"v":2}')])
+
+    assert 1 in storage and 4 not in storage
+    assert storage.read(3) == b'{"id":3,"v":2}'
+    assert storage.read(4) is None
+    assert storage.ids() == [1, 2, 3]
+    assert list(storage.scan(after=1)) == [(2, b'{"id":2}'), (3, b'{"id":3,"v":2}')]
+
+    assert storage.delete(2)
+    assert not storage.delete(2)
+    assert storage.ids() == [1, 3]
+
+
+def test_storage_survives_reload(backend, tmp_path):
+    storage = make_storage(backend, tmp_path)
+    storage.load()
+    storage.apply([(1, b'{"id":1}'), (2, b'{"id":2}'), (1, None)])
+    storage.close()
+
+    reloaded = make_storage(backend, tmp_path)
+    reloaded.load()
+    try:
+        assert reloaded.ids() == [2]
+        assert reloaded.read(2) == b'{"id":2}'
+    finally:
+        reloaded.close()
+
+
+@pytest.mark.parametrize('backend', ['folder', 'segments'])
+def test_storage_scan_follows_writes_without_listing_ids(storage: ActivityStorage, monkeypatch):
+    storage.apply([(i, f'{{"id":{i}}}'.encode()) for i in (1, 3, 5, 7)])
+    monkeypatch.setattr(storage, 'ids', None)
+
+    scan = storage.scan(after=1)
+    assert next(scan) == (3, b'{"id":3}')
+    storage.apply([(4, b'{"id":4}'), (2, b'{"id":2}'), (5, None)])
+    assert [activity_id for activity_id, _ in scan] == [4, 7]
+
+
+def test_sorted_ids():
+    ids = SortedIds([5, 1, 3])
+    ids.add(4)
+    ids.add(3)
+    ids.discard(1)
+    ids.discard(2)
+    assert list(ids) == [3, 4, 5]
+    assert list(ids.after(3)) == [4, 5]
+    assert list(ids.after(9)) == []
+
+
+def test_folder_storage_ignores_other_files(tmp_path):
+    (tmp_path / 'activity_1.json').write_bytes(b'{"id":1}')
+    (tmp_path / 'activity_11.json').write_bytes(b'{"id":11}')
+    (tmp_path / 'notes.txt').write_text('not an activity')
+    (tmp_path / '.activity_5.json.abc.tmp').write_bytes(b'{"id":')
+
+    storage = FolderStorage(str(tmp_path))
+    storage.load()
+
+    assert storage.ids() == [1, 11]
+    assert storage.read(1) == b'{"id":1}'
+    assert not (tmp_path / '.activity_5.json.abc.tmp').exists()
+
+
+def test_sqlite_storage_scans_in_batches(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / 'activity.sqlite3'))
+    storage.load()
+    storage.apply([(i, f'{{"id":{i}}}'.encode()) for i in range(1, 8)])
+
+    assert [i for i, _ in storage.scan(after=2, batch_size=2)] == [3, 4, 5, 6, 7]
+    storage.close()
+
+
+def test_incomplete_backend_fails_on_creation():
+    class ReadOnly(ActivityStorage):
+        def __contains__(self, activity_id):
+            return False
+
+        def read(self, activity_id):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnly()
+
+
+def test_segment_storage_truncates_torn_tail(tmp_path):
+    storage = SegmentStorage(str(tmp_path))
+    storage.load()
+    storage.apply([(1, b'{"id":1}'), (2, b'{"id":2}')])
+    storage.close()
+    [path] = tmp_path.glob('segment_*.log')
+    size = path.stat().st_size
+    with open(path, 'ab') as file:
+        file.write(b'3\t{"id":')
+
+    reloaded = SegmentStorage(str(tmp_path))
+    reloaded.load()
+    try:
+        assert reloaded.ids() == [1, 2]
+        assert path.stat().st_size == size
+        reloaded.write(3, b'{"id":3}')
+        assert reloaded.read(3) == b'{"id":3}'
+    finally:
+        reloaded.close()
+
+
+def test_segment_storage_skips_invalid_records(tmp_path):
+    (tmp_path / 'segment_00000000.log').write_bytes(b'1\t{"id":1}\nnot a record\nx\t{}\n2\t{"id":2}\n')
+
+    storage = SegmentStorage(str(tmp_path))
+    storage.load()
+    try:
+        assert storage.ids() == [1, 2]
+        assert storage.read(2) == b'{"id":2}'
+    finally:
+        storage.close()
+
+
+def test_segment_storage_rejects_newlines(tmp_path):
+    storage = SegmentStorage(str(tmp_path))
+    storage.load()
+    try:
+        with pytest.raises(ValueError):
+            storage.apply([(1, b'{"id":1}'), (2, b'{\n"id":2}\n')])
+        assert storage.ids() == []
+    finally:
+        storage.close()
+
+
+def test_segment_storage_compaction_survives_reload(tmp_path):
+    storage = SegmentStorage(str(tmp_path), segment_size=64)
+    storage.load()
+    for version in range(5):
+        storage.apply([(i, f'{{"id":{i},"v":{version}}}'.encode()) for i in range(1, 4)])
+    storage.delete(2)
+    assert storage.garbage_ratio() > 0.5
+    storage.compact()
+    assert storage.garbage_ratio() == 0
+    storage.close()
+
+    reloaded = SegmentStorage(str(tmp_path), segment_size=64)
+    reloaded.load()
+    try:
+        assert reloaded.ids() == [1, 3]
+        assert reloaded.read(3) == b'{"id":3,"v":4}'
+        assert len(list(tmp_path.glob('segment_*.compact'))) == 1
+    finally:
+        reloaded.close()
+
+
+def test_segment_storage_garbage_ratio_counts_whole_records(tmp_path):
+    storage = SegmentStorage(str(tmp_path), segment_size=32)
+    storage.load()
+    try:
+        for i in range(1, 9):
+            storage.write(i, f'{{"id":{i}}}'.encode())
+        assert storage.garbage_ratio() == 0
+        storage.write(1, b'{"id":1,"v":1}')
+        storage.delete(2)
+        assert storage.garbage_ratio() > 0
+        storage.compact()
+        [compacted] = storage._segments[:-1]
+        assert compacted.size > 0
+        assert storage.garbage_ratio() == 0
+    finally:
+        storage.close()
+
+
+def test_migrate_reencodes_folder_payloads(tmp_path):
+    source = FolderStorage(str(tmp_path))
+    (tmp_path / 'activity_1.json').write_text('{\n  "id": 1,\n  "name": "run",\n  "date": "2024-01-01T10:00:00"\n}\n')
+    (tmp_path / 'activity_2.json').write_text('{"id": 2, "name": "swim", "date": "2024-01-02T10:00:00"}\n')
+    (tmp_path / 'activity_3.json').write_text('not json')
+    source.load()
+    target = SegmentStorage(str(tmp_path / 'segments'))
+    target.load()
+
+    assert migrate(source, target, batch_size=1) == 2
+    target.close()
+
+    reloaded = SegmentStorage(str(tmp_path / 'segments'))
+    reloaded.load()
+    try:
+        assert reloaded.ids() == [1, 2]
+        assert reloaded.read(1) == b'{"id":1,"name":"run","date":"2024-01-01T10:00:00"}'
+    finally:
+        reloaded.close()
+
+
+def test_migrate_reads_log_files(tmp_path):
+    path = tmp_path / 'activity.log'
+    path.write_bytes(
+        b'1\t{"id":1,"name":"run","date":"2024-01-01T10:00:00"}\n'
+        b'2\t{"id":2,"name":"swim","date":"2024-01-02T10:00:00"}\n'
+        b'1\t\n'
+        b'3\t{"id":3,'
+    )
+    source = LogStorage(str(path))
+    source.load()
+    target = SegmentStorage(str(tmp_path / 'segments'))
+    target.load()
+    try:
+        assert migrate(source, target) == 1
+        assert target.ids() == [2]
+        with pytest.raises(PermissionError):
+            source.write(4, b'{}')
+        assert path.read_bytes().endswith(b'{"id":3,')
+    finally:
+        source.close()
+        target.close()
+
+
+def test_settings_reject_log_backend():
+    with pytest.raises(ValidationError, match='activity.migrate'):
+        StorageSettings(backend='log')
@@ -0,0 +1,217 @@
+"""
+Benchmark harness with warmup, percentiles and results kept per git commit::
+
+    python -m another.bench run intro.tutorial.time_checker
+    python -m another.bench compare 1a2b3c4 HEAD --threshold 0.1
+
+Functions decorated with ``benchmark`` are timed every time they are called: ``warmup``
+untimed rounds, then ``rounds`` timed ones, optionally with the garbage collector off.
+``run`` imports a module, calls its ``main()`` and merges the collected statistics into
+``.benchmarks/{commit}.json``. The calls are timed by ``another.timer.time_calls``, the
+loop behind ``another.timer.outer``. ``compare`` prints the change of every benchmark between
+two result files and exits with status 1 when one got slower by more than the threshold.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from functools import wraps
+from importlib import import_module
+
+from another.timer import time_calls
+
+RESULTS_DIR = '.benchmarks'
+
+# Statistics of the benchmarks run in this process, by name.
+results = {}
+
+
+def percentile(ordered, q):
+    """``q`` percentile (0-100) of sorted values, interpolated between the closest ranks."""
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        'rounds': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.fmean(ordered),
+        'stdev': statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        'p95': percentile(ordered, 95),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1],
+    }
+
+
+def measure(func, *args, rounds=10, warmup=1, disable_gc=False, **kwargs):
+    """Returns ``(timings, result)``, the seconds of each timed call and the last result."""
+    result = None
+    for _ in range(warmup):
+        result = func(*args, **kwargs)
+    gc_was_enabled = gc.isenabled()
+    if disable_gc:
+        gc.collect()
+        gc.disable()
+    try:
+        timings, result = time_calls(func, rounds, *args, **kwargs)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return timings, result
+
+
+def benchmark(rounds=10, warmup=1, disable_gc=False, name=None):
+    """
+       Decorator timing the function with ``measure`` on every call.
+
+       The statistics are printed and stored in ``results`` under ``name`` (the function
+       name by default), the wrapped call returns the result of the last round.
+       """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timings, result = measure(func, *args, rounds=rounds, warmup=warmup, disable_gc=disable_gc, **kwargs)
+            stats = results[name or func.__name__] = summarize(timings)
+            print(
+                f'{name or func.__name__}: min {stats["min"]:.6f}s, median {stats["median"]:.6f}s, '
+                f'p95 {stats["p95"]:.6f}s, p99 {stats["p99"]:.6f}s over {stats["rounds"]} rounds'
+            )
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def git(*args):
+    return subprocess.run(['git', *args], capture_output=True, text=True, check=True).stdout.strip()
+
+
+def git_commit():
+    """Short hash of HEAD, suffixed ``-dirty`` when tracked files changed, ``unknown`` outside git."""
+    try:
+        commit = git('rev-parse', '--short', 'HEAD')
+        dirty = git('status', '--porcelain', '--untracked-files=no')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+
+def results_path(commit, directory=RESULTS_DIR):
+    return os.path.join(directory, f'{commit}.json')
+
+
+def save(benchmarks, directory=RESULTS_DIR):
+    """Merges ``benchmarks`` into the result file of the current commit and returns its path."""
+    commit = git_commit()
+    path = results_path(commit, directory)
+    data = load(path) if os.path.exists(path) else {'commit': commit, 'benchmarks': {}}
+    data.update(
+        python=platform.python_version(),
+        machine=f'{platform.system()} {platform.machine()}',
+        cpus=os.cpu_count(),
+        updated=datetime.now(timezone.utc).isoformat(),
+    )
+    data['benchmarks'].update(benchmarks)
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    return path
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def resolve(reference, directory=RESULTS_DIR):
+    """
+       A result file path, or a commit (``HEAD`` and other revisions included) whose results to use.
+
+       ``HEAD`` first means the results saved from the working tree, ``-dirty`` when it has
+       changes. A revision without clean results falls back to its ``-dirty`` ones.
+       """
+    if os.path.exists(reference):
+        return reference
+    candidates = [reference]
+    try:
+        commit = git('rev-parse', '--short', reference)
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    else:
+        if reference == 'HEAD':
+            candidates.insert(0, git_commit())
+        candidates += [commit, f'{commit}-dirty']
+    paths = [results_path(candidate, directory) for candidate in candidates]
+    return next((path for path in paths if os.path.exists(path)), paths[0])
+
+
+def compare(base, head, *, metric='median', threshold=0.1):
+    """
+       ``(name, base, head, change, regression)`` rows for benchmarks present in both runs.
+
+       ``change`` is relative to ``base``, a regression is a change above ``threshold``.
+       """
+    rows = []
+    for name, stats in sorted(head['benchmarks'].items()):
+        previous = base['benchmarks'].get(name)
+        if previous is None:
+            continue
+        change = stats[metric] / previous[metric] - 1 if previous[metric] else 0.0
+        rows.append((name, previous[metric], stats[metric], change, change > threshold))
+    return rows
+
+
+def run_command(args):
+    import_module(args.module).main()
+    print(f'saved {len(results)} benchmarks to {save(results, args.directory)}')
+    return 0
+
+
+def compare_command(args):
+    base = load(resolve(args.base, args.directory))
+    head = load(resolve(args.head, args.directory))
+    rows = compare(base, head, metric=args.metric, threshold=args.threshold)
+    print(f'{args.metric}: {base["commit"]} -> {head["commit"]}')
+    for name, before, after, change, regression in rows:
+        flag = '  REGRESSION' if regression else ''
+        print(f'{name}: {before:.6f}s -> {after:.6f}s ({change:+.1%}){flag}')
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+def main(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--directory', default=RESULTS_DIR, help='where result files are kept')
+    parser = argparse.ArgumentParser(prog='python -m another.bench')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', parents=[common], help="run a module's main() and save its benchmark results")
+    run.add_argument('module')
+    run.set_defaults(handler=run_command)
+
+    compare_parser = commands.add_parser('compare', parents=[common], help='compare two commits or result files')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('head')
+    compare_parser.add_argument('--metric', default='median', choices=['min', 'median', 'mean', 'p95', 'p99'])
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown flagged')
+    compare_parser.set_defaults(handler=compare_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    # Go through the importable module, so the benchmarks of ``run`` and the command share ``results``.
+    from another import bench
+
+    sys.exit(bench.main())
@@ -0,0 +1,65 @@
+"""
+Counts the SQL statements and times the write endpoints of the catalogue::
+
+    python -m another.bench_queries
+
+The app runs against a fresh ``test.db`` in a temporary directory. Statements are counted
+with a ``before_cursor_execute`` listener, timings come from ``another.timer.outer``.
+
+Before writes relied on the unique constraints, ``RETURNING`` and ``INSERT ... SELECT``,
+a created category cost 3 statements, a created or updated product 5.
+"""
+import os
+import tempfile
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from another.timer import outer
+
+REQUESTS = 500
+
+
+def count_statements(engine):
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+@outer(1, flag=True)
+def create_categories(client):
+    for i in range(REQUESTS):
+        client.post('/categories/', json={'name': f'category {i}'})
+
+
+@outer(1, flag=True)
+def create_products(client):
+    for i in range(REQUESTS):
+        client.post('/products/', json={'name': f'product {i}', 'description': 'd', 'price': i, 'category_id': 1})
+
+
+@outer(1, flag=True)
+def update_products(client):
+    for i in range(REQUESTS):
+        client.put(f'/products/{i + 1}', json={
+            'name': f'product {i}',
+            'description': 'updated',
+            'price': i + 1,
+            'category_id': 2
+        })
+
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    from another.main import app, engine
+
+    statements = count_statements(engine)
+    client = TestClient(app)
+    for benchmark in (create_categories, create_products, update_products):
+        statements.clear()
+        benchmark(client)
+        print(f'{benchmark.__name__}: {len(statements) / REQUESTS:.1f} statements per request')
+
+
+if __name__ == '__main__':
+    main()
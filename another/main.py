@@ -1,13 +1,27 @@
-from typing import List
-
-from fastapi import Depends, FastAPI, HTTPException
-from pydantic import BaseModel
-from sqlalchemy import (Column, Float, ForeignKey, Integer, String,
-                        create_engine)
+import math
+import re
+from typing import List, Literal
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import (Column, Float, ForeignKey, Index, Integer, String,
+                        case, cast, column, create_engine, event, exists, func,
+                        literal, literal_column, select, table, text, tuple_,
+                        update)
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session, relationship, sessionmaker
+from sqlalchemy.orm import Session, joinedload, relationship, sessionmaker
+
+from common.metrics import instrument, metrics
+from common.metrics import router as metrics_router
+from common.ndjson import iter_batches, iter_ndjson_lines
+from common.pagination import (decode_cursor, encode_cursor, parse_order,
+                               set_next_page_headers)
 
 app = FastAPI()
+app.include_router(metrics_router)
 
 Base = declarative_base()
 
@@ -21,6 +35,14 @@ class Category(Base):
 
 class Product(Base):
     __tablename__ = 'products'
+    # Category listings filter on category_id and page through (price, id) or (name, id),
+    # the leading category_id also serves plain lookups by category. The search facets count
+    # the products of a price range across categories, which needs price first.
+    __table_args__ = (
+        Index('ix_products_category_id_price_id', 'category_id', 'price', 'id'),
+        Index('ix_products_category_id_name_id', 'category_id', 'name', 'id'),
+        Index('ix_products_price_category_id', 'price', 'category_id'),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     name = Column(String, index=True, unique=True)
     description = Column(String)
@@ -42,6 +64,10 @@ class ProductModel(BaseModel):
     category: CategoryModel
 
 
+# A leading '-' sorts in descending order.
+ProductOrder = Literal['id', 'name', '-name', 'price', '-price']
+
+
 class ProductCreateModel(BaseModel):
     name: str
     description: str
@@ -60,6 +86,127 @@ class CategoryCreateModel(BaseModel):
     name: str
 
 
+class ProductBulkItem(BaseModel):
+    line: int
+    name: str | None = None
+    id: int | None = None
+    status: Literal['created', 'updated', 'duplicate', 'invalid', 'unknown_category']
+    detail: str | list | None = None
+
+
+class ProductBulkReport(BaseModel):
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    items: List[ProductBulkItem] = []
+
+
+class CategoryFacet(BaseModel):
+    id: int
+    name: str
+    count: int
+
+
+class PriceFacet(BaseModel):
+    min: float
+    max: float
+    count: int
+
+
+class ProductSearchResult(BaseModel):
+    products: List[ProductModel]
+    categories: List[CategoryFacet]
+    prices: List[PriceFacet]
+
+
+# Width of the price facet buckets, bucket n holds prices in [n * width, (n + 1) * width).
+PRICE_BUCKET = 10
+
+products_fts = table('products_fts', column('rowid'), column('name'), column('description'))
+product_facets = table('product_facets', column('category_id'), column('price_bucket'), column('count'))
+
+# The FTS index and the facet counts follow the products table through triggers, so every
+# write path (ORM, bulk upsert, raw SQL) keeps them current. Products without a price or a
+# category have no facet, the WHEN clauses keep them out of the counts. CAST truncates
+# toward zero, the CASE rounds negative prices down so they get buckets of their own.
+FACET_TRUNCATED = f"CAST({{row}}.price / {PRICE_BUCKET} AS INTEGER)"
+FACET_BUCKET = (
+    f"CASE WHEN {{row}}.price / {PRICE_BUCKET} < {FACET_TRUNCATED} "
+    f"THEN {FACET_TRUNCATED} - 1 ELSE {FACET_TRUNCATED} END"
+)
+FACET_GUARD = "{row}.price IS NOT NULL AND {row}.category_id IS NOT NULL"
+FACET_COUNT = f"""INSERT INTO product_facets (category_id, price_bucket, count)
+        VALUES (new.category_id, {FACET_BUCKET.format(row='new')}, 1)
+        ON CONFLICT (category_id, price_bucket) DO UPDATE SET count = count + 1;"""
+FACET_DISCOUNT = f"""UPDATE product_facets SET count = count - 1
+        WHERE category_id = old.category_id AND price_bucket = {FACET_BUCKET.format(row='old')};"""
+SEARCH_TRIGGERS = {
+    'products_search_insert': """AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    'products_search_delete': """AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    'products_search_update': """AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    'products_facets_insert': f"""AFTER INSERT ON products WHEN {FACET_GUARD.format(row='new')} BEGIN
+        {FACET_COUNT}
+    END""",
+    'products_facets_delete': f"""AFTER DELETE ON products WHEN {FACET_GUARD.format(row='old')} BEGIN
+        {FACET_DISCOUNT}
+    END""",
+    # Split in two so each side of an update is only counted when it has a facet.
+    'products_facets_update_old': f"""AFTER UPDATE ON products WHEN {FACET_GUARD.format(row='old')} BEGIN
+        {FACET_DISCOUNT}
+    END""",
+    'products_facets_update_new': f"""AFTER UPDATE ON products WHEN {FACET_GUARD.format(row='new')} BEGIN
+        {FACET_COUNT}
+    END""",
+}
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts "
+    "USING fts5(name, description, content='products', content_rowid='id')",
+    "CREATE TABLE IF NOT EXISTS product_facets ("
+    "category_id INTEGER NOT NULL, price_bucket INTEGER NOT NULL, count INTEGER NOT NULL, "
+    "PRIMARY KEY (category_id, price_bucket))",
+    # Triggers are recreated on every start, so older databases pick up the current definitions.
+    *(
+        statement
+        for name, definition in SEARCH_TRIGGERS.items()
+        for statement in (f"DROP TRIGGER IF EXISTS {name}", f"CREATE TRIGGER {name} {definition}")
+    ),
+]
+SEARCH_BACKFILL = [
+    "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+    f"INSERT INTO product_facets (category_id, price_bucket, count) "
+    f"SELECT category_id, {FACET_BUCKET.format(row='products')}, count(*) FROM products "
+    f"WHERE category_id IS NOT NULL AND price IS NOT NULL GROUP BY 1, 2",
+]
+# Older databases counted negative prices into bucket 0, only buckets from 0 down change.
+SEARCH_REBUCKET = [
+    "DELETE FROM product_facets WHERE price_bucket <= 0",
+    f"INSERT INTO product_facets (category_id, price_bucket, count) "
+    f"SELECT category_id, {FACET_BUCKET.format(row='products')}, count(*) FROM products "
+    f"WHERE category_id IS NOT NULL AND price < {PRICE_BUCKET} GROUP BY 1, 2",
+]
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_search_tables(target, connection, **kw):
+    """Creates the search tables and triggers, products that predate them are indexed once."""
+    exists_already = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = 'product_facets'")
+    ).first()
+    for statement in SEARCH_DDL:
+        connection.execute(text(statement))
+    for statement in SEARCH_REBUCKET if exists_already else SEARCH_BACKFILL:
+        connection.execute(text(statement))
+
+
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -67,6 +214,25 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base.metadata.create_all(bind=engine)
 
 
+def create_indexes(bind):
+    """Adds the ``Product`` indexes to a database whose products table predates them."""
+    for index in Product.__table__.indexes:
+        index.create(bind, checkfirst=True)
+
+
+create_indexes(engine)
+
+
+@app.on_event('startup')
+def on_startup():
+    metrics.start()
+
+
+@app.on_event('shutdown')
+def on_shutdown():
+    metrics.stop()
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -76,6 +242,7 @@ def get_db():
 
 
 @app.get("/categories/{category_id}", response_model=CategoryModel)
+@instrument()
 def get_category(category_id: int, db: Session = Depends(get_db)):
     category = db.query(Category).filter(Category.id == category_id).first()
     if category is None:
@@ -83,73 +250,375 @@ def get_category(category_id: int, db: Session = Depends(get_db)):
     return category
 
 
+def products_page_query(db, *, category_id, order_by, cursor, limit, min_price=None, max_price=None):
+    """
+       Query of a page of a category, ordered by ``(order_by column, id)``.
+
+       The category is joined into the same SELECT, pages after the first continue from the
+       keyset of the cursor instead of an OFFSET.
+       """
+    field, descending = parse_order(order_by)
+    keys = (Product.id,) if field == 'id' else (getattr(Product, field), Product.id)
+    query = (
+        db.query(Product)
+        .options(joinedload(Product.category, innerjoin=True))
+        .filter(Product.category_id == category_id)
+    )
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+    if cursor is not None:
+        value, last_id = decode_cursor(cursor, order_by=order_by, value_type=keys[0].type.python_type)
+        position = last_id if field == 'id' else (value, last_id)
+        keyset = keys[0] if field == 'id' else tuple_(*keys)
+        query = query.filter(keyset < position if descending else keyset > position)
+    return query.order_by(*(key.desc() if descending else key for key in keys)).limit(limit)
+
+
 @app.get("/categories/{category_id}/products", response_model=List[ProductModel])
-def get_products_by_category(category_id: int, db: Session = Depends(get_db)):
-    products = db.query(Product).filter(Product.category_id == category_id).all()
+@instrument()
+def get_products_by_category(
+        category_id: int,
+        request: Request,
+        response: Response,
+        limit: int = Query(default=20, ge=1, le=100),
+        cursor: str | None = None,
+        order_by: ProductOrder = 'id',
+        min_price: float | None = None,
+        max_price: float | None = None,
+        db: Session = Depends(get_db)
+):
+    products = products_page_query(
+        db,
+        category_id=category_id,
+        order_by=order_by,
+        cursor=cursor,
+        limit=limit,
+        min_price=min_price,
+        max_price=max_price
+    ).all()
+    if len(products) == limit:
+        next_cursor = encode_cursor(order_by=order_by, obj=products[-1])
+        set_next_page_headers(request=request, response=response, next_cursor=next_cursor)
     return products
 
 
+def parse_product_rows(rows, seen):
+    """
+       Validates NDJSON rows into a ``name -> (line, product)`` mapping.
+
+       A name ``seen`` earlier in the import is reported as a duplicate, the first occurrence wins.
+       """
+    parsed = {}
+    items = []
+    for line, raw in rows:
+        try:
+            product = ProductCreateModel.model_validate_json(raw)
+        except ValidationError as e:
+            detail = [{'loc': list(err['loc']), 'msg': err['msg']} for err in e.errors()]
+            items.append(ProductBulkItem(line=line, status='invalid', detail=detail))
+            continue
+        if product.name in seen:
+            items.append(ProductBulkItem(line=line, name=product.name, status='duplicate'))
+            continue
+        seen.add(product.name)
+        parsed[product.name] = (line, product)
+    return parsed, items
+
+
+def upsert_products(db: Session, rows, seen):
+    """
+       Upserts a chunk of NDJSON product rows in one transaction.
+
+       Categories are checked with a single ``IN`` query and rows are written with one
+       ``INSERT ... ON CONFLICT (name) DO UPDATE ... RETURNING`` statement. Returns the
+       items of every row ordered by line.
+       """
+    parsed, items = parse_product_rows(rows, seen)
+    if parsed:
+        category_ids = {product.category_id for _, product in parsed.values()}
+        known = set(db.scalars(select(Category.id).where(Category.id.in_(category_ids))))
+        for name, (line, product) in list(parsed.items()):
+            if product.category_id not in known:
+                items.append(ProductBulkItem(line=line, name=name, status='unknown_category'))
+                del parsed[name]
+    if parsed:
+        existing = set(db.scalars(select(Product.name).where(Product.name.in_(parsed))))
+        statement = insert(Product).values([product.model_dump() for _, product in parsed.values()])
+        statement = statement.on_conflict_do_update(
+            index_elements=[Product.name],
+            set_={column: statement.excluded[column] for column in ('description', 'price', 'category_id')}
+        ).returning(Product.id, Product.name)
+        try:
+            ids = {name: product_id for product_id, name in db.execute(statement)}
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            items.extend(
+                ProductBulkItem(line=line, name=name, status='invalid', detail=str(e.orig))
+                for name, (line, _) in parsed.items()
+            )
+        else:
+            items.extend(
+                ProductBulkItem(
+                    line=line,
+                    name=name,
+                    id=ids[name],
+                    status='updated' if name in existing else 'created'
+                )
+                for name, (line, _) in parsed.items()
+            )
+    return sorted(items, key=lambda item: item.line)
+
+
+@app.post("/products/bulk", response_model=ProductBulkReport)
+@instrument()
+async def bulk_upsert_products(
+        request: Request,
+        chunk_size: int = Query(default=500, ge=1, le=5000),
+        db: Session = Depends(get_db)
+):
+    """
+       Creates or updates products from an NDJSON document, one ``ProductCreateModel`` per line.
+
+       Products are matched by name and every ``chunk_size`` rows are committed together.
+       """
+    report = ProductBulkReport()
+    seen = set()
+    async for rows in iter_batches(iter_ndjson_lines(request), chunk_size):
+        for item in await run_in_threadpool(upsert_products, db, rows, seen):
+            if item.status == 'created':
+                report.created += 1
+            elif item.status == 'updated':
+                report.updated += 1
+            else:
+                report.failed += 1
+            report.items.append(item)
+    return report
+
+
+def category_name(category_id):
+    return select(Category.name).where(Category.id == category_id).scalar_subquery()
+
+
 @app.post("/products/", response_model=ProductModel)
+@instrument()
 def create_product(product: ProductCreateModel, db: Session = Depends(get_db)):
-    existing_product = db.query(Product).filter(Product.name == product.name).first()
-    if existing_product:
+    """
+       Inserts the product with a single ``INSERT ... SELECT ... RETURNING``.
+
+       The SELECT reads the category row, so an unknown category inserts nothing, and the
+       unique name is enforced by the database instead of a lookup.
+       """
+    statement = (
+        insert(Product)
+        .from_select(
+            ['name', 'description', 'price', 'category_id'],
+            select(
+                literal(product.name),
+                literal(product.description),
+                literal(product.price),
+                Category.id
+            ).where(Category.id == product.category_id)
+        )
+        .returning(Product.id, category_name(product.category_id))
+    )
+    try:
+        row = db.execute(statement).first()
+        db.commit()
+    except IntegrityError:
+        db.rollback()
         raise HTTPException(status_code=400, detail="Product with this name already exists")
-
-    category = db.query(Category).filter(Category.id == product.category_id).first()
-    if category is None:
+    if row is None:
         raise HTTPException(status_code=404, detail="Category not found")
-
-    new_product = Product(
+    product_id, name = row
+    return ProductModel(
+        id=product_id,
         name=product.name,
         description=product.description,
         price=product.price,
-        category_id=product.category_id
-    )
-    db.add(new_product)
-    db.commit()
-    db.refresh(new_product)
-
-    return ProductModel(
-        id=new_product.id,
-        name=new_product.name,
-        description=new_product.description,
-        price=new_product.price,
-        category=CategoryModel(id=category.id, name=category.name)
+        category=CategoryModel(id=product.category_id, name=name)
     )
 
 
 @app.post('/categories/', response_model=CategoryModel)
+@instrument()
 def create_category(category: CategoryCreateModel, db: Session = Depends(get_db)):
-    existing_category = db.query(Category).filter(Category.name == category.name).first()
-    if existing_category:
+    statement = insert(Category).values(name=category.name).returning(Category.id, Category.name)
+    try:
+        new_category = db.execute(statement).one()
+        db.commit()
+    except IntegrityError:
+        db.rollback()
         raise HTTPException(status_code=400, detail="Category with this name already exists")
-    new_category = Category(
-        name=category.name
-    )
-    db.add(new_category)
-    db.commit()
-    db.refresh(new_category)
-    return new_category
+    return CategoryModel(id=new_category.id, name=new_category.name)
 
 
 @app.put("/products/{product_id}", response_model=ProductModel)
+@instrument()
 def update_product(product_id: int, product: ProductCreateModel, db: Session = Depends(get_db)):
-    existing_product = db.query(Product).filter(Product.id == product_id).first()
-    if existing_product is None:
+    """
+       Updates the product with a single ``UPDATE ... RETURNING`` guarded by the category.
+
+       When no row is updated, one more query tells a missing product from a missing category.
+       """
+    statement = (
+        update(Product)
+        .where(Product.id == product_id, exists().where(Category.id == product.category_id))
+        .values(
+            name=product.name,
+            description=product.description,
+            price=product.price,
+            category_id=product.category_id
+        )
+        .returning(Product.id, category_name(product.category_id))
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        row = db.execute(statement).first()
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Product with this name already exists")
+    if row is None:
+        if db.scalar(select(exists().where(Product.id == product_id))):
+            raise HTTPException(status_code=404, detail="Category not found")
         raise HTTPException(status_code=404, detail="Product not found")
-
-    category = db.query(Category).filter(Category.id == product.category_id).first()
-    if category is None:
-        raise HTTPException(status_code=404, detail="Category not found")
-
-    existing_product.name = product.name
-    existing_product.description = product.description
-    existing_product.price = product.price
-    existing_product.category_id = product.category_id
-
-    db.commit()
-    db.refresh(existing_product)
-
-    return existing_product
+    _, name = row
+    return ProductModel(
+        id=product_id,
+        name=product.name,
+        description=product.description,
+        price=product.price,
+        category=CategoryModel(id=product.category_id, name=name)
+    )
 
 
+def match_query(q):
+    """Turns free text into an FTS5 query: every word is quoted and prefix matched."""
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', q))
+
+
+def price_bucket(price):
+    """Facet bucket of ``price``, the SQL counterpart of ``FACET_BUCKET``."""
+    truncated = cast(price / PRICE_BUCKET, Integer)
+    return case((price / PRICE_BUCKET < truncated, truncated - 1), else_=truncated)
+
+
+def inner_buckets(min_price, max_price):
+    """
+       ``(low, high)`` bounds of the price buckets lying entirely inside the price range.
+
+       ``None`` leaves a side open. Bucket n is ``[n * width, (n + 1) * width)``.
+       """
+    low = None if min_price is None else math.ceil(min_price / PRICE_BUCKET)
+    high = None if max_price is None else math.floor(max_price / PRICE_BUCKET) - 1
+    return low, high
+
+
+def search_facets(db: Session, *, match, price_filters, min_price, max_price):
+    """
+       ``(category_id, price_bucket, count)`` rows describing the search results.
+
+       Without a text query the buckets lying inside the price range are read from the
+       trigger-maintained ``product_facets`` table, only the products of the two partial
+       buckets at the edges of the range are counted exactly, each through a price range
+       on ``ix_products_price_category_id``. With one, only the matching rows are grouped,
+       which the FTS index keeps small.
+       """
+    bucket = price_bucket(Product.price)
+    if match is not None:
+        statement = (
+            select(Product.category_id, bucket, func.count())
+            .join(products_fts, products_fts.c.rowid == Product.id)
+            .where(literal_column('products_fts').op('MATCH')(match), *price_filters)
+            .group_by(Product.category_id, bucket)
+        )
+        return db.execute(statement).all()
+
+    low, high = inner_buckets(min_price, max_price)
+    rows = []
+    if low is None or high is None or low <= high:
+        statement = select(
+            product_facets.c.category_id,
+            product_facets.c.price_bucket,
+            product_facets.c.count
+        ).where(product_facets.c.count > 0)
+        if low is not None:
+            statement = statement.where(product_facets.c.price_bucket >= low)
+        if high is not None:
+            statement = statement.where(product_facets.c.price_bucket <= high)
+        rows += db.execute(statement).all()
+    if low is not None and high is not None and low > high:
+        edges = [price_filters]
+    else:
+        edges = []
+        if min_price is not None and min_price < low * PRICE_BUCKET:
+            edges.append([Product.price >= min_price, Product.price < low * PRICE_BUCKET])
+        if max_price is not None:
+            edges.append([Product.price >= (high + 1) * PRICE_BUCKET, Product.price <= max_price])
+    for edge in edges:
+        statement = (
+            select(Product.category_id, bucket, func.count())
+            .where(Product.category_id.is_not(None), *edge)
+            .group_by(Product.category_id, bucket)
+        )
+        rows += db.execute(statement).all()
+    return rows
+
+
+@app.get("/products/search", response_model=ProductSearchResult)
+@instrument()
+def search_products(
+        q: str | None = None,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        offset: int = 0,
+        limit: int = Query(default=20, ge=1, le=100),
+        db: Session = Depends(get_db)
+):
+    """
+       Full-text search over product names and descriptions with category and price facets.
+
+       Every word of ``q`` is prefix matched and name hits rank first. Without ``q`` the
+       products are listed by id.
+       """
+    match = None if q is None else match_query(q)
+    if match == '':
+        return {'products': [], 'categories': [], 'prices': []}
+    price_filters = []
+    if min_price is not None:
+        price_filters.append(Product.price >= min_price)
+    if max_price is not None:
+        price_filters.append(Product.price <= max_price)
+
+    query = db.query(Product).options(joinedload(Product.category, innerjoin=True)).filter(*price_filters)
+    if match is None:
+        query = query.order_by(Product.id)
+    else:
+        query = (
+            query.join(products_fts, products_fts.c.rowid == Product.id)
+            .filter(literal_column('products_fts').op('MATCH')(match))
+            .order_by(func.bm25(literal_column('products_fts'), 5.0, 1.0), Product.id)
+        )
+    products = query.offset(offset).limit(limit).all()
+
+    rows = search_facets(db, match=match, price_filters=price_filters, min_price=min_price, max_price=max_price)
+    by_category, by_bucket = {}, {}
+    for category_id, bucket, count in rows:
+        by_category[category_id] = by_category.get(category_id, 0) + count
+        by_bucket[bucket] = by_bucket.get(bucket, 0) + count
+    names = dict(db.execute(select(Category.id, Category.name).where(Category.id.in_(by_category))).all())
+    return {
+        'products': products,
+        'categories': [
+            CategoryFacet(id=category_id, name=names[category_id], count=count)
+            for category_id, count in sorted(by_category.items(), key=lambda item: (-item[1], item[0]))
+            if category_id in names
+        ],
+        'prices': [
+            PriceFacet(min=bucket * PRICE_BUCKET, max=(bucket + 1) * PRICE_BUCKET, count=count)
+            for bucket, count in sorted(by_bucket.items())
+        ],
+    }
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from another import bench
+
+
+def write_results(directory, commit, **medians):
+    benchmarks = {name: {'median': value, 'min': value} for name, value in medians.items()}
+    path = directory / f'{commit}.json'
+    path.write_text(json.dumps({'commit': commit, 'benchmarks': benchmarks}))
+    return str(path)
+
+
+def test_measure_warms_up_and_restores_gc():
+    calls = []
+    timings, result = bench.measure(lambda: calls.append(1) or len(calls), rounds=3, warmup=2, disable_gc=True)
+    assert len(timings) == 3
+    assert result == 5
+    assert bench.gc.isenabled()
+
+
+def test_compare_flags_changes_above_threshold():
+    base = {'benchmarks': {'fast': {'median': 1.0}, 'slow': {'median': 1.0}, 'gone': {'median': 1.0}}}
+    head = {'benchmarks': {'fast': {'median': 0.5}, 'slow': {'median': 1.25}, 'new': {'median': 1.0}}}
+
+    rows = bench.compare(base, head, threshold=0.2)
+    assert [(name, regression) for name, *_, regression in rows] == [('fast', False), ('slow', True)]
+    assert rows[1][3] == pytest.approx(0.25)
+    assert not any(row[-1] for row in bench.compare(base, head, threshold=0.3))
+
+
+def test_compare_command_exit_status(tmp_path, capsys):
+    base = write_results(tmp_path, 'aaaaaaa', query=1.0)
+    head = write_results(tmp_path, 'bbbbbbb', query=1.05)
+
+    assert bench.main(['compare', base, head, '--threshold', '0.1']) == 0
+    assert bench.main(['compare', 'aaaaaaa', 'bbbbbbb', '--directory', str(tmp_path), '--threshold', '0.01']) == 1
+    assert 'REGRESSION' in capsys.readouterr().out
+
+
+def test_resolve_handles_dirty_results(tmp_path, monkeypatch):
+    revisions = {'HEAD': 'bbbbbbb', 'HEAD~1': 'aaaaaaa'}
+
+    def git(*args):
+        if args[0] == 'status':
+            return ' M another/bench.py'
+        return revisions.get(args[-1], args[-1])
+
+    monkeypatch.setattr(bench, 'git', git)
+    dirty = write_results(tmp_path, 'bbbbbbb-dirty', query=1.0)
+    assert bench.resolve('HEAD', str(tmp_path)) == dirty
+    clean = write_results(tmp_path, 'bbbbbbb', query=1.0)
+    assert bench.resolve('HEAD', str(tmp_path)) == dirty
+    assert bench.resolve('bbbbbbb', str(tmp_path)) == clean
+
+    only_dirty = write_results(tmp_path, 'aaaaaaa-dirty', query=1.0)
+    assert bench.resolve('HEAD~1', str(tmp_path)) == only_dirty
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+
+import pytest
+
+from common.metrics import (BUCKETS, SUB_BUCKETS, Histogram, Metrics,
+                            bucket_bounds, bucket_index)
+
+
+@pytest.mark.parametrize('value', [0, 1, 15, 31, 32, 33, 1000, 123456789, 2 ** 47 + 12345])
+def test_bucket_bounds_contain_their_values(value):
+    index = bucket_index(value)
+    low, high = bucket_bounds(index)
+    assert low <= value < high
+    assert high - low <= max(1, low / SUB_BUCKETS)
+
+
+def test_bucket_indexes_are_contiguous():
+    previous_high = 0
+    for index in range(BUCKETS):
+        low, high = bucket_bounds(index)
+        assert low == previous_high
+        assert bucket_index(low) == bucket_index(high - 1) == index
+        previous_high = high
+    assert bucket_index(2 ** 60) == BUCKETS - 1
+
+
+def test_percentiles_merge_threads():
+    metrics = Metrics()
+
+    def work(offset):
+        for value in range(offset, 10000, 4):
+            metrics.record('work', value * 1000)
+
+    threads = [threading.Thread(target=work, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary = metrics.flush()['work']
+    assert summary['count'] == 10000
+    assert summary['min'] == 0
+    assert summary['max'] == pytest.approx(9.999e-3)
+    for key, expected in [('p50', 5e-3), ('p90', 9e-3), ('p99', 9.9e-3)]:
+        assert summary[key] == pytest.approx(expected, rel=1 / SUB_BUCKETS)
+
+    histogram = Histogram()
+    histogram.record(5)
+    assert histogram.percentile(99) == 5
+
+
+def test_instrument_records_sync_and_async_calls():
+    metrics = Metrics()
+
+    @metrics.instrument()
+    def handler(value):
+        return value * 2
+
+    @metrics.instrument('async_handler')
+    async def async_handler(value):
+        await asyncio.sleep(0)
+        return value * 3
+
+    @metrics.instrument('failing')
+    def failing():
+        raise ValueError
+
+    assert handler(2) == 4
+    assert asyncio.run(async_handler(2)) == 6
+    assert asyncio.iscoroutinefunction(async_handler)
+    with pytest.raises(ValueError):
+        failing()
+    with metrics.timed('block'):
+        pass
+
+    snapshot = metrics.snapshot()
+    assert snapshot[f'{__name__}.test_instrument_records_sync_and_async_calls.<locals>.handler']['count'] == 1
+    assert snapshot['async_handler']['count'] == 1
+    assert snapshot['failing']['count'] == 1
+    assert snapshot['block']['count'] == 1
+
+
+def test_flusher_passes_snapshots_to_the_sink():
+    snapshots = []
+    metrics = Metrics(interval=60, sink=snapshots.append)
+    metrics.start()
+    metrics.record('request', 1000)
+    metrics.stop()
+    assert snapshots[-1]['request']['count'] == 1
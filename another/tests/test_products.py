@@ -0,0 +1,286 @@
+import json
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from another.main import (Base, Product, app, create_indexes, get_db,
+                          search_facets)
+
+
+@pytest.fixture(name='engine')
+def engine_fixture():
+    engine = create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(name='session')
+def session_fixture(engine):
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+@pytest.fixture(name='client')
+def client_fixture(session: Session):
+    def get_db_override():
+        yield session
+
+    app.dependency_overrides[get_db] = get_db_override
+    client = TestClient(app)
+    yield client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(name='count_queries')
+def count_queries_fixture(engine):
+    """Context manager collecting the SQL statements executed inside its block."""
+    @contextmanager
+    def count_queries():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return count_queries
+
+
+def create_category(client: TestClient, name='Books'):
+    return client.post('/categories/', json={'name': name}).json()['id']
+
+
+def create_product(client: TestClient, category_id, name, price=10.0, description='A product'):
+    payload = {'name': name, 'description': description, 'price': price, 'category_id': category_id}
+    return client.post('/products/', json=payload)
+
+
+def test_create_indexes_upgrades_existing_tables(engine):
+    with engine.begin() as connection:
+        connection.execute(text('DROP INDEX ix_products_category_id_price_id'))
+    create_indexes(engine)
+    create_indexes(engine)
+    names = {index['name'] for index in inspect(engine).get_indexes('products')}
+    assert {
+        'ix_products_category_id_price_id',
+        'ix_products_category_id_name_id',
+        'ix_products_price_category_id',
+    } <= names
+
+
+def test_products_by_category_pages_with_cursor(client: TestClient):
+    category_id = create_category(client)
+    other_id = create_category(client, 'Games')
+    for name, price in [('a', 30), ('b', 10), ('c', 20), ('d', 10), ('e', 40)]:
+        create_product(client, category_id, name, price=price)
+    create_product(client, other_id, 'f', price=15)
+
+    names = []
+    params = {'limit': 2, 'order_by': '-price'}
+    while True:
+        response = client.get(f'/categories/{category_id}/products', params=params)
+        names += [product['name'] for product in response.json()]
+        if 'x-next-cursor' not in response.headers:
+            break
+        assert 'cursor=' in response.headers['link']
+        params['cursor'] = response.headers['x-next-cursor']
+    assert names == ['e', 'a', 'c', 'd', 'b']
+
+
+def test_products_by_category_rejects_tampered_cursor(client: TestClient):
+    category_id = create_category(client)
+    for name in 'abc':
+        create_product(client, category_id, name)
+    cursor = client.get(f'/categories/{category_id}/products', params={'limit': 1}).headers['x-next-cursor']
+
+    response = client.get(f'/categories/{category_id}/products', params={'cursor': cursor[:-2] + '!!'})
+    assert response.status_code == 400
+    response = client.get(f'/categories/{category_id}/products', params={'cursor': cursor, 'order_by': 'name'})
+    assert response.status_code == 400
+
+
+def test_bulk_upsert_reports_statuses(client: TestClient):
+    category_id = create_category(client)
+    existing = create_product(client, category_id, 'a', price=1).json()['id']
+    rows = [
+        {'name': 'a', 'description': 'Updated', 'price': 2, 'category_id': category_id},
+        {'name': 'b', 'description': 'New', 'price': 3, 'category_id': category_id},
+        {'name': 'a', 'description': 'Again', 'price': 4, 'category_id': category_id},
+        {'name': 'c', 'description': 'Lost', 'price': 5, 'category_id': 999},
+        {'name': 'd'},
+    ]
+    body = '\n'.join(json.dumps(row) for row in rows)
+
+    report = client.post('/products/bulk', params={'chunk_size': 2}, files={'file': ('p.ndjson', body)}).json()
+    assert (report['created'], report['updated'], report['failed']) == (1, 1, 3)
+    assert [(item['line'], item['status']) for item in report['items']] == [
+        (1, 'updated'), (2, 'created'), (3, 'duplicate'), (4, 'unknown_category'), (5, 'invalid')
+    ]
+    assert report['items'][0]['id'] == existing
+
+    products = client.get(f'/categories/{category_id}/products').json()
+    assert [(product['name'], product['price']) for product in products] == [('a', 2), ('b', 3)]
+
+
+def test_create_product_with_unknown_category(client: TestClient):
+    create_category(client)
+    response = create_product(client, 999, 'a')
+    assert response.status_code == 404
+    assert response.json()['detail'] == 'Category not found'
+
+
+def test_create_product_with_duplicate_name(client: TestClient):
+    category_id = create_category(client)
+    assert create_product(client, category_id, 'a').status_code == 200
+    response = create_product(client, category_id, 'a')
+    assert response.status_code == 400
+
+
+def test_writes_take_one_statement(client: TestClient, count_queries):
+    with count_queries() as statements:
+        category_id = create_category(client)
+    assert len(statements) == 1
+
+    with count_queries() as statements:
+        response = create_product(client, category_id, 'a', price=5)
+    assert len(statements) == 1
+    product = response.json()
+    assert product['category'] == {'id': category_id, 'name': 'Books'}
+
+    payload = {'name': 'b', 'description': 'Renamed', 'price': 6, 'category_id': category_id}
+    with count_queries() as statements:
+        response = client.put(f'/products/{product["id"]}', json=payload)
+    assert len(statements) == 1
+    assert response.json()['name'] == 'b'
+
+    with count_queries() as statements:
+        response = client.put('/products/999', json=payload)
+    assert response.status_code == 404
+    assert len(statements) == 2
+
+
+def search(client: TestClient, **params):
+    return client.get('/products/search', params=params).json()
+
+
+def test_search_follows_inserts_updates_and_deletes(client: TestClient, session: Session):
+    books = create_category(client)
+    games = create_category(client, 'Games')
+    first = create_product(client, books, 'Red planet', price=12, description='A novel about Mars').json()
+    create_product(client, games, 'Planet builder', price=35, description='Strategy game')
+
+    result = search(client, q='planet')
+    assert {product['name'] for product in result['products']} == {'Red planet', 'Planet builder'}
+    assert [(facet['name'], facet['count']) for facet in result['categories']] == [('Books', 1), ('Games', 1)]
+    assert search(client, q='mars')['products'][0]['id'] == first['id']
+
+    payload = {'name': 'Blue moon', 'description': 'A novel', 'price': 48, 'category_id': games}
+    client.put(f'/products/{first["id"]}', json=payload)
+    assert search(client, q='mars')['products'] == []
+    result = search(client, q='moon')
+    assert [product['name'] for product in result['products']] == ['Blue moon']
+    assert search(client)['prices'] == [{'min': 30, 'max': 40, 'count': 1}, {'min': 40, 'max': 50, 'count': 1}]
+    assert search(client)['categories'] == [{'id': games, 'name': 'Games', 'count': 2}]
+
+    session.delete(session.get(Product, first['id']))
+    session.commit()
+    assert search(client, q='moon')['products'] == []
+    assert search(client)['categories'] == [{'id': games, 'name': 'Games', 'count': 1}]
+
+
+def test_search_facets_skip_products_without_price_or_category(client: TestClient, session: Session):
+    books = create_category(client)
+    session.add_all([
+        Product(name='No price', description='', category_id=books),
+        Product(name='No category', description='', price=5),
+    ])
+    session.commit()
+    create_product(client, books, 'Priced', price=5)
+
+    def facets():
+        return sorted(search_facets(session, match=None, price_filters=[], min_price=None, max_price=None))
+
+    assert facets() == [(books, 0, 1)]
+    product = session.query(Product).filter_by(name='No price').one()
+    product.price = 25
+    session.commit()
+    assert facets() == [(books, 0, 1), (books, 2, 1)]
+    product.category_id = None
+    session.commit()
+    assert facets() == [(books, 0, 1)]
+    session.delete(product)
+    session.commit()
+    assert facets() == [(books, 0, 1)]
+
+
+def test_search_facets_count_partial_buckets_exactly(client: TestClient):
+    books = create_category(client)
+    for index, price in enumerate([5, 12, 18, 21, 25, 29, 33, 38, 47]):
+        create_product(client, books, f'Book {index}', price=price)
+
+    def prices(**params):
+        return [(facet['min'], facet['count']) for facet in search(client, **params)['prices']]
+
+    assert prices(min_price=15, max_price=35) == [(10, 1), (20, 3), (30, 1)]
+    assert prices(min_price=20, max_price=30) == [(20, 3)]
+    assert prices(min_price=22, max_price=28) == [(20, 1)]
+    assert prices(max_price=12) == [(0, 1), (10, 1)]
+    assert prices(min_price=30) == [(30, 2), (40, 1)]
+    result = search(client, min_price=15, max_price=35)
+    assert result['categories'] == [{'id': books, 'name': 'Books', 'count': 5}]
+    assert len(result['products']) == 5
+
+
+def test_search_facets_round_negative_prices_down(client: TestClient):
+    books = create_category(client)
+    for index, price in enumerate([-15, -10, -5, 0, 5, 15]):
+        create_product(client, books, f'Book {index}', price=price)
+
+    def prices(**params):
+        return [(facet['min'], facet['count']) for facet in search(client, **params)['prices']]
+
+    assert prices() == [(-20, 1), (-10, 2), (0, 2), (10, 1)]
+    assert prices(min_price=-12, max_price=3) == [(-10, 2), (0, 1)]
+    assert prices(min_price=-7, max_price=-3) == [(-10, 1)]
+    assert prices(max_price=-10) == [(-20, 1), (-10, 1)]
+
+
+def test_search_facets_edges_are_price_ranges(client: TestClient, engine, count_queries):
+    books = create_category(client)
+    for index, price in enumerate([5, 12, 25, 38]):
+        create_product(client, books, f'Book {index}', price=price)
+
+    with count_queries() as statements:
+        search(client, min_price=15, max_price=35)
+    edges = [statement for statement in statements if 'GROUP BY' in statement]
+    assert len(edges) == 2
+    with engine.connect() as connection:
+        for statement in edges:
+            parameters = (0,) * statement.count('?')
+            plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+            plan = ' '.join(row[-1] for row in plan)
+            assert 'USING COVERING INDEX ix_products_price_category_id (price>? AND price<?)' in plan
+
+
+def test_create_search_tables_rebuckets_negative_prices(engine, session: Session):
+    session.add_all([Product(name='Low', price=-5, category_id=1), Product(name='High', price=15, category_id=1)])
+    session.commit()
+    with engine.begin() as connection:
+        connection.execute(text('UPDATE product_facets SET count = 2 WHERE price_bucket = 0'))
+        connection.execute(text('DELETE FROM product_facets WHERE price_bucket < 0'))
+    Base.metadata.create_all(engine)
+    facets = sorted(search_facets(session, match=None, price_filters=[], min_price=None, max_price=None))
+    assert facets == [(1, -1, 1), (1, 1, 1)]
@@ -2,16 +2,23 @@ import time
 from functools import wraps
 
 
+def time_calls(func, n, *args, **kwargs):
+    """Calls ``func`` ``n`` times, returns the seconds of every call and the last result."""
+    timings = []
+    result = None
+    for _ in range(n):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
 def outer(n, flag=False):
     def timer(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            total = 0
-            for _ in range(n):
-                start = time.perf_counter()
-                result = func(*args, **kwargs)
-                end = time.perf_counter()
-                total += end - start
+            timings, result = time_calls(func, n, *args, **kwargs)
+            total = sum(timings)
             avg_time = total / n
             if flag:
                 print(f"Avg Time: {avg_time}, total: {total}")
@@ -0,0 +1,8 @@
+from functools import lru_cache
+
+from pydantic import TypeAdapter
+
+
+@lru_cache
+def get_type_adapter(model):
+    return TypeAdapter(model)
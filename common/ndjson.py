@@ -0,0 +1,54 @@
+from fastapi import Request
+
+READ_SIZE = 64 * 1024
+
+
+async def iter_request_chunks(request: Request):
+    """
+       Yields the raw bytes of an import request without buffering the whole body.
+
+       A ``multipart/form-data`` request is expected to carry the NDJSON document in
+       its ``file`` field, any other request is read as a streamed NDJSON body.
+       """
+    content_type = request.headers.get('content-type', '')
+    if content_type.startswith('multipart/form-data'):
+        form = await request.form()
+        upload = form.get('file')
+        if upload is None or isinstance(upload, str):
+            return
+        while chunk := await upload.read(READ_SIZE):
+            yield chunk
+    else:
+        async for chunk in request.stream():
+            yield chunk
+
+
+async def iter_ndjson_lines(request: Request):
+    """
+       Splits an incoming NDJSON document into ``(line_number, line)`` pairs.
+
+       Line numbers start at 1 and count blank lines, which are skipped, so they can be
+       used to point at the offending row of the uploaded document.
+       """
+    buffer = b''
+    line_number = 0
+    async for chunk in iter_request_chunks(request):
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+
+async def iter_batches(rows, size):
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,57 @@
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from .adapters import get_type_adapter
+
+
+def parse_order(order_by):
+    """Splits an ``order_by`` value into the column name and whether the order is descending."""
+    return order_by.removeprefix('-'), order_by.startswith('-')
+
+
+def encode_cursor(*, order_by, obj):
+    """
+       Builds an opaque cursor pointing right after ``obj`` in ``order_by`` order.
+
+       The cursor keeps the sort value together with the id, which breaks ties between
+       rows sharing the same value.
+       """
+    field, _ = parse_order(order_by)
+    payload = {'o': order_by, 'v': jsonable_encoder(getattr(obj, field)), 'id': obj.id}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, *, order_by, value_type=None):
+    """
+       Decodes a cursor produced by ``encode_cursor`` into ``(value, id)``.
+
+       ``value_type`` converts the JSON sort value back to the column type, e.g. a ``date``.
+
+       Raises:
+       - HTTPException: 400 if the cursor is malformed or was issued for another ordering.
+       """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload['o'] != order_by:
+            raise ValueError
+        value = payload['v']
+        if value_type is not None:
+            value = get_type_adapter(value_type).validate_python(value)
+        return value, int(payload['id'])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
+def set_next_page_headers(*, request: Request, response: Response, next_cursor):
+    """Advertises the next page as a ``Link: <...>; rel="next"`` and an ``X-Next-Cursor`` header."""
+    if next_cursor is None:
+        return
+    url = request.url.remove_query_params('offset').include_query_params(cursor=next_cursor)
+    response.headers['Link'] = f'<{url}>; rel="next"'
+    response.headers['X-Next-Cursor'] = next_cursor
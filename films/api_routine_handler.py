@@ -1,18 +1,214 @@
-from fastapi import HTTPException
+from fastapi import HTTPException, Response
+from pydantic import ValidationError
+from sqlalchemy import tuple_, update
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
 
-from .films_db_models import Actor, Genre, Producer
+from common.pagination import decode_cursor, encode_cursor, parse_order
+
+from .cache import serialize_response
+from .conditional import (is_not_modified, not_modified_response, object_etag,
+                          page_etag, validator_headers)
+from .films_db_models import (Actor, Film, FilmActorAssociation, FilmBulkError,
+                              FilmBulkRow, FilmGenreAssociation,
+                              FilmProducerAssociation, Genre, Producer, utcnow)
+from .search import (match_query, reindex_statements, search_enabled,
+                     search_statement)
 
 
 class ApiRoutineHandler:
+    relationships = {
+        Producer: 'producers',
+        Actor: 'actors',
+        Genre: 'genres',
+    }
+    links = {
+        Producer: (FilmProducerAssociation, 'producer_id'),
+        Actor: (FilmActorAssociation, 'actor_id'),
+        Genre: (FilmGenreAssociation, 'genre_id'),
+    }
+
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    def invalidate(self):
+        if self.cache is not None:
+            self.cache.invalidate()
+
+    def cached_response(self, *, request, response, model, build, validators=None):
+        """
+           Serves a GET request from the response cache or builds and caches it.
+
+           ``validators`` returns the ``(etag, last_modified)`` of the resource, or ``None`` if
+           it does not exist; a matching conditional request is answered with 304 before the
+           objects are loaded. ``build`` returns the objects to serialize as ``model``, headers
+           it sets on ``response`` (next page links) are cached along with the body.
+           """
+        headers = {}
+        if validators is not None and (current := validators()) is not None:
+            etag, last_modified = current
+            headers = validator_headers(etag=etag, last_modified=last_modified)
+            if is_not_modified(request, etag=etag, last_modified=last_modified):
+                return not_modified_response(headers)
+            response.headers.update(headers)
+        if self.cache is None:
+            return build()
+        key = self.cache.key(request)
+        cached = self.cache.get(key)
+        if cached is not None:
+            cached.headers.update(headers)
+            return cached
+        body, cached_headers = serialize_response(model=model, result=build(), response=response)
+        self.cache.set(key, body=body, headers=cached_headers)
+        return Response(content=body, media_type='application/json', headers={**cached_headers, **headers})
+
+    @staticmethod
+    def object_validators_statement(*, cls, obj_id):
+        return select(cls.id, cls.version, cls.updated_at).where(cls.id == obj_id)
+
+    @staticmethod
+    def object_validators(*, cls, row):
+        if row is None:
+            return None
+        return object_etag(cls, row.id, row.version), row.updated_at
+
+    def get_object_validators(self, *, cls, obj_id, session):
+        row = session.exec(self.object_validators_statement(cls=cls, obj_id=obj_id)).first()
+        return self.object_validators(cls=cls, row=row)
+
+    def page_validators_statement(self, *, cls, offset, limit, order_by='id', cursor=None, where=()):
+        return self.objects_statement(
+            cls=cls,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor,
+            where=where,
+            columns=(cls.id, cls.version)
+        )
+
+    @staticmethod
+    def page_validators(*, cls, rows):
+        """
+           ETag of a list page, without ``Last-Modified``.
+
+           The newest ``updated_at`` on a page does not move when a row leaves it or an older
+           row enters it, so only the ETag over the ``(id, version)`` of the rows is reliable.
+           """
+        if not rows:
+            return None
+        return page_etag(cls, [(row.id, row.version) for row in rows]), None
+
+    def get_page_validators(self, *, cls, session, offset, limit, order_by='id', cursor=None, where=()):
+        statement = self.page_validators_statement(
+            cls=cls,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor,
+            where=where
+        )
+        return self.page_validators(cls=cls, rows=session.exec(statement).all())
+
     @staticmethod
-    def creation_routine_handler(lst, cls, session, db_film):
+    def touch(obj):
+        obj.version += 1
+        obj.updated_at = utcnow()
+
+    def touch_related_statements(self, *, cls, ids):
+        """
+           UPDATE statements bumping the version of the rows linked to the ``cls`` rows ``ids``.
+
+           Films embed their producers, actors and genres and those embed their films, so a
+           change on either side changes the representation of the rows on the other side.
+           """
+        ids = list(ids)
+        targets = self.links.items() if cls is Film else [(Film, self.links[cls])]
+        for target, (link, column) in targets:
+            if cls is Film:
+                linked = select(getattr(link, column)).where(link.film_id.in_(ids))
+            else:
+                linked = select(link.film_id).where(getattr(link, column).in_(ids))
+            yield (
+                update(target)
+                .where(target.id.in_(linked))
+                .values(version=target.version + 1, updated_at=utcnow())
+                .execution_options(synchronize_session=False)
+            )
+
+    def touch_related(self, *, cls, ids, session):
+        for statement in self.touch_related_statements(cls=cls, ids=ids):
+            session.exec(statement)
+
+    def related_film_ids(self, *, cls, ids):
+        """Ids of the films of the ``cls`` rows ``ids``, as a subquery."""
+        link, column = self.links[cls]
+        return select(link.film_id).where(getattr(link, column).in_(ids))
+
+    @staticmethod
+    def reindex_films(*, ids, session):
+        """Brings the search rows of the films ``ids`` in line with the flushed session state."""
+        if not search_enabled(session):
+            return
+        for statement in reindex_statements(ids):
+            session.exec(statement)
+
+    @staticmethod
+    def search_handler(*, q, session, offset, limit):
+        if not search_enabled(session):
+            raise HTTPException(status_code=501, detail='Search is only available on SQLite')
+        if not match_query(q):
+            return []
+        return session.exec(search_statement(q=q, offset=offset, limit=limit)).all()
+
+    @staticmethod
+    def resolve_entities(*, names, cls, session, ids=None):
+        """
+           Set-based resolver mapping entity names to database entities.
+
+           All existing entities of the given class are fetched in a single
+           ``IN (...)`` query; names that are still unknown are created and added
+           to the session, so they are inserted together on the next flush.
+
+           Parameters:
+           - names (Iterable[str]): Entity names, duplicates are allowed.
+           - cls: The class type of the entity (e.g., Producer or Actor).
+           - session (Session): The SQLModel session object for interacting with the database.
+           - ids (dict | None): Optional name -> id mapping of entities resolved earlier, e.g.
+             by previous chunks of an import. Those are loaded by primary key, also with a
+             single ``IN (...)`` query, instead of being looked up by name.
+
+           Returns:
+           - dict: A mapping of every requested name to its entity.
+           """
+        names, ids = list(dict.fromkeys(names)), ids or {}
+        known = [ids[name] for name in names if name in ids]
+        missing = [name for name in names if name not in ids]
+        resolved = {}
+        with session.no_autoflush:
+            if known:
+                for db_entity in session.exec(select(cls).where(cls.id.in_(known))).all():
+                    resolved[db_entity.name] = db_entity
+            if missing:
+                existing = session.exec(
+                    select(cls).where(cls.name.in_(missing)).order_by(cls.id)
+                ).all()
+                for db_entity in existing:
+                    resolved.setdefault(db_entity.name, db_entity)
+        for name in names:
+            if name not in resolved:
+                db_entity = cls(name=name)
+                session.add(db_entity)
+                resolved[name] = db_entity
+        return resolved
+
+    def creation_routine_handler(self, lst, cls, session, db_film):
         """
            Routine handler for creating related entities and associating them with a film.
 
-           This function iterates over a list of entity objects (e.g., producers or actors),
-           checks if each entity already exists in the database, and associates it with the
-           provided film. If the entity does not exist, it is created and associated with the film.
+           This function resolves all entity names of the list (e.g., producers or actors)
+           with a single query, creates the entities that do not exist yet and associates
+           every entity with the provided film. Nothing is written until the next flush.
 
            Parameters:
            - lst (list): A list of entity objects to be created or associated with the film.
@@ -31,18 +227,106 @@ class ApiRoutineHandler:
                db_film=db_film
            )
            """
-        for entity in lst:
-            db_entity = session.exec(select(cls).where(cls.name == entity.name)).first()
-            if db_entity:
-                db_entity.films.append(db_film)
-            else:
-                db_entity = cls.model_validate(entity)
-                if isinstance(db_entity, Producer):
-                    db_film.producers.append(db_entity)
-                elif isinstance(db_entity, Actor):
-                    db_film.actors.append(db_entity)
-                elif isinstance(db_entity, Genre):
-                    db_film.genres.append(db_entity)
+        names = list(dict.fromkeys(entity.name for entity in lst))
+        resolved = self.resolve_entities(names=names, cls=cls, session=session)
+        getattr(db_film, self.relationships[cls]).extend(resolved[name] for name in names)
+
+    def bulk_creation_handler(self, *, rows, session, cache):
+        """
+           Creates a chunk of films from NDJSON rows in a single transaction.
+
+           Every row is validated on its own, rows with invalid payloads or with a film name
+           that already exists (in the database or earlier in the chunk) are reported and
+           skipped. Producers, actors and genres are resolved with one query per class and
+           chunk; ``cache``, shared by all chunks of an import, remembers their ids so names
+           seen in an earlier chunk are loaded by primary key. Ids rather than instances are
+           kept, the commit of every chunk expires the instances.
+
+           Parameters:
+           - rows (list): ``(line_number, raw_line)`` pairs of the chunk.
+           - session (Session): The SQLModel session object for interacting with the database.
+           - cache (dict): Entity class -> name -> id mapping kept across chunks.
+
+           Returns:
+           - tuple: The number of created films and a list of FilmBulkError.
+           """
+        parsed, errors = self.parse_bulk_rows(rows)
+
+        if parsed:
+            existing = session.exec(select(Film.name).where(Film.name.in_(parsed))).all()
+            errors.extend(self.name_taken_errors(parsed.pop(name)[0] for name in existing))
+
+        resolved = {}
+        for cls, attr in self.relationships.items():
+            names = [entity.name for _, row in parsed.values() for entity in getattr(row, attr)]
+            resolved[cls] = self.resolve_entities(names=names, cls=cls, session=session, ids=cache[cls])
+        db_films = self.add_bulk_films(parsed=parsed, session=session, resolved=resolved)
+
+        entity_ids = {}
+        try:
+            if db_films:
+                session.flush()
+                film_ids = [db_film.id for db_film in db_films]
+                entity_ids = self.entity_ids(resolved)
+                self.touch_related(cls=Film, ids=film_ids, session=session)
+                self.reindex_films(ids=film_ids, session=session)
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            errors.extend(self.name_taken_errors(line for line, _ in parsed.values()))
+            return 0, sorted(errors, key=lambda error: error.line)
+        for cls, ids in entity_ids.items():
+            cache[cls].update(ids)
+        if parsed:
+            self.invalidate()
+        return len(parsed), sorted(errors, key=lambda error: error.line)
+
+    @staticmethod
+    def entity_ids(resolved):
+        """Class -> name -> id of flushed entities, read before the commit expires them."""
+        return {
+            cls: {name: db_entity.id for name, db_entity in entities.items()}
+            for cls, entities in resolved.items()
+        }
+
+    @staticmethod
+    def parse_bulk_rows(rows):
+        """
+           Validates raw NDJSON rows into FilmBulkRow objects keyed by film name.
+
+           Returns:
+           - tuple: A ``name -> (line, row)`` mapping of the valid rows and the list of
+             FilmBulkError for rows that are invalid or repeat a film name of the chunk.
+           """
+        errors = []
+        parsed = {}
+        for line, raw in rows:
+            try:
+                row = FilmBulkRow.model_validate_json(raw)
+            except ValidationError as e:
+                detail = [{'loc': list(err['loc']), 'msg': err['msg']} for err in e.errors()]
+                errors.append(FilmBulkError(line=line, detail=detail))
+                continue
+            if row.film.name in parsed:
+                errors.extend(ApiRoutineHandler.name_taken_errors([line]))
+                continue
+            parsed[row.film.name] = (line, row)
+        return parsed, errors
+
+    @staticmethod
+    def name_taken_errors(lines):
+        return [FilmBulkError(line=line, detail='Film name must be unique') for line in lines]
+
+    def add_bulk_films(self, *, parsed, session, resolved):
+        db_films = []
+        for _, row in parsed.values():
+            db_film = Film.model_validate(row.film)
+            for cls, attr in self.relationships.items():
+                names = dict.fromkeys(entity.name for entity in getattr(row, attr))
+                getattr(db_film, attr).extend(resolved[cls][name] for name in names)
+            session.add(db_film)
+            db_films.append(db_film)
+        return db_films
 
     @staticmethod
     def if_not(*, obj, cls):
@@ -50,34 +334,106 @@ class ApiRoutineHandler:
             detail = f"{cls.__name__} not Found"
             raise HTTPException(status_code=404, detail=detail)
 
-    def get_object_handler(self, *, cls, obj_id, session):
-        db_obj = session.get(cls, obj_id)
+    def get_object_handler(self, *, cls, obj_id, session, options=()):
+        db_obj = session.get(cls, obj_id, options=options)
         self.if_not(obj=db_obj, cls=cls)
         return db_obj
 
-    def get_objects_handler(self, *, cls, session, offset, limit):
-        db_objects = session.exec(select(cls).offset(offset).limit(limit)).all()
-        self.if_not(obj=db_objects, cls=cls)
+    def get_objects_handler(self, *, cls, session, offset, limit, options=(), order_by='id', cursor=None, where=()):
+        statement = self.objects_statement(
+            cls=cls,
+            offset=offset,
+            limit=limit,
+            options=options,
+            order_by=order_by,
+            cursor=cursor,
+            where=where
+        )
+        db_objects = session.exec(statement).all()
+        if cursor is None:
+            self.if_not(obj=db_objects, cls=cls)
         return db_objects
 
+    @staticmethod
+    def objects_statement(*, cls, offset, limit, options=(), order_by='id', cursor=None, where=(), columns=()):
+        """
+           SELECT of a page of ``cls`` rows matching the ``where`` clauses.
+
+           ``order_by`` names a column, prefixed with '-' for a descending order. Rows are
+           ordered by ``(column, id)`` in that direction, which is also the keyset the cursor
+           continues from.
+           """
+        statement = select(*columns) if columns else select(cls).options(*options)
+        statement = statement.where(*where)
+        field, descending = parse_order(order_by)
+        keys = (cls.id,) if field == 'id' else (getattr(cls, field), cls.id)
+        statement = statement.order_by(*(key.desc() if descending else key for key in keys))
+        if cursor is None:
+            statement = statement.offset(offset)
+        else:
+            value, last_id = decode_cursor(cursor, order_by=order_by, value_type=cls.model_fields[field].annotation)
+            position = last_id if field == 'id' else (value, last_id)
+            keyset = keys[0] if field == 'id' else tuple_(*keys)
+            statement = statement.where(keyset < position if descending else keyset > position)
+        return statement.limit(limit)
+
+    @staticmethod
+    def next_page_cursor(*, db_objects, limit, order_by):
+        if len(db_objects) == limit:
+            return encode_cursor(order_by=order_by, obj=db_objects[-1])
+        return None
+
+    def get_page_handler(self, *, cls, session, offset, limit, order_by='id', cursor=None, options=(), where=()):
+        """
+           Returns a page of objects together with the cursor of the next page.
+
+           Pages are read with keyset conditions on ``(order_by, id)`` when a cursor is given
+           and with ``offset`` otherwise. The next cursor is ``None`` once a page comes back
+           shorter than ``limit``. Offset pages keep answering 404 when empty, while the page
+           after the last cursor is simply an empty list.
+           """
+        db_objects = self.get_objects_handler(
+            cls=cls,
+            session=session,
+            offset=offset,
+            limit=limit,
+            options=options,
+            order_by=order_by,
+            cursor=cursor,
+            where=where
+        )
+        return db_objects, self.next_page_cursor(db_objects=db_objects, limit=limit, order_by=order_by)
+
     def update_object_handler(self, *, obj, cls, session, obj_id):
         db_obj = session.get(cls, obj_id)
         self.if_not(obj=db_obj, cls=cls)
         obj_data = obj.model_dump(exclude_unset=True)
         for key, value in obj_data.items():
             setattr(db_obj, key, value)
+        self.touch(db_obj)
+        self.touch_related(cls=cls, ids=[db_obj.id], session=session)
+        session.flush()
+        self.reindex_films(ids=self.related_film_ids(cls=cls, ids=[db_obj.id]), session=session)
         return self.session_routine_handler(obj=db_obj, session=session)
 
-    @staticmethod
-    def session_routine_handler(obj, session):
+    def session_routine_handler(self, obj, session):
         session.add(obj)
         session.commit()
+        self.invalidate()
         session.refresh(obj)
         return obj
 
     def deletion_handler(self, *, cls, obj_id, session,):
         db_obj = session.get(cls, obj_id)
         self.if_not(obj=db_obj, cls=cls)
+        self.touch_related(cls=cls, ids=[db_obj.id], session=session)
+        if cls is Film:
+            film_ids = [db_obj.id]
+        else:
+            film_ids = session.exec(self.related_film_ids(cls=cls, ids=[db_obj.id])).all()
         session.delete(db_obj)
+        session.flush()
+        self.reindex_films(ids=film_ids, session=session)
         session.commit()
+        self.invalidate()
         return {'ok': 'Successful deletion'}
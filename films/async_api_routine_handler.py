@@ -0,0 +1,213 @@
+from fastapi import HTTPException, Response
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from .api_routine_handler import ApiRoutineHandler
+from .cache import serialize_response
+from .conditional import (is_not_modified, not_modified_response,
+                          validator_headers)
+from .films_db_models import Film
+from .loader_options import FULL_OPTIONS
+from .search import (match_query, reindex_statements, search_enabled,
+                     search_statement)
+
+
+class AsyncApiRoutineHandler(ApiRoutineHandler):
+    """
+       ``ApiRoutineHandler`` for ``AsyncSession``.
+
+       Statements, validation and error handling are shared with the sync handler, only the
+       database round trips are awaited. Lazy loading is not available with an async session,
+       so relationships that are modified or serialized are always loaded explicitly.
+       """
+
+    async def cached_response(self, *, request, response, model, build, validators=None):
+        headers = {}
+        if validators is not None and (current := await validators()) is not None:
+            etag, last_modified = current
+            headers = validator_headers(etag=etag, last_modified=last_modified)
+            if is_not_modified(request, etag=etag, last_modified=last_modified):
+                return not_modified_response(headers)
+            response.headers.update(headers)
+        if self.cache is None:
+            return await build()
+        key = self.cache.key(request)
+        cached = self.cache.get(key)
+        if cached is not None:
+            cached.headers.update(headers)
+            return cached
+        body, cached_headers = serialize_response(model=model, result=await build(), response=response)
+        self.cache.set(key, body=body, headers=cached_headers)
+        return Response(content=body, media_type='application/json', headers={**cached_headers, **headers})
+
+    async def get_object_validators(self, *, cls, obj_id, session):
+        row = (await session.exec(self.object_validators_statement(cls=cls, obj_id=obj_id))).first()
+        return self.object_validators(cls=cls, row=row)
+
+    async def get_page_validators(self, *, cls, session, offset, limit, order_by='id', cursor=None, where=()):
+        statement = self.page_validators_statement(
+            cls=cls,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor,
+            where=where
+        )
+        return self.page_validators(cls=cls, rows=(await session.exec(statement)).all())
+
+    async def touch_related(self, *, cls, ids, session):
+        for statement in self.touch_related_statements(cls=cls, ids=ids):
+            await session.exec(statement)
+
+    @staticmethod
+    async def reindex_films(*, ids, session):
+        if not search_enabled(session):
+            return
+        for statement in reindex_statements(ids):
+            await session.exec(statement)
+
+    @staticmethod
+    async def search_handler(*, q, session, offset, limit):
+        if not search_enabled(session):
+            raise HTTPException(status_code=501, detail='Search is only available on SQLite')
+        if not match_query(q):
+            return []
+        return (await session.exec(search_statement(q=q, offset=offset, limit=limit))).all()
+
+    @staticmethod
+    async def resolve_entities(*, names, cls, session, ids=None):
+        names, ids = list(dict.fromkeys(names)), ids or {}
+        known = [ids[name] for name in names if name in ids]
+        missing = [name for name in names if name not in ids]
+        resolved = {}
+        with session.no_autoflush:
+            if known:
+                for db_entity in (await session.exec(select(cls).where(cls.id.in_(known)))).all():
+                    resolved[db_entity.name] = db_entity
+            if missing:
+                existing = (await session.exec(
+                    select(cls).where(cls.name.in_(missing)).order_by(cls.id)
+                )).all()
+                for db_entity in existing:
+                    resolved.setdefault(db_entity.name, db_entity)
+        for name in names:
+            if name not in resolved:
+                db_entity = cls(name=name)
+                session.add(db_entity)
+                resolved[name] = db_entity
+        return resolved
+
+    async def creation_routine_handler(self, lst, cls, session, db_film):
+        names = list(dict.fromkeys(entity.name for entity in lst))
+        resolved = await self.resolve_entities(names=names, cls=cls, session=session)
+        getattr(db_film, self.relationships[cls]).extend(resolved[name] for name in names)
+
+    async def bulk_creation_handler(self, *, rows, session, cache):
+        parsed, errors = self.parse_bulk_rows(rows)
+
+        if parsed:
+            existing = (await session.exec(select(Film.name).where(Film.name.in_(parsed)))).all()
+            errors.extend(self.name_taken_errors(parsed.pop(name)[0] for name in existing))
+
+        resolved = {}
+        for cls, attr in self.relationships.items():
+            names = [entity.name for _, row in parsed.values() for entity in getattr(row, attr)]
+            resolved[cls] = await self.resolve_entities(names=names, cls=cls, session=session, ids=cache[cls])
+        db_films = self.add_bulk_films(parsed=parsed, session=session, resolved=resolved)
+
+        entity_ids = {}
+        try:
+            if db_films:
+                await session.flush()
+                film_ids = [db_film.id for db_film in db_films]
+                entity_ids = self.entity_ids(resolved)
+                await self.touch_related(cls=Film, ids=film_ids, session=session)
+                await self.reindex_films(ids=film_ids, session=session)
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            errors.extend(self.name_taken_errors(line for line, _ in parsed.values()))
+            return 0, sorted(errors, key=lambda error: error.line)
+        for cls, ids in entity_ids.items():
+            cache[cls].update(ids)
+        if parsed:
+            self.invalidate()
+        return len(parsed), sorted(errors, key=lambda error: error.line)
+
+    async def get_object_handler(self, *, cls, obj_id, session, options=()):
+        db_obj = await session.get(cls, obj_id, options=options)
+        self.if_not(obj=db_obj, cls=cls)
+        return db_obj
+
+    async def get_objects_handler(
+            self, *, cls, session, offset, limit, options=(), order_by='id', cursor=None, where=()
+    ):
+        statement = self.objects_statement(
+            cls=cls,
+            offset=offset,
+            limit=limit,
+            options=options,
+            order_by=order_by,
+            cursor=cursor,
+            where=where
+        )
+        db_objects = (await session.exec(statement)).all()
+        if cursor is None:
+            self.if_not(obj=db_objects, cls=cls)
+        return db_objects
+
+    async def get_page_handler(self, *, cls, session, offset, limit, order_by='id', cursor=None, options=(), where=()):
+        db_objects = await self.get_objects_handler(
+            cls=cls,
+            session=session,
+            offset=offset,
+            limit=limit,
+            options=options,
+            order_by=order_by,
+            cursor=cursor,
+            where=where
+        )
+        return db_objects, self.next_page_cursor(db_objects=db_objects, limit=limit, order_by=order_by)
+
+    async def update_object_handler(self, *, obj, cls, session, obj_id):
+        db_obj = await self.get_object_handler(cls=cls, obj_id=obj_id, session=session)
+        obj_data = obj.model_dump(exclude_unset=True)
+        for key, value in obj_data.items():
+            setattr(db_obj, key, value)
+        self.touch(db_obj)
+        await self.touch_related(cls=cls, ids=[db_obj.id], session=session)
+        await session.flush()
+        await self.reindex_films(ids=self.related_film_ids(cls=cls, ids=[db_obj.id]), session=session)
+        return await self.session_routine_handler(obj=db_obj, session=session, relationships=('films',))
+
+    async def session_routine_handler(self, obj, session, relationships=()):
+        """
+           Commits ``obj`` and reloads it, ``relationships`` names the collections the
+           response serializes and that have to be reloaded as well.
+           """
+        session.add(obj)
+        await session.commit()
+        self.invalidate()
+        await session.refresh(obj)
+        if relationships:
+            await session.refresh(obj, attribute_names=list(relationships))
+        return obj
+
+    async def deletion_handler(self, *, cls, obj_id, session,):
+        db_obj = await self.get_object_handler(
+            cls=cls,
+            obj_id=obj_id,
+            session=session,
+            options=FULL_OPTIONS[cls]
+        )
+        await self.touch_related(cls=cls, ids=[db_obj.id], session=session)
+        if cls is Film:
+            film_ids = [db_obj.id]
+        else:
+            film_ids = (await session.exec(self.related_film_ids(cls=cls, ids=[db_obj.id]))).all()
+        await session.delete(db_obj)
+        await session.flush()
+        await self.reindex_films(ids=film_ids, session=session)
+        await session.commit()
+        self.invalidate()
+        return {'ok': 'Successful deletion'}
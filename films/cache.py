@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from sqlmodel import SQLModel
+
+from common.adapters import get_type_adapter
+
+from .settings import CacheSettings
+
+# Response headers that are part of a cached entry, e.g. the next page of a list.
+CACHED_HEADERS = ('link', 'x-next-cursor')
+
+
+class CacheStats(SQLModel):
+    hits: int
+    misses: int
+    invalidations: int
+    size: int | None = None
+
+
+class LRUCacheBackend:
+    """
+       In-process LRU cache with a per-entry TTL.
+
+       It implements the subset of the Redis client API used by ``ResponseCache``
+       (``get``, ``set`` with ``ex``, ``incr``, ``delete``), so a Redis client
+       or any local fake exposing the same methods can be used instead.
+       """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            item = self._data.get(name)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[name]
+                return None
+            self._data.move_to_end(name)
+            return value
+
+    def set(self, name, value, ex=None):
+        ttl = ex if ex is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[name] = (expires_at, value)
+            self._data.move_to_end(name)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return True
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            expires_at, value = self._data.get(name, (None, b'0'))
+            value = int(value) + amount
+            self._data[name] = (expires_at, str(value).encode())
+            self._data.move_to_end(name)
+            return value
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+    def dbsize(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """
+       Read-through cache of serialized GET responses.
+
+       Entries are keyed by route path and query parameters under a generation number.
+       Any write bumps the generation, which invalidates every entry at once with a single
+       ``INCR`` no matter which responses embed the changed rows; stale entries then age out
+       through the backend TTL/LRU.
+       """
+
+    def __init__(self, backend, *, ttl=None, prefix='films'):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: CacheSettings):
+        if not settings.enabled:
+            return None
+        if settings.url.startswith('memory://'):
+            backend = LRUCacheBackend(maxsize=settings.maxsize, ttl=settings.ttl)
+        else:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError(f'The redis package is required to use {settings.url} as cache')
+            backend = redis.Redis.from_url(settings.url)
+        return cls(backend, ttl=settings.ttl)
+
+    @property
+    def generation_key(self):
+        return f'{self.prefix}:generation'
+
+    def key(self, request: Request):
+        generation = int(self.backend.get(self.generation_key) or 0)
+        query = '&'.join(f'{k}={v}' for k, v in sorted(request.query_params.multi_items()))
+        return f'{self.prefix}:{generation}:{request.url.path}?{query}'
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            return None
+        headers, _, body = value.partition(b'\n')
+        return Response(content=body, media_type='application/json', headers=json.loads(headers))
+
+    def set(self, key, *, body, headers):
+        self.backend.set(key, json.dumps(headers).encode() + b'\n' + body, ex=self.ttl)
+
+    def invalidate(self):
+        self.backend.incr(self.generation_key)
+        with self._lock:
+            self.invalidations += 1
+
+    def clear(self):
+        """
+           Drops every cached response and resets the counters.
+
+           Only the generation is bumped: the backend may be a Redis database shared with
+           other applications, so nothing outside ``prefix`` is touched.
+           """
+        self.backend.incr(self.generation_key)
+        with self._lock:
+            self.hits = self.misses = self.invalidations = 0
+
+    def stats(self):
+        size = self.backend.dbsize() if hasattr(self.backend, 'dbsize') else None
+        return CacheStats(hits=self.hits, misses=self.misses, invalidations=self.invalidations, size=size)
+
+
+def serialize_response(*, model, result, response: Response):
+    """Serializes ``result`` as ``model`` and returns the JSON body with the headers to cache."""
+    adapter = get_type_adapter(model)
+    body = adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+    headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+    return body, headers
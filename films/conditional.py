@@ -0,0 +1,55 @@
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response, status
+
+
+def object_etag(cls, obj_id, version):
+    return f'"{cls.__tablename__}-{obj_id}-{version}"'
+
+
+def page_etag(cls, rows):
+    """Strong ETag of a list page, derived from the ``(id, version)`` of its rows."""
+    digest = hashlib.sha1(f'{cls.__tablename__}:{rows}'.encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(header, etag):
+    if header.strip() == '*':
+        return True
+    candidates = (tag.strip() for tag in header.split(','))
+    return etag in (tag.removeprefix('W/') for tag in candidates)
+
+
+def is_not_modified(request: Request, *, etag, last_modified):
+    """
+       Evaluates ``If-None-Match`` and, when it is absent, ``If-Modified-Since``.
+
+       ``last_modified`` is a naive UTC datetime, HTTP dates only carry whole seconds.
+       """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def validator_headers(*, etag, last_modified):
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        utc = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+        headers['Last-Modified'] = format_datetime(utc, usegmt=True)
+    return headers
+
+
+def not_modified_response(headers):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
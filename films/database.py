@@ -1,10 +1,187 @@
+import logging
+from datetime import date, datetime
+from functools import lru_cache
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import SQLModel, create_engine
 
-sqlite_file_name = "films.db"
-sqlite_url = f"sqlite:///{sqlite_file_name}"
+from .settings import DatabaseSettings
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+# Free-form release dates stored before release_date became a date, besides ISO ones.
+RELEASE_DATE_FORMATS = ('%d.%m.%Y', '%d/%m/%Y', '%Y/%m/%d', '%B %d, %Y', '%d %B %Y', '%b %d, %Y', '%d %b %Y')
+
+logger = logging.getLogger(__name__)
+
+
+def is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(url, settings: DatabaseSettings):
+    options = {'echo': settings.echo, 'pool_pre_ping': settings.pool_pre_ping}
+    if not is_memory_sqlite(url):
+        options.update(
+            pool_size=settings.pool_size,
+            max_overflow=settings.max_overflow,
+            pool_timeout=settings.pool_timeout,
+            pool_recycle=settings.pool_recycle,
+        )
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {'check_same_thread': False}
+    return options
+
+
+def set_sqlite_pragmas(engine: Engine, settings: DatabaseSettings):
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA journal_mode={settings.sqlite_journal_mode}')
+        cursor.execute(f'PRAGMA synchronous={settings.sqlite_synchronous}')
+        cursor.execute(f'PRAGMA mmap_size={int(settings.sqlite_mmap_size)}')
+        cursor.execute(f'PRAGMA cache_size={int(settings.sqlite_cache_size)}')
+        cursor.execute(f'PRAGMA busy_timeout={int(settings.sqlite_busy_timeout)}')
+        cursor.close()
+
+
+def create_db_engine(settings: DatabaseSettings) -> Engine:
+    """
+       Engine factory driven by ``DatabaseSettings``.
+
+       SQLite connections are shared between threadpool workers, so ``check_same_thread``
+       is disabled and the configured pragmas are applied to each new connection.
+       """
+    url = make_url(settings.url)
+    engine = create_engine(url, **engine_options(url, settings))
+    if url.get_backend_name() == 'sqlite':
+        set_sqlite_pragmas(engine, settings)
+    return engine
+
+
+def create_async_db_engine(settings: DatabaseSettings) -> AsyncEngine:
+    """
+       Async counterpart of ``create_db_engine`` for the same database.
+
+       The sync driver of ``settings.url`` is swapped for its async one (aiosqlite for
+       SQLite), pool options and pragmas are applied the same way.
+       """
+    url = make_url(settings.url)
+    if url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    options = engine_options(url, settings)
+    if 'pool_size' in options:
+        options['poolclass'] = AsyncAdaptedQueuePool
+    engine = create_async_engine(url, **options)
+    if url.get_backend_name() == 'sqlite':
+        set_sqlite_pragmas(engine.sync_engine, settings)
+    return engine
 
-engine = create_engine(sqlite_url, echo=True)
+
+@lru_cache
+def get_engine() -> Engine:
+    return create_db_engine(DatabaseSettings())
+
+
+@lru_cache
+def get_async_engine() -> AsyncEngine:
+    return create_async_db_engine(DatabaseSettings())
+
+
+# Columns added to tables after their first release, create_all does not alter existing tables.
+# SQLite only adds columns with constant defaults, rows predating updated_at get the upgrade time.
+ADDED_COLUMNS = {
+    table: [
+        ('version', 'INTEGER NOT NULL DEFAULT 1', None),
+        ('updated_at', 'DATETIME', f'UPDATE {table} SET updated_at = CURRENT_TIMESTAMP'),
+    ]
+    for table in ('film', 'producer', 'actor', 'genre')
+}
+
+
+def parse_release_date(value):
+    value = value.strip()
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        pass
+    for date_format in RELEASE_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_release_dates(connection):
+    """
+       Rewrites SQLite release dates that are not ``YYYY-MM-DD`` text.
+
+       ``release_date`` used to be a free-form string, dates compare and sort as ISO text
+       only. The column is now a required ``date`` and a row that does not load as one
+       breaks every listing containing it, so the upgrade is aborted with ``ValueError``
+       when any value matches no known format. Nothing is rewritten in that case, the
+       films it names have to be fixed by hand first.
+       """
+    if connection.dialect.name != 'sqlite':
+        return
+    rows = connection.execute(text(
+        "SELECT id, release_date FROM film "
+        "WHERE release_date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+    )).all()
+    updates, invalid = [], []
+    for film_id, value in rows:
+        parsed = parse_release_date(value) if isinstance(value, str) else None
+        if parsed is None:
+            invalid.append((film_id, value))
+        else:
+            updates.append({'release_date': parsed.isoformat(), 'id': film_id})
+    if invalid:
+        for film_id, value in invalid:
+            logger.error('Film %s has an unparseable release_date %r', film_id, value)
+        raise ValueError(
+            f'{len(invalid)} films have unparseable release dates, e.g. film {invalid[0][0]}: {invalid[0][1]!r}'
+        )
+    if updates:
+        connection.execute(text('UPDATE film SET release_date = :release_date WHERE id = :id'), updates)
+
+
+def upgrade_schema(connection):
+    """
+       Brings tables created by earlier versions up to the models.
+
+       Missing columns of ``ADDED_COLUMNS`` are added and filled, free-form release dates
+       are rewritten as ISO dates and missing indexes of every table are created, e.g. the
+       film listing indexes of existing databases. Each step checks the current schema
+       first, so it runs at every startup.
+       """
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    for table, columns in ADDED_COLUMNS.items():
+        if table not in tables:
+            continue
+        present = {column['name'] for column in inspector.get_columns(table)}
+        for name, definition, fill in columns:
+            if name not in present:
+                connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {definition}'))
+                if fill is not None:
+                    connection.execute(text(fill))
+    if 'film' in tables:
+        normalize_release_dates(connection)
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
 
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    with get_engine().begin() as connection:
+        SQLModel.metadata.create_all(connection)
+        upgrade_schema(connection)
+
+
+async def create_db_and_tables_async():
+    async with get_async_engine().begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+        await connection.run_sync(upgrade_schema)
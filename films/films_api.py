@@ -1,24 +1,35 @@
 import uvicorn
-from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session
 
+from common.ndjson import iter_batches, iter_ndjson_lines
+from common.pagination import set_next_page_headers
+
 from .api_routine_handler import ApiRoutineHandler
-from .database import create_db_and_tables, engine
+from .cache import CacheStats, ResponseCache
+from .database import create_db_and_tables, get_engine
 from .films_db_models import (Actor, ActorCreate, ActorPublic,
                               ActorPublicWithFilms, ActorUpdate, Film,
-                              FilmCreate, FilmPublic, FilmPublicFull,
-                              FilmUpdate, Genre, GenreCreate, GenrePublic,
-                              GenrePublicWithFilms, GenreUpdate, Producer,
-                              ProducerCreate, ProducerPublic,
+                              FilmBulkReport, FilmCreate, FilmPublic,
+                              FilmPublicFull, FilmUpdate, Genre, GenreCreate,
+                              GenrePublic, GenrePublicWithFilms, GenreUpdate,
+                              Producer, ProducerCreate, ProducerPublic,
                               ProducerPublicWithFilms, ProducerUpdate)
+from .filters import FilmFilter
+from .loader_options import (ACTOR_WITH_FILMS_OPTIONS, FILM_FULL_OPTIONS,
+                             GENRE_WITH_FILMS_OPTIONS,
+                             PRODUCER_WITH_FILMS_OPTIONS)
+from .pagination import EntityOrder, FilmOrder
+from .settings import CacheSettings
 
 app = FastAPI()
-handler = ApiRoutineHandler()
+handler = ApiRoutineHandler(cache=ResponseCache.from_settings(CacheSettings()))
 
 
 def get_session():
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
         yield session
 
 
@@ -59,24 +70,127 @@ def create_film(
             session=session,
             db_film=db_film
         )
+        session.add(db_film)
+        session.flush()
+        handler.touch_related(cls=Film, ids=[db_film.id], session=session)
+        handler.reindex_films(ids=[db_film.id], session=session)
         return handler.session_routine_handler(obj=db_film, session=session)
     except IntegrityError:
         raise HTTPException(status_code=400, detail="Film name must be unique")
 
 
+@app.post('/films/bulk', response_model=FilmBulkReport)
+async def bulk_create_films(
+        request: Request,
+        session: Session = Depends(get_session),
+        chunk_size: int = Query(default=500, ge=1, le=5000)
+):
+    """
+       Imports films from an NDJSON document, one ``POST /films/`` payload per line.
+
+       The document is read as a streamed request body or from the ``file`` field of a
+       multipart upload, and every ``chunk_size`` rows are written in their own transaction.
+       """
+    report = FilmBulkReport()
+    cache = {cls: {} for cls in handler.relationships}
+    async for rows in iter_batches(iter_ndjson_lines(request), chunk_size):
+        created, errors = await run_in_threadpool(
+            handler.bulk_creation_handler,
+            rows=rows,
+            session=session,
+            cache=cache
+        )
+        report.created += created
+        report.failed += len(errors)
+        report.errors.extend(errors)
+    return report
+
+
+@app.get('/films/search', response_model=list[FilmPublic])
+def search_films(
+        *,
+        request: Request,
+        response: Response,
+        session: Session = Depends(get_session),
+        q: str = Query(min_length=1),
+        offset: int = 0,
+        limit: int = Query(default=10, le=10)
+):
+    """
+       Full-text search over film names, descriptions and the names of their producers,
+       actors and genres. Every word of ``q`` is prefix matched, best matches come first.
+       """
+    return handler.cached_response(
+        request=request,
+        response=response,
+        model=list[FilmPublic],
+        build=lambda: handler.search_handler(q=q, session=session, offset=offset, limit=limit)
+    )
+
+
 @app.get('/films/{film_id}', response_model=FilmPublicFull)
-def get_film(film_id, session: Session = Depends(get_session)):
-    return handler.get_object_handler(cls=Film, obj_id=film_id, session=session)
+def get_film(
+        film_id,
+        request: Request,
+        response: Response,
+        session: Session = Depends(get_session)
+):
+    return handler.cached_response(
+        request=request,
+        response=response,
+        model=FilmPublicFull,
+        validators=lambda: handler.get_object_validators(cls=Film, obj_id=film_id, session=session),
+        build=lambda: handler.get_object_handler(
+            cls=Film,
+            obj_id=film_id,
+            session=session,
+            options=FILM_FULL_OPTIONS
+        )
+    )
 
 
 @app.get('/films/', response_model=list[FilmPublic])
 def get_films(
         *,
+        request: Request,
+        response: Response,
         session: Session = Depends(get_session),
         offset: int = 0,
-        limit: int = Query(default=10, le=10)
+        limit: int = Query(default=10, le=10),
+        cursor: str | None = None,
+        order_by: FilmOrder = 'id',
+        filters: FilmFilter = Depends()
 ):
-    return handler.get_objects_handler(cls=Film, session=session, offset=offset, limit=limit)
+    where = filters.clauses()
+
+    def build():
+        db_films, next_cursor = handler.get_page_handler(
+            cls=Film,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor,
+            where=where
+        )
+        set_next_page_headers(request=request, response=response, next_cursor=next_cursor)
+        return db_films
+
+    return handler.cached_response(
+        request=request,
+        response=response,
+        model=list[FilmPublic],
+        build=build,
+        validators=lambda: handler.get_page_validators(
+            cls=Film,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor,
+            where=where
+        )
+    )
 
 
 @app.patch('/films/{film_id}/', response_model=FilmPublicFull)
@@ -84,6 +198,8 @@ def update_film(film_id: int, film: FilmUpdate, session: Session = Depends(get_s
     db_film = session.get(Film, film_id)
     if not db_film:
         raise HTTPException(status_code=404, detail='Film not Found')
+    handler.touch(db_film)
+    handler.touch_related(cls=Film, ids=[film_id], session=session)
     film_data = film.model_dump(exclude_unset=True)
     for key, value in film_data.items():
         if key == 'producers':
@@ -94,6 +210,9 @@ def update_film(film_id: int, film: FilmUpdate, session: Session = Depends(get_s
             db_film.genres = [Genre(**g) for g in value]
         else:
             setattr(db_film, key, value)
+    session.add(db_film)
+    session.flush()
+    handler.reindex_films(ids=[film_id], session=session)
     return handler.session_routine_handler(obj=db_film, session=session)
 
 
@@ -112,17 +231,62 @@ def create_producer(producer: ProducerCreate, session: Session = Depends(get_ses
 
 
 @app.get('/producers/{producer_id}', response_model=ProducerPublicWithFilms)
-def get_producer(*, session: Session = Depends(get_session), producer_id):
-    return handler.get_object_handler(cls=Producer, obj_id=producer_id, session=session)
+def get_producer(
+        producer_id,
+        request: Request,
+        response: Response,
+        session: Session = Depends(get_session)
+):
+    return handler.cached_response(
+        request=request,
+        response=response,
+        model=ProducerPublicWithFilms,
+        validators=lambda: handler.get_object_validators(cls=Producer, obj_id=producer_id, session=session),
+        build=lambda: handler.get_object_handler(
+            cls=Producer,
+            obj_id=producer_id,
+            session=session,
+            options=PRODUCER_WITH_FILMS_OPTIONS
+        )
+    )
 
 
 @app.get('/producers/', response_model=list[ProducerPublic])
 def get_producers(
+        request: Request,
+        response: Response,
         session: Session = Depends(get_session),
         offset: int = 0,
-        limit: int = Query(default=10, le=10)
+        limit: int = Query(default=10, le=10),
+        cursor: str | None = None,
+        order_by: EntityOrder = 'id'
 ):
-    return handler.get_objects_handler(cls=Producer, session=session, offset=offset, limit=limit)
+    def build():
+        db_producers, next_cursor = handler.get_page_handler(
+            cls=Producer,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+        set_next_page_headers(request=request, response=response, next_cursor=next_cursor)
+        return db_producers
+
+    return handler.cached_response(
+        request=request,
+        response=response,
+        model=list[ProducerPublic],
+        build=build,
+        validators=lambda: handler.get_page_validators(
+            cls=Producer,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+    )
 
 
 @app.patch('/producers/{producer_id}', response_model=ProducerPublicWithFilms)
@@ -149,17 +313,62 @@ def create_actor(actor: ActorCreate, session: Session = Depends(get_session)):
 
 
 @app.get('/actors/{actor_id}', response_model=ActorPublicWithFilms)
-def get_actor(*, session: Session = Depends(get_session), actor_id):
-    return handler.get_object_handler(cls=Actor, obj_id=actor_id, session=session)
+def get_actor(
+        actor_id,
+        request: Request,
+        response: Response,
+        session: Session = Depends(get_session)
+):
+    return handler.cached_response(
+        request=request,
+        response=response,
+        model=ActorPublicWithFilms,
+        validators=lambda: handler.get_object_validators(cls=Actor, obj_id=actor_id, session=session),
+        build=lambda: handler.get_object_handler(
+            cls=Actor,
+            obj_id=actor_id,
+            session=session,
+            options=ACTOR_WITH_FILMS_OPTIONS
+        )
+    )
 
 
 @app.get('/actors/', response_model=list[ActorPublic])
 def get_actors(
+        request: Request,
+        response: Response,
         session: Session = Depends(get_session),
         offset: int = 0,
-        limit: int = Query(default=10, le=10)
+        limit: int = Query(default=10, le=10),
+        cursor: str | None = None,
+        order_by: EntityOrder = 'id'
 ):
-    return handler.get_objects_handler(cls=Actor, session=session, offset=offset, limit=limit)
+    def build():
+        db_actors, next_cursor = handler.get_page_handler(
+            cls=Actor,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+        set_next_page_headers(request=request, response=response, next_cursor=next_cursor)
+        return db_actors
+
+    return handler.cached_response(
+        request=request,
+        response=response,
+        model=list[ActorPublic],
+        build=build,
+        validators=lambda: handler.get_page_validators(
+            cls=Actor,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+    )
 
 
 @app.patch('/actors/{actor_id}', response_model=ActorPublicWithFilms)
@@ -186,17 +395,62 @@ def create_genre(genre: GenreCreate, session: Session = Depends(get_session)):
 
 
 @app.get('/genres/{genre_id}/', response_model=GenrePublicWithFilms)
-def get_genre(genre_id, session: Session = Depends(get_session)):
-    return handler.get_object_handler(cls=Genre, obj_id=genre_id, session=session)
+def get_genre(
+        genre_id,
+        request: Request,
+        response: Response,
+        session: Session = Depends(get_session)
+):
+    return handler.cached_response(
+        request=request,
+        response=response,
+        model=GenrePublicWithFilms,
+        validators=lambda: handler.get_object_validators(cls=Genre, obj_id=genre_id, session=session),
+        build=lambda: handler.get_object_handler(
+            cls=Genre,
+            obj_id=genre_id,
+            session=session,
+            options=GENRE_WITH_FILMS_OPTIONS
+        )
+    )
 
 
 @app.get('/genres/', response_model=list[GenrePublic])
 def get_genres(
+        request: Request,
+        response: Response,
         session: Session = Depends(get_session),
         offset: int = 0,
-        limit: int = Query(default=10, le=10)
+        limit: int = Query(default=10, le=10),
+        cursor: str | None = None,
+        order_by: EntityOrder = 'id'
 ):
-    return handler.get_objects_handler(cls=Genre, session=session, offset=offset, limit=limit)
+    def build():
+        db_genres, next_cursor = handler.get_page_handler(
+            cls=Genre,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+        set_next_page_headers(request=request, response=response, next_cursor=next_cursor)
+        return db_genres
+
+    return handler.cached_response(
+        request=request,
+        response=response,
+        model=list[GenrePublic],
+        build=build,
+        validators=lambda: handler.get_page_validators(
+            cls=Genre,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+    )
 
 
 @app.patch('/genres/{genre_id}', response_model=GenrePublicWithFilms)
@@ -213,6 +467,14 @@ def delete_genre(genre_id: int, session: Session = Depends(get_session)):
     return handler.deletion_handler(cls=Genre, obj_id=genre_id, session=session)
 
 
+# CACHE PART
+
+
+@app.get('/cache/stats', response_model=CacheStats | None)
+def get_cache_stats():
+    return handler.cache.stats() if handler.cache is not None else None
+
+
 if __name__ == '__main__':
     try:
         uvicorn.run(app)
@@ -0,0 +1,489 @@
+import uvicorn
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from common.ndjson import iter_batches, iter_ndjson_lines
+from common.pagination import set_next_page_headers
+
+from .async_api_routine_handler import AsyncApiRoutineHandler
+from .cache import CacheStats, ResponseCache
+from .database import create_db_and_tables_async, get_async_engine
+from .films_db_models import (Actor, ActorCreate, ActorPublic,
+                              ActorPublicWithFilms, ActorUpdate, Film,
+                              FilmBulkReport, FilmCreate, FilmPublic,
+                              FilmPublicFull, FilmUpdate, Genre, GenreCreate,
+                              GenrePublic, GenrePublicWithFilms, GenreUpdate,
+                              Producer, ProducerCreate, ProducerPublic,
+                              ProducerPublicWithFilms, ProducerUpdate)
+from .filters import FilmFilter
+from .loader_options import (ACTOR_WITH_FILMS_OPTIONS, FILM_FULL_OPTIONS,
+                             GENRE_WITH_FILMS_OPTIONS,
+                             PRODUCER_WITH_FILMS_OPTIONS)
+from .pagination import EntityOrder, FilmOrder
+from .settings import CacheSettings
+
+# Async twin of films_api: same routes, models and responses, served from an AsyncSession.
+app = FastAPI()
+handler = AsyncApiRoutineHandler(cache=ResponseCache.from_settings(CacheSettings()))
+
+
+async def get_session():
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+
+@app.on_event('startup')
+async def on_startup():
+    await create_db_and_tables_async()
+
+
+# FILMS PART
+
+
+@app.post('/films/', response_model=FilmPublicFull)
+async def create_film(
+        *,
+        session: AsyncSession = Depends(get_session),
+        film: FilmCreate,
+        producers: list[ProducerCreate],
+        actors: list[ActorCreate],
+        genres: list[GenreCreate]
+):
+    try:
+        db_film = Film.model_validate(film)
+        await handler.creation_routine_handler(
+            lst=producers,
+            cls=Producer,
+            session=session,
+            db_film=db_film
+        )
+        await handler.creation_routine_handler(
+            lst=actors,
+            cls=Actor,
+            session=session,
+            db_film=db_film
+        )
+        await handler.creation_routine_handler(
+            lst=genres,
+            cls=Genre,
+            session=session,
+            db_film=db_film
+        )
+        session.add(db_film)
+        await session.flush()
+        await handler.touch_related(cls=Film, ids=[db_film.id], session=session)
+        await handler.reindex_films(ids=[db_film.id], session=session)
+        return await handler.session_routine_handler(
+            obj=db_film,
+            session=session,
+            relationships=handler.relationships.values()
+        )
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Film name must be unique")
+
+
+@app.post('/films/bulk', response_model=FilmBulkReport)
+async def bulk_create_films(
+        request: Request,
+        session: AsyncSession = Depends(get_session),
+        chunk_size: int = Query(default=500, ge=1, le=5000)
+):
+    """
+       Imports films from an NDJSON document, one ``POST /films/`` payload per line.
+
+       The document is read as a streamed request body or from the ``file`` field of a
+       multipart upload, and every ``chunk_size`` rows are written in their own transaction.
+       """
+    report = FilmBulkReport()
+    cache = {cls: {} for cls in handler.relationships}
+    async for rows in iter_batches(iter_ndjson_lines(request), chunk_size):
+        created, errors = await handler.bulk_creation_handler(
+            rows=rows,
+            session=session,
+            cache=cache
+        )
+        report.created += created
+        report.failed += len(errors)
+        report.errors.extend(errors)
+    return report
+
+
+@app.get('/films/search', response_model=list[FilmPublic])
+async def search_films(
+        *,
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_session),
+        q: str = Query(min_length=1),
+        offset: int = 0,
+        limit: int = Query(default=10, le=10)
+):
+    """
+       Full-text search over film names, descriptions and the names of their producers,
+       actors and genres. Every word of ``q`` is prefix matched, best matches come first.
+       """
+    return await handler.cached_response(
+        request=request,
+        response=response,
+        model=list[FilmPublic],
+        build=lambda: handler.search_handler(q=q, session=session, offset=offset, limit=limit)
+    )
+
+
+@app.get('/films/{film_id}', response_model=FilmPublicFull)
+async def get_film(
+        film_id,
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_session)
+):
+    return await handler.cached_response(
+        request=request,
+        response=response,
+        model=FilmPublicFull,
+        validators=lambda: handler.get_object_validators(cls=Film, obj_id=film_id, session=session),
+        build=lambda: handler.get_object_handler(
+            cls=Film,
+            obj_id=film_id,
+            session=session,
+            options=FILM_FULL_OPTIONS
+        )
+    )
+
+
+@app.get('/films/', response_model=list[FilmPublic])
+async def get_films(
+        *,
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_session),
+        offset: int = 0,
+        limit: int = Query(default=10, le=10),
+        cursor: str | None = None,
+        order_by: FilmOrder = 'id',
+        filters: FilmFilter = Depends()
+):
+    where = filters.clauses()
+
+    async def build():
+        db_films, next_cursor = await handler.get_page_handler(
+            cls=Film,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor,
+            where=where
+        )
+        set_next_page_headers(request=request, response=response, next_cursor=next_cursor)
+        return db_films
+
+    return await handler.cached_response(
+        request=request,
+        response=response,
+        model=list[FilmPublic],
+        build=build,
+        validators=lambda: handler.get_page_validators(
+            cls=Film,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor,
+            where=where
+        )
+    )
+
+
+@app.patch('/films/{film_id}/', response_model=FilmPublicFull)
+async def update_film(film_id: int, film: FilmUpdate, session: AsyncSession = Depends(get_session)):
+    db_film = await session.get(Film, film_id, options=FILM_FULL_OPTIONS)
+    if not db_film:
+        raise HTTPException(status_code=404, detail='Film not Found')
+    handler.touch(db_film)
+    await handler.touch_related(cls=Film, ids=[film_id], session=session)
+    film_data = film.model_dump(exclude_unset=True)
+    for key, value in film_data.items():
+        if key == 'producers':
+            db_film.producers = [Producer(**p) for p in value]
+        elif key == 'actors':
+            db_film.actors = [Actor(**a) for a in value]
+        elif key == 'genres':
+            db_film.genres = [Genre(**g) for g in value]
+        else:
+            setattr(db_film, key, value)
+    session.add(db_film)
+    await session.flush()
+    await handler.reindex_films(ids=[film_id], session=session)
+    return await handler.session_routine_handler(
+        obj=db_film,
+        session=session,
+        relationships=handler.relationships.values()
+    )
+
+
+@app.delete('/films/{film_id}')
+async def delete_films(film_id: int, session: AsyncSession = Depends(get_session)):
+    return await handler.deletion_handler(cls=Film, obj_id=film_id, session=session)
+
+
+# PRODUCERS PART
+
+
+@app.post('/producers/', response_model=ProducerPublic)
+async def create_producer(producer: ProducerCreate, session: AsyncSession = Depends(get_session)):
+    db_producer = Producer.model_validate(producer)
+    return await handler.session_routine_handler(obj=db_producer, session=session)
+
+
+@app.get('/producers/{producer_id}', response_model=ProducerPublicWithFilms)
+async def get_producer(
+        producer_id,
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_session)
+):
+    return await handler.cached_response(
+        request=request,
+        response=response,
+        model=ProducerPublicWithFilms,
+        validators=lambda: handler.get_object_validators(cls=Producer, obj_id=producer_id, session=session),
+        build=lambda: handler.get_object_handler(
+            cls=Producer,
+            obj_id=producer_id,
+            session=session,
+            options=PRODUCER_WITH_FILMS_OPTIONS
+        )
+    )
+
+
+@app.get('/producers/', response_model=list[ProducerPublic])
+async def get_producers(
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_session),
+        offset: int = 0,
+        limit: int = Query(default=10, le=10),
+        cursor: str | None = None,
+        order_by: EntityOrder = 'id'
+):
+    async def build():
+        db_producers, next_cursor = await handler.get_page_handler(
+            cls=Producer,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+        set_next_page_headers(request=request, response=response, next_cursor=next_cursor)
+        return db_producers
+
+    return await handler.cached_response(
+        request=request,
+        response=response,
+        model=list[ProducerPublic],
+        build=build,
+        validators=lambda: handler.get_page_validators(
+            cls=Producer,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+    )
+
+
+@app.patch('/producers/{producer_id}', response_model=ProducerPublicWithFilms)
+async def update_producer(
+        producer_id: int,
+        producer: ProducerUpdate,
+        session: AsyncSession = Depends(get_session)
+):
+    return await handler.update_object_handler(obj=producer, cls=Producer, session=session, obj_id=producer_id)
+
+
+@app.delete('/producers/{producer_id}')
+async def delete_producer(producer_id: int, session: AsyncSession = Depends(get_session)):
+    return await handler.deletion_handler(cls=Producer, obj_id=producer_id, session=session)
+
+
+# ACTORS PART
+
+
+@app.post('/actors/', response_model=ActorPublic)
+async def create_actor(actor: ActorCreate, session: AsyncSession = Depends(get_session)):
+    db_actor = Actor.model_validate(actor)
+    return await handler.session_routine_handler(obj=db_actor, session=session)
+
+
+@app.get('/actors/{actor_id}', response_model=ActorPublicWithFilms)
+async def get_actor(
+        actor_id,
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_session)
+):
+    return await handler.cached_response(
+        request=request,
+        response=response,
+        model=ActorPublicWithFilms,
+        validators=lambda: handler.get_object_validators(cls=Actor, obj_id=actor_id, session=session),
+        build=lambda: handler.get_object_handler(
+            cls=Actor,
+            obj_id=actor_id,
+            session=session,
+            options=ACTOR_WITH_FILMS_OPTIONS
+        )
+    )
+
+
+@app.get('/actors/', response_model=list[ActorPublic])
+async def get_actors(
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_session),
+        offset: int = 0,
+        limit: int = Query(default=10, le=10),
+        cursor: str | None = None,
+        order_by: EntityOrder = 'id'
+):
+    async def build():
+        db_actors, next_cursor = await handler.get_page_handler(
+            cls=Actor,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+        set_next_page_headers(request=request, response=response, next_cursor=next_cursor)
+        return db_actors
+
+    return await handler.cached_response(
+        request=request,
+        response=response,
+        model=list[ActorPublic],
+        build=build,
+        validators=lambda: handler.get_page_validators(
+            cls=Actor,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+    )
+
+
+@app.patch('/actors/{actor_id}', response_model=ActorPublicWithFilms)
+async def update_actor(
+        actor_id: int,
+        actor: ActorUpdate,
+        session: AsyncSession = Depends(get_session)
+):
+    return await handler.update_object_handler(obj=actor, cls=Actor, session=session, obj_id=actor_id)
+
+
+@app.delete('/actors/{actor_id}')
+async def delete_actor(actor_id: int, session: AsyncSession = Depends(get_session)):
+    return await handler.deletion_handler(cls=Actor, obj_id=actor_id, session=session)
+
+
+# GENRES PART
+
+
+@app.post('/genres/', response_model=GenrePublic)
+async def create_genre(genre: GenreCreate, session: AsyncSession = Depends(get_session)):
+    db_genre = Genre.model_validate(genre)
+    return await handler.session_routine_handler(obj=db_genre, session=session)
+
+
+@app.get('/genres/{genre_id}/', response_model=GenrePublicWithFilms)
+async def get_genre(
+        genre_id,
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_session)
+):
+    return await handler.cached_response(
+        request=request,
+        response=response,
+        model=GenrePublicWithFilms,
+        validators=lambda: handler.get_object_validators(cls=Genre, obj_id=genre_id, session=session),
+        build=lambda: handler.get_object_handler(
+            cls=Genre,
+            obj_id=genre_id,
+            session=session,
+            options=GENRE_WITH_FILMS_OPTIONS
+        )
+    )
+
+
+@app.get('/genres/', response_model=list[GenrePublic])
+async def get_genres(
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_session),
+        offset: int = 0,
+        limit: int = Query(default=10, le=10),
+        cursor: str | None = None,
+        order_by: EntityOrder = 'id'
+):
+    async def build():
+        db_genres, next_cursor = await handler.get_page_handler(
+            cls=Genre,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+        set_next_page_headers(request=request, response=response, next_cursor=next_cursor)
+        return db_genres
+
+    return await handler.cached_response(
+        request=request,
+        response=response,
+        model=list[GenrePublic],
+        build=build,
+        validators=lambda: handler.get_page_validators(
+            cls=Genre,
+            session=session,
+            offset=offset,
+            limit=limit,
+            order_by=order_by,
+            cursor=cursor
+        )
+    )
+
+
+@app.patch('/genres/{genre_id}', response_model=GenrePublicWithFilms)
+async def update_genre(
+        genre_id: int,
+        genre: GenreUpdate,
+        session: AsyncSession = Depends(get_session)
+):
+    return await handler.update_object_handler(obj=genre, cls=Genre, session=session, obj_id=genre_id)
+
+
+@app.delete('/genres/{genre_id}')
+async def delete_genre(genre_id: int, session: AsyncSession = Depends(get_session)):
+    return await handler.deletion_handler(cls=Genre, obj_id=genre_id, session=session)
+
+
+# CACHE PART
+
+
+@app.get('/cache/stats', response_model=CacheStats | None)
+async def get_cache_stats():
+    return handler.cache.stats() if handler.cache is not None else None
+
+
+if __name__ == '__main__':
+    try:
+        uvicorn.run(app)
+    except KeyboardInterrupt:
+        print('Process is done')
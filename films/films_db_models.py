@@ -1,31 +1,53 @@
+from datetime import date, datetime, timezone
+
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class FilmProducerAssociation(SQLModel, table=True):
+    __table_args__ = (Index('ix_filmproducerassociation_producer_id_film_id', 'producer_id', 'film_id'),)
+
     film_id: int | None = Field(default=None, primary_key=True, foreign_key='film.id')
     producer_id: int | None = Field(default=None, primary_key=True, foreign_key='producer.id')
 
 
 class FilmActorAssociation(SQLModel, table=True):
+    __table_args__ = (Index('ix_filmactorassociation_actor_id_film_id', 'actor_id', 'film_id'),)
+
     film_id: int | None = Field(default=True, primary_key=True, foreign_key='film.id')
     actor_id: int | None = Field(default=True, primary_key=True, foreign_key='actor.id')
 
 
 class FilmGenreAssociation(SQLModel, table=True):
+    __table_args__ = (Index('ix_filmgenreassociation_genre_id_film_id', 'genre_id', 'film_id'),)
+
     film_id: int | None = Field(default=None, primary_key=True, foreign_key='film.id')
     genre_id: int | None = Field(default=None, primary_key=True, foreign_key='genre.id')
 
 
 class FilmBase(SQLModel):
     name: str = Field(index=True, unique=True)
-    release_date: str
+    release_date: date
     duration: int
     description: str | None = Field(default='No description')
     rating: float
 
 
 class Film(FilmBase, table=True):
+    # Filter and sort columns of the film listing, the trailing id serves the keyset order.
+    __table_args__ = (
+        Index('ix_film_rating_id', 'rating', 'id'),
+        Index('ix_film_release_date_id', 'release_date', 'id'),
+        Index('ix_film_duration_id', 'duration', 'id'),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
+    version: int = Field(default=1)
+    updated_at: datetime = Field(default_factory=utcnow)
     producers: list['Producer'] = Relationship(back_populates='films', link_model=FilmProducerAssociation)
     actors: list['Actor'] = Relationship(back_populates='films', link_model=FilmActorAssociation)
     genres: list['Genre'] = Relationship(back_populates='films', link_model=FilmGenreAssociation)
@@ -37,7 +59,7 @@ class FilmCreate(FilmBase):
 
 class FilmUpdate(FilmBase):
     name: str | None = None
-    release_date: str | None = None
+    release_date: date | None = None
     duration: int | None = None
     description: str | None = None
     rating: float | None = None
@@ -63,6 +85,8 @@ class ProducerBase(SQLModel):
 
 class Producer(ProducerBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
+    version: int = Field(default=1)
+    updated_at: datetime = Field(default_factory=utcnow)
     films: list[Film] = Relationship(back_populates='producers', link_model=FilmProducerAssociation)
 
 
@@ -80,7 +104,7 @@ class ProducerPublic(ProducerBase):
 
 class ProducerPublicWithFilms(ProducerBase):
     id: int
-    films: list[Film]
+    films: list[FilmPublic]
 
 
 class ActorBase(SQLModel):
@@ -89,6 +113,8 @@ class ActorBase(SQLModel):
 
 class Actor(ActorBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
+    version: int = Field(default=1)
+    updated_at: datetime = Field(default_factory=utcnow)
     films: list[Film] = Relationship(back_populates='actors', link_model=FilmActorAssociation)
 
 
@@ -115,6 +141,8 @@ class GenreBase(SQLModel):
 
 class Genre(GenreBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
+    version: int = Field(default=1)
+    updated_at: datetime = Field(default_factory=utcnow)
     films: list[Film] = Relationship(back_populates='genres', link_model=FilmGenreAssociation)
 
 
@@ -135,3 +163,19 @@ class GenrePublicWithFilms(GenreBase):
     films: list[FilmPublic]
 
 
+class FilmBulkRow(SQLModel):
+    film: FilmCreate
+    producers: list[ProducerCreate] = []
+    actors: list[ActorCreate] = []
+    genres: list[GenreCreate] = []
+
+
+class FilmBulkError(SQLModel):
+    line: int
+    detail: str | list
+
+
+class FilmBulkReport(SQLModel):
+    created: int = 0
+    failed: int = 0
+    errors: list[FilmBulkError] = []
@@ -0,0 +1,54 @@
+from datetime import date
+
+from sqlmodel import Field, SQLModel, select
+
+from .films_db_models import (Film, FilmActorAssociation, FilmGenreAssociation,
+                              FilmProducerAssociation)
+
+# Filter field -> association table linking films to the filtered entity.
+LINK_FILTERS = {
+    'genre_id': FilmGenreAssociation,
+    'actor_id': FilmActorAssociation,
+    'producer_id': FilmProducerAssociation,
+}
+
+
+class FilmFilter(SQLModel):
+    """
+       Query parameters narrowing the film listing, ranges are inclusive.
+
+       Used as ``filters: FilmFilter = Depends()`` so every field is a query parameter.
+       """
+    genre_id: int | None = None
+    actor_id: int | None = None
+    producer_id: int | None = None
+    min_rating: float | None = None
+    max_rating: float | None = None
+    min_duration: int | None = Field(default=None, ge=0)
+    max_duration: int | None = Field(default=None, ge=0)
+    released_from: date | None = None
+    released_to: date | None = None
+
+    def clauses(self):
+        """
+           WHERE clauses of the set filters.
+
+           Entity filters are ``film.id IN (SELECT film_id ...)`` subqueries answered from the
+           ``(entity_id, film_id)`` index of the association table, ranges hit the film indexes.
+           """
+        clauses = []
+        for name, link in LINK_FILTERS.items():
+            value = getattr(self, name)
+            if value is not None:
+                clauses.append(Film.id.in_(select(link.film_id).where(getattr(link, name) == value)))
+        ranges = (
+            (Film.rating, self.min_rating, self.max_rating),
+            (Film.duration, self.min_duration, self.max_duration),
+            (Film.release_date, self.released_from, self.released_to),
+        )
+        for column, low, high in ranges:
+            if low is not None:
+                clauses.append(column >= low)
+            if high is not None:
+                clauses.append(column <= high)
+        return clauses
@@ -0,0 +1,21 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+from .films_db_models import Actor, Film, Genre, Producer
+
+# Relationships serialized by the *PublicFull / *PublicWithFilms responses are loaded
+# up front: one SELECT ... IN per film collection, the films of an entity are joined.
+FILM_FULL_OPTIONS = (
+    selectinload(Film.producers),
+    selectinload(Film.actors),
+    selectinload(Film.genres),
+)
+PRODUCER_WITH_FILMS_OPTIONS = (joinedload(Producer.films),)
+ACTOR_WITH_FILMS_OPTIONS = (joinedload(Actor.films),)
+GENRE_WITH_FILMS_OPTIONS = (joinedload(Genre.films),)
+
+FULL_OPTIONS = {
+    Film: FILM_FULL_OPTIONS,
+    Producer: PRODUCER_WITH_FILMS_OPTIONS,
+    Actor: ACTOR_WITH_FILMS_OPTIONS,
+    Genre: GENRE_WITH_FILMS_OPTIONS,
+}
@@ -0,0 +1,5 @@
+from typing import Literal
+
+# A leading '-' sorts in descending order.
+FilmOrder = Literal['id', 'name', 'rating', '-rating', 'release_date', '-release_date']
+EntityOrder = Literal['id', 'name']
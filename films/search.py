@@ -0,0 +1,90 @@
+import re
+
+from sqlalchemy import (DDL, column, delete, event, func, insert,
+                        literal_column, table)
+from sqlmodel import SQLModel, select
+
+from .films_db_models import (Actor, Film, FilmActorAssociation,
+                              FilmGenreAssociation, FilmProducerAssociation,
+                              Genre, Producer)
+
+SEARCH_TABLE = 'film_search'
+SEARCH_COLUMNS = ('name', 'description', 'producers', 'actors', 'genres')
+# bm25 weights of SEARCH_COLUMNS: a hit in the title outranks one in the cast.
+SEARCH_WEIGHTS = (10.0, 1.0, 2.0, 3.0, 2.0)
+
+film_search = table(SEARCH_TABLE, column('rowid'), *(column(name) for name in SEARCH_COLUMNS))
+
+create_search_table = DDL(
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} '
+    f'USING fts5({", ".join(SEARCH_COLUMNS)}, tokenize="unicode61 remove_diacritics 2")'
+)
+drop_search_table = DDL(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def search_enabled(session):
+    return session.get_bind().dialect.name == 'sqlite'
+
+
+def linked_names(cls, link, column_name):
+    return (
+        select(func.coalesce(func.group_concat(cls.name, ' '), ''))
+        .join(link, getattr(link, column_name) == cls.id)
+        .where(link.film_id == Film.id)
+        .scalar_subquery()
+    )
+
+
+def search_rows(film_ids):
+    return select(
+        Film.id,
+        Film.name,
+        func.coalesce(Film.description, ''),
+        linked_names(Producer, FilmProducerAssociation, 'producer_id'),
+        linked_names(Actor, FilmActorAssociation, 'actor_id'),
+        linked_names(Genre, FilmGenreAssociation, 'genre_id'),
+    ).where(Film.id.in_(film_ids))
+
+
+def reindex_statements(film_ids):
+    """
+       Statements replacing the search rows of ``film_ids`` (a list or a subquery of ids).
+
+       Rows of films that no longer exist are only deleted, so the same statements keep the
+       index in sync after creations, updates and deletions.
+       """
+    return (
+        delete(film_search).where(film_search.c.rowid.in_(film_ids)),
+        insert(film_search).from_select(['rowid', *SEARCH_COLUMNS], search_rows(film_ids)),
+    )
+
+
+@event.listens_for(SQLModel.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    """Creates the FTS5 table and indexes films created before it existed."""
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.execute(create_search_table)
+    missing = select(Film.id).where(Film.id.not_in(select(film_search.c.rowid)))
+    connection.execute(insert(film_search).from_select(['rowid', *SEARCH_COLUMNS], search_rows(missing)))
+
+
+event.listen(SQLModel.metadata, 'before_drop', drop_search_table.execute_if(dialect='sqlite'))
+
+
+def match_query(q):
+    """Turns free text into an FTS5 query: every word is quoted and prefix matched."""
+    terms = re.findall(r'\w+', q)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_statement(*, q, offset, limit):
+    rank = func.bm25(literal_column(SEARCH_TABLE), *SEARCH_WEIGHTS)
+    return (
+        select(Film)
+        .join(film_search, film_search.c.rowid == Film.id)
+        .where(literal_column(SEARCH_TABLE).op('MATCH')(match_query(q)))
+        .order_by(rank, Film.id)
+        .offset(offset)
+        .limit(limit)
+    )
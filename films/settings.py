@@ -0,0 +1,42 @@
+from typing import Literal
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class DatabaseSettings(BaseSettings):
+    """
+       Database configuration read from ``FILMS_DB_*`` environment variables (or ``.env``).
+
+       ``echo`` accepts ``false``, ``true`` (log statements) or ``debug`` (statements and rows).
+       Pool options apply to file and server databases, the ``sqlite_*`` pragmas are run on
+       every new SQLite connection.
+       """
+    model_config = SettingsConfigDict(env_prefix='FILMS_DB_', env_file='.env', extra='ignore')
+
+    url: str = 'sqlite:///films.db'
+    echo: bool | Literal['debug'] = False
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    pool_recycle: int = -1
+    pool_pre_ping: bool = True
+
+    sqlite_journal_mode: Literal['DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'] = 'WAL'
+    sqlite_synchronous: Literal['OFF', 'NORMAL', 'FULL', 'EXTRA'] = 'NORMAL'
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64000
+    sqlite_busy_timeout: int = 5000
+
+
+class CacheSettings(BaseSettings):
+    """
+       Response cache configuration read from ``FILMS_CACHE_*`` environment variables.
+
+       ``url`` is ``memory://`` for the in-process LRU cache or a ``redis://`` URL.
+       """
+    model_config = SettingsConfigDict(env_prefix='FILMS_CACHE_', env_file='.env', extra='ignore')
+
+    enabled: bool = True
+    url: str = 'memory://'
+    maxsize: int = 1024
+    ttl: int = 300
@@ -1,10 +1,17 @@
 import pytest
 import json
+import time
+from contextlib import contextmanager
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import event, inspect, text
+from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
 
-from films.films_api import app, get_session
+from films.cache import LRUCacheBackend, ResponseCache
+from films.database import upgrade_schema
+from films.films_api import app, get_session, handler
+from films.filters import FilmFilter
+from films.films_db_models import Actor, Film, Genre
 
 
 def load_test_payload():
@@ -30,11 +37,35 @@ def client_fixture(session: Session):
         return session
 
     app.dependency_overrides[get_session] = get_session_override
+    if handler.cache is not None:
+        handler.cache.clear()
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(name='count_queries')
+def count_queries_fixture(session: Session):
+    """Context manager counting the SQL statements executed inside its block."""
+    engine = session.get_bind()
+
+    @contextmanager
+    def count_queries():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        session.expunge_all()
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return count_queries
+
+
 # POST Film
 
 def test_create_film_successful(client: TestClient):
@@ -46,6 +77,20 @@ def test_create_film_successful(client: TestClient):
     assert data['genres'][0]['name'] == "Science Fiction"
 
 
+def test_create_film_reuses_existing_entities(client: TestClient):
+    payload = load_test_payload()
+    first = client.post('/films/', json=payload).json()
+
+    payload['film']['name'] = "Infinite Journey II"
+    payload['actors'].append({"name": "Jessica Adams"})
+    response = client.post('/films/', json=payload)
+    assert response.status_code == 200
+    second = response.json()
+
+    assert [a['id'] for a in second['actors']] == [a['id'] for a in first['actors']]
+    assert [p['id'] for p in second['producers']] == [p['id'] for p in first['producers']]
+
+
 def test_create_film_missing_entities(client: TestClient):
     payload = load_test_payload()
     payload.pop('producers')
@@ -80,6 +125,30 @@ def test_get_film_successful(client: TestClient):
     assert response.status_code == 200
 
 
+def test_get_film_loads_relationships_eagerly(client: TestClient, count_queries):
+    film_id = client.post('/films/', json=load_test_payload()).json()['id']
+
+    with count_queries() as statements:
+        response = client.get(f'/films/{film_id}')
+    assert response.status_code == 200
+    assert len(response.json()['actors']) == 3
+    # ETag lookup, the film and one SELECT ... IN per relationship
+    assert len(statements) == 5
+
+
+def test_get_entity_with_films_in_one_query_after_etag_lookup(client: TestClient, count_queries):
+    data = client.post('/films/', json=load_test_payload()).json()
+
+    for path, entity in (('producers', 'producers'), ('actors', 'actors'), ('genres', 'genres')):
+        entity_id = data[entity][0]['id']
+        url = f'/{path}/{entity_id}/' if path == 'genres' else f'/{path}/{entity_id}'
+        with count_queries() as statements:
+            response = client.get(url)
+        assert response.status_code == 200
+        assert response.json()['films'][0]['id'] == data['id']
+        assert len(statements) == 2
+
+
 def test_get_non_existent_film(client: TestClient):
     response = client.get('/films/999999')
     assert response.status_code == 404
@@ -122,3 +191,474 @@ def test_get_films_with_invalid_limit(client: TestClient):
 def test_get_films_with_invalid_offset(client: TestClient):
     response = client.get('/films/?offset=-5')
     assert response.status_code == 404
+
+
+# POST Films bulk
+
+
+def make_bulk_payload(names):
+    rows = []
+    for name in names:
+        payload = load_test_payload()
+        payload['film']['name'] = name
+        rows.append(json.dumps(payload))
+    return '\n'.join(rows) + '\n'
+
+
+def test_bulk_create_films_successful(client: TestClient):
+    body = make_bulk_payload([f'Film {i}' for i in range(5)])
+    response = client.post('/films/bulk?chunk_size=2', content=body)
+    assert response.status_code == 200
+    assert response.json() == {'created': 5, 'failed': 0, 'errors': []}
+
+    data = client.get('/films/').json()
+    assert len(data) == 5
+
+
+def test_bulk_create_films_dedupes_entities(client: TestClient, session: Session):
+    body = make_bulk_payload([f'Film {i}' for i in range(4)])
+    client.post('/films/bulk?chunk_size=3', content=body)
+
+    assert len(session.exec(select(Actor)).all()) == 3
+    assert len(session.exec(select(Genre)).all()) == 3
+
+
+def test_bulk_create_films_queries_per_chunk(client: TestClient, count_queries):
+    rows = []
+    for i in range(40):
+        payload = load_test_payload()
+        payload['film']['name'] = f'Film {i}'
+        payload['actors'] = [{'name': f'Actor {(i + j) % 30}'} for j in range(3)]
+        rows.append(json.dumps(payload))
+    with count_queries() as statements:
+        response = client.post('/films/bulk?chunk_size=10', content='\n'.join(rows))
+    assert response.json()['created'] == 40
+
+    # Entities of earlier chunks are not refreshed one by one: per chunk, one query by id, one by name.
+    entity_selects = [
+        statement for statement in statements
+        if statement.startswith('SELECT') and 'FROM actor' in statement and 'film' not in statement
+    ]
+    assert len(entity_selects) <= 2 * 4
+    assert not any('WHERE actor.id = ?' in statement for statement in statements)
+
+
+def test_bulk_create_films_reports_failed_rows(client: TestClient):
+    client.post('/films/', json=load_test_payload())
+    body = make_bulk_payload(['Infinite Journey', 'Film 1', 'Film 1'])
+    body += '{"film": {"name": "Broken"}}\n'
+    response = client.post('/films/bulk', content=body)
+    assert response.status_code == 200
+    data = response.json()
+    assert data['created'] == 1
+    assert data['failed'] == 3
+    assert [error['line'] for error in data['errors']] == [1, 3, 4]
+
+
+def test_bulk_create_films_multipart_upload(client: TestClient):
+    body = make_bulk_payload(['Film 1', 'Film 2'])
+    response = client.post('/films/bulk', files={'file': ('films.ndjson', body)})
+    assert response.status_code == 200
+    assert response.json()['created'] == 2
+
+
+# GET Films with cursor
+
+
+def test_get_films_cursor_pagination(client: TestClient):
+    client.post('/films/bulk', content=make_bulk_payload([f'Film {i:02}' for i in range(20)]))
+
+    response = client.get('/films/')
+    assert response.headers['x-next-cursor']
+    assert response.headers['link'].endswith('; rel="next"')
+
+    seen = [film['id'] for film in response.json()]
+    cursor = response.headers['x-next-cursor']
+    while cursor:
+        response = client.get('/films/', params={'cursor': cursor})
+        assert response.status_code == 200
+        seen.extend(film['id'] for film in response.json())
+        cursor = response.headers.get('x-next-cursor')
+
+    assert seen == sorted(seen)
+    assert len(set(seen)) == 20
+
+
+def test_get_films_cursor_ordered_by_rating(client: TestClient):
+    rows = []
+    for i, rating in enumerate([7.0, 9.5, 7.0, 3.2, 8.1]):
+        payload = load_test_payload()
+        payload['film']['name'] = f'Film {i}'
+        payload['film']['rating'] = rating
+        rows.append(json.dumps(payload))
+    client.post('/films/bulk', content='\n'.join(rows))
+
+    first = client.get('/films/?order_by=rating&limit=2')
+    cursor = first.headers['x-next-cursor']
+    second = client.get(f'/films/?order_by=rating&limit=2&cursor={cursor}')
+    ratings = [film['rating'] for film in first.json() + second.json()]
+    assert ratings == [3.2, 7.0, 7.0, 8.1]
+
+
+def test_get_films_with_invalid_cursor(client: TestClient):
+    client.post('/films/', json=load_test_payload())
+    response = client.get('/films/?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+    cursor = client.get('/films/?limit=1').headers['x-next-cursor']
+    response = client.get(f'/films/?order_by=name&cursor={cursor}')
+    assert response.status_code == 400
+
+
+# GET Films with filters and sorting
+
+
+def post_catalogue(client: TestClient):
+    rows = []
+    films = [
+        ('Alpha', '2020-05-01', 90, 7.5, 'Drama', 'Ann Lee'),
+        ('Bravo', '2021-03-12', 120, 8.8, 'Comedy', 'Ann Lee'),
+        ('Charlie', '2019-11-30', 150, 6.1, 'Drama', 'Bob Kay'),
+        ('Delta', '2023-01-20', 105, 9.2, 'Drama', 'Cid Moe'),
+        ('Echo', '2022-08-08', 95, 5.4, 'Comedy', 'Bob Kay'),
+    ]
+    for name, release_date, duration, rating, genre, actor in films:
+        payload = load_test_payload()
+        payload['film'].update(name=name, release_date=release_date, duration=duration, rating=rating)
+        payload['genres'] = [{'name': genre}]
+        payload['actors'] = [{'name': actor}]
+        rows.append(json.dumps(payload))
+    client.post('/films/bulk', content='\n'.join(rows))
+
+
+def test_get_films_filtered(client: TestClient, session: Session):
+    post_catalogue(client)
+    drama = session.exec(select(Genre).where(Genre.name == 'Drama')).one()
+    ann = session.exec(select(Actor).where(Actor.name == 'Ann Lee')).one()
+
+    def names(**params):
+        return [film['name'] for film in client.get('/films/', params=params).json()]
+
+    assert names(genre_id=drama.id) == ['Alpha', 'Charlie', 'Delta']
+    assert names(genre_id=drama.id, actor_id=ann.id) == ['Alpha']
+    assert names(min_rating=7, max_rating=9) == ['Alpha', 'Bravo']
+    assert names(min_duration=100, max_duration=150) == ['Bravo', 'Charlie', 'Delta']
+    assert names(released_from='2021-01-01', released_to='2022-12-31') == ['Bravo', 'Echo']
+    assert client.get('/films/', params={'min_rating': 9.5}).status_code == 404
+    assert client.get('/films/', params={'released_from': 'last year'}).status_code == 422
+
+
+def test_get_films_sorted_descending_with_cursor(client: TestClient, session: Session):
+    post_catalogue(client)
+    drama = session.exec(select(Genre).where(Genre.name == 'Drama')).one()
+
+    first = client.get('/films/?order_by=-release_date&limit=2')
+    second = client.get('/films/', params={
+        'order_by': '-release_date',
+        'limit': 2,
+        'cursor': first.headers['x-next-cursor']
+    })
+    dates = [film['release_date'] for film in first.json() + second.json()]
+    assert dates == ['2023-01-20', '2022-08-08', '2021-03-12', '2020-05-01']
+
+    first = client.get('/films/', params={'order_by': '-rating', 'limit': 2, 'genre_id': drama.id})
+    second = client.get('/films/', params={
+        'order_by': '-rating',
+        'limit': 2,
+        'genre_id': drama.id,
+        'cursor': first.headers['x-next-cursor']
+    })
+    assert [film['name'] for film in first.json() + second.json()] == ['Delta', 'Alpha', 'Charlie']
+    assert 'x-next-cursor' not in second.headers
+
+
+def test_get_films_filters_use_indexes(session: Session):
+    def query_plan(filters, order_by):
+        statement = handler.objects_statement(
+            cls=Film,
+            offset=0,
+            limit=10,
+            order_by=order_by,
+            where=filters.clauses()
+        )
+        compiled = statement.compile(session.get_bind(), compile_kwargs={'literal_binds': True})
+        return ' '.join(row[-1] for row in session.exec(text(f'EXPLAIN QUERY PLAN {compiled}')))
+
+    plan = query_plan(FilmFilter(genre_id=1, actor_id=2), 'id')
+    assert 'COVERING INDEX ix_filmgenreassociation_genre_id_film_id' in plan
+    assert 'COVERING INDEX ix_filmactorassociation_actor_id_film_id' in plan
+    assert 'SCAN' not in plan
+
+    plan = query_plan(FilmFilter(min_rating=7), '-rating')
+    assert 'USING INDEX ix_film_rating_id' in plan
+    assert 'TEMP B-TREE' not in plan
+
+    plan = query_plan(FilmFilter(released_from='2020-01-01', released_to='2021-01-01'), 'release_date')
+    assert 'USING INDEX ix_film_release_date_id' in plan
+
+
+# Response cache
+
+
+def test_get_film_served_from_cache(client: TestClient, count_queries):
+    film_id = client.post('/films/', json=load_test_payload()).json()['id']
+    first = client.get(f'/films/{film_id}')
+
+    with count_queries() as statements:
+        second = client.get(f'/films/{film_id}')
+    assert second.json() == first.json()
+    assert len(statements) == 1
+    assert statements[0].startswith('SELECT film.id, film.version, film.updated_at')
+
+    stats = client.get('/cache/stats').json()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_cache_invalidated_by_updates(client: TestClient):
+    data = client.post('/films/', json=load_test_payload()).json()
+    actor_id = data['actors'][0]['id']
+    assert client.get('/actors/').json()[0]['name'] == 'Jessica Adams'
+    assert client.get(f'/films/{data["id"]}').json()['actors'][0]['name'] == 'Jessica Adams'
+
+    client.patch(f'/actors/{actor_id}', json={'name': 'Jess Adams'})
+    assert client.get('/actors/').json()[0]['name'] == 'Jess Adams'
+    assert client.get(f'/films/{data["id"]}').json()['actors'][0]['name'] == 'Jess Adams'
+
+    client.patch(f'/films/{data["id"]}/', json={'rating': 9.9})
+    assert client.get('/films/').json()[0]['rating'] == 9.9
+
+    client.delete(f'/films/{data["id"]}')
+    assert client.get(f'/films/{data["id"]}').status_code == 404
+
+
+def test_cached_list_keeps_next_page_headers(client: TestClient):
+    client.post('/films/bulk', content=make_bulk_payload([f'Film {i}' for i in range(3)]))
+    first = client.get('/films/?limit=2')
+    second = client.get('/films/?limit=2')
+    assert second.headers['x-next-cursor'] == first.headers['x-next-cursor']
+    assert second.headers['link'] == first.headers['link']
+
+
+def test_lru_cache_backend_evicts_and_expires(monkeypatch):
+    backend = LRUCacheBackend(maxsize=2, ttl=10)
+    backend.set('a', b'1')
+    backend.set('b', b'2')
+    backend.get('a')
+    backend.set('c', b'3')
+    assert backend.get('b') is None
+    assert backend.get('a') == b'1'
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11)
+    assert backend.get('a') is None
+
+
+def test_response_cache_with_redis_like_backend(client: TestClient, monkeypatch):
+    class FakeRedis:
+        def __init__(self):
+            self.data = {}
+
+        def get(self, name):
+            return self.data.get(name)
+
+        def set(self, name, value, ex=None):
+            self.data[name] = value
+
+        def incr(self, name, amount=1):
+            self.data[name] = str(int(self.data.get(name, 0)) + amount).encode()
+            return int(self.data[name])
+
+    backend = FakeRedis()
+    backend.set('login:user:ann', b'kept')
+    monkeypatch.setattr(handler, 'cache', ResponseCache(backend))
+    client.post('/films/', json=load_test_payload())
+    assert client.get('/films/').json() == client.get('/films/').json()
+    assert handler.cache.stats().hits == 1
+    assert handler.cache.stats().size is None
+
+    # Clearing only moves to a new generation, keys of other applications survive.
+    handler.cache.clear()
+    client.get('/films/')
+    assert handler.cache.stats().hits == 0
+    assert backend.get('login:user:ann') == b'kept'
+
+
+def test_films_api_without_cache(session: Session, monkeypatch):
+    monkeypatch.setattr(handler, 'cache', None)
+    app.dependency_overrides[get_session] = lambda: session
+    try:
+        response = TestClient(app).post('/films/', json=load_test_payload())
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+
+
+# Conditional GET
+
+
+def test_get_film_not_modified(client: TestClient, count_queries):
+    film_id = client.post('/films/', json=load_test_payload()).json()['id']
+    response = client.get(f'/films/{film_id}')
+    etag = response.headers['etag']
+    assert response.headers['last-modified']
+
+    with count_queries() as statements:
+        response = client.get(f'/films/{film_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['etag'] == etag
+    assert response.content == b''
+    assert len(statements) == 1
+
+    response = client.get(f'/films/{film_id}', headers={'If-Modified-Since': response.headers['last-modified']})
+    assert response.status_code == 304
+
+
+def test_etags_change_on_updates(client: TestClient):
+    data = client.post('/films/', json=load_test_payload()).json()
+    film_url = f'/films/{data["id"]}'
+    producer_url = f'/producers/{data["producers"][0]["id"]}'
+    film_etag = client.get(film_url).headers['etag']
+    producer_etag = client.get(producer_url).headers['etag']
+    list_etag = client.get('/films/').headers['etag']
+
+    client.patch(f'{film_url}/', json={'rating': 7.7})
+    response = client.get(film_url, headers={'If-None-Match': film_etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != film_etag
+    assert client.get(producer_url, headers={'If-None-Match': producer_etag}).status_code == 200
+    assert client.get('/films/', headers={'If-None-Match': list_etag}).status_code == 200
+
+    film_etag = response.headers['etag']
+    client.patch(producer_url, json={'name': 'Emily J. Smith'})
+    assert client.get(film_url, headers={'If-None-Match': film_etag}).status_code == 200
+
+
+def test_get_films_not_modified(client: TestClient):
+    client.post('/films/', json=load_test_payload())
+    etag = client.get('/films/').headers['etag']
+    response = client.get('/films/', headers={'If-None-Match': f'"other", {etag}'})
+    assert response.status_code == 304
+
+    # List pages only carry an ETag, a date cannot tell that rows left or entered the page.
+    assert 'last-modified' not in response.headers
+    response = client.get('/films/', headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+    assert response.status_code == 200
+
+
+# GET Films search
+
+
+def test_search_films_ranked(client: TestClient):
+    rows = []
+    for name, description, actor in [
+        ('Ocean Drift', 'A quiet story about the sea', 'Mia Stone'),
+        ('Desert Run', 'Smugglers cross the ocean of sand', 'Leo Park'),
+        ('Mountain High', 'Climbers and storms', 'Oceana Reyes'),
+    ]:
+        payload = load_test_payload()
+        payload['film'].update(name=name, description=description)
+        payload['actors'] = [{'name': actor}]
+        rows.append(json.dumps(payload))
+    client.post('/films/bulk', content='\n'.join(rows))
+
+    response = client.get('/films/search', params={'q': 'ocean'})
+    assert response.status_code == 200
+    assert [film['name'] for film in response.json()] == ['Ocean Drift', 'Mountain High', 'Desert Run']
+
+    names = [film['name'] for film in client.get('/films/search?q=leo par').json()]
+    assert names == ['Desert Run']
+    assert client.get('/films/search?q=ocean&offset=2').json()[0]['name'] == 'Desert Run'
+    assert client.get('/films/search?q=%22%2A').json() == []
+
+
+def test_search_films_follows_updates(client: TestClient):
+    data = client.post('/films/', json=load_test_payload()).json()
+    assert client.get('/films/search?q=jessica').json()[0]['id'] == data['id']
+
+    client.patch(f'/actors/{data["actors"][0]["id"]}', json={'name': 'Jane Doe'})
+    assert client.get('/films/search?q=jessica').json() == []
+    assert client.get('/films/search?q=jane').json()[0]['id'] == data['id']
+
+    client.patch(f'/films/{data["id"]}/', json={'name': 'Finite Journey', 'actors': [{'name': 'Kim Lee'}]})
+    assert client.get('/films/search?q=finite kim').json()[0]['id'] == data['id']
+    assert client.get('/films/search?q=jane').json() == []
+
+    client.delete(f'/genres/{data["genres"][0]["id"]}')
+    assert client.get('/films/search?q=science').json() == []
+    assert client.get('/films/search?q=adventure').json()[0]['id'] == data['id']
+
+    client.delete(f'/films/{data["id"]}')
+    assert client.get('/films/search?q=finite').json() == []
+
+
+# Schema upgrades
+
+
+def test_upgrade_schema_adds_validator_columns(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE film (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, release_date VARCHAR NOT NULL, '
+            'duration INTEGER NOT NULL, description VARCHAR, rating FLOAT NOT NULL)'
+        ))
+        connection.execute(text("INSERT INTO film VALUES (1, 'Old', '2001-02-03', 90, NULL, 7.5)"))
+
+    with engine.begin() as connection:
+        SQLModel.metadata.create_all(connection)
+        upgrade_schema(connection)
+        upgrade_schema(connection)
+
+    with Session(engine) as session:
+        film = session.get(Film, 1)
+        assert film.version == 1
+        assert film.updated_at is not None
+    indexes = {index['name'] for index in inspect(engine).get_indexes('film')}
+    assert {'ix_film_name', 'ix_film_rating_id'} <= indexes
+
+
+def test_upgrade_schema_normalizes_release_dates(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE film (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, release_date VARCHAR NOT NULL, '
+            'duration INTEGER NOT NULL, description VARCHAR, rating FLOAT NOT NULL)'
+        ))
+        connection.execute(text(
+            "INSERT INTO film VALUES (1, 'A', '15.07.2024', 90, NULL, 7), (2, 'B', 'March 3, 1999', 90, NULL, 7), "
+            "(3, 'C', '2001-02-03', 90, NULL, 7)"
+        ))
+
+    with engine.begin() as connection:
+        SQLModel.metadata.create_all(connection)
+        upgrade_schema(connection)
+        dates = connection.execute(text('SELECT release_date FROM film ORDER BY id')).scalars().all()
+    assert dates == ['2024-07-15', '1999-03-03', '2001-02-03']
+
+    inspector = inspect(engine)
+    assert {'ix_film_release_date_id', 'ix_film_duration_id'} <= {i['name'] for i in inspector.get_indexes('film')}
+    assert 'ix_filmgenreassociation_genre_id_film_id' in {
+        index['name'] for index in inspector.get_indexes('filmgenreassociation')
+    }
+
+
+def test_upgrade_schema_refuses_unparseable_release_dates(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE film (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, release_date VARCHAR NOT NULL, '
+            'duration INTEGER NOT NULL, description VARCHAR, rating FLOAT NOT NULL)'
+        ))
+        connection.execute(text(
+            "INSERT INTO film VALUES (1, 'A', '15.07.2024', 90, NULL, 7), (2, 'B', 'someday', 90, NULL, 7)"
+        ))
+
+    with pytest.raises(ValueError, match='film 2'):
+        with engine.begin() as connection:
+            SQLModel.metadata.create_all(connection)
+            upgrade_schema(connection)
+
+    with engine.connect() as connection:
+        dates = connection.execute(text('SELECT release_date FROM film ORDER BY id')).scalars().all()
+    assert dates == ['15.07.2024', 'someday']
+    assert 'version' not in {column['name'] for column in inspect(engine).get_columns('film')}
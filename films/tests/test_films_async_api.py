@@ -0,0 +1,83 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from films import films_api, films_async_api
+from films.cache import ResponseCache
+from films.settings import CacheSettings
+
+pytest.importorskip('aiosqlite')
+
+
+def load_test_payload():
+    with open('tests/test_films_payload.json', 'r') as file:
+        return json.load(file)
+
+
+@pytest.fixture(name='sync_client')
+def sync_client_fixture(tmp_path, monkeypatch):
+    engine = create_engine(f'sqlite:///{tmp_path / "sync.db"}', poolclass=NullPool)
+    SQLModel.metadata.create_all(engine)
+
+    def get_session_override():
+        with Session(engine) as session:
+            yield session
+
+    films_api.app.dependency_overrides[films_api.get_session] = get_session_override
+    monkeypatch.setattr(films_api.handler, 'cache', ResponseCache.from_settings(CacheSettings()))
+    yield TestClient(films_api.app)
+    films_api.app.dependency_overrides.clear()
+
+
+@pytest.fixture(name='async_client')
+def async_client_fixture(tmp_path, monkeypatch):
+    url = tmp_path / 'async.db'
+    SQLModel.metadata.create_all(create_engine(f'sqlite:///{url}', poolclass=NullPool))
+    engine = create_async_engine(f'sqlite+aiosqlite:///{url}', poolclass=NullPool)
+
+    async def get_session_override():
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    films_async_api.app.dependency_overrides[films_async_api.get_session] = get_session_override
+    monkeypatch.setattr(films_async_api.handler, 'cache', ResponseCache.from_settings(CacheSettings()))
+    yield TestClient(films_async_api.app)
+    films_async_api.app.dependency_overrides.clear()
+
+
+def run_scenario(client: TestClient):
+    payload = load_test_payload()
+    responses = [client.post('/films/', json=payload)]
+    film_id = responses[0].json()['id']
+
+    second = load_test_payload()
+    second['film']['name'] = 'Infinite Journey II'
+    second['actors'] = [{'name': 'Zoe Baker'}, {'name': 'Jessica Adams'}]
+    responses.append(client.post('/films/', json=second))
+    responses.append(client.post('/films/', json=payload))
+
+    responses.append(client.get(f'/films/{film_id}'))
+    responses.append(client.get(f'/films/{film_id}'))
+    responses.append(client.get('/films/?limit=1'))
+    responses.append(client.get('/films/?order_by=-release_date&genre_id=1&min_rating=5'))
+    responses.append(client.get('/actors/?order_by=name'))
+    responses.append(client.get('/producers/1'))
+    responses.append(client.get('/genres/1/'))
+    responses.append(client.patch(f'/films/{film_id}/', json={'rating': 9.1, 'genres': [{'name': 'Noir'}]}))
+    responses.append(client.patch('/actors/1', json={'name': 'Jessica A. Adams'}))
+    responses.append(client.get('/films/search?q=jessica noir'))
+    responses.append(client.post('/films/bulk', content=json.dumps(payload) + '\n{}\n'))
+    responses.append(client.delete(f'/films/{film_id}'))
+    responses.append(client.delete('/genres/1'))
+    responses.append(client.get(f'/films/{film_id}'))
+    responses.append(client.get('/cache/stats'))
+    return [(r.status_code, r.json(), r.headers.get('x-next-cursor')) for r in responses]
+
+
+def test_async_api_matches_sync_api(sync_client: TestClient, async_client: TestClient):
+    assert run_scenario(async_client) == run_scenario(sync_client)
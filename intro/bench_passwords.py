@@ -0,0 +1,61 @@
+"""
+Measures password verifications (logins) per second::
+
+    python -m intro.bench_passwords
+
+Verifies the same hash inline on the calling thread, then concurrently through a
+``PasswordHasher`` pool with ``PASSWORD_WORKERS`` processes, and prints logins/sec in
+total and per core. Timings are appended to ``t.txt`` by ``another.timer.outer``.
+"""
+import asyncio
+import time
+
+from another.timer import outer
+
+from .passwords import (PasswordHasher, PasswordSettings, check_password,
+                        hash_password)
+
+LOGINS = 200
+
+
+@outer(1, flag=True)
+def verify_inline(hashed):
+    for _ in range(LOGINS):
+        check_password('secret', hashed)
+
+
+@outer(1, flag=True)
+def verify_in_pool(hasher, hashed):
+    async def logins():
+        await asyncio.gather(*(hasher.verify('secret', hashed) for _ in range(LOGINS)))
+
+    asyncio.run(logins())
+
+
+def report(name, elapsed, cores):
+    rate = LOGINS / elapsed
+    print(f'{name}: {rate:.1f} logins/sec, {rate / cores:.1f} per core')
+
+
+def main():
+    settings = PasswordSettings()
+    hashed = hash_password('secret', settings.rounds)
+    print(f'{settings.rounds} rounds, {settings.workers} workers')
+
+    start = time.perf_counter()
+    verify_inline(hashed)
+    report('inline', time.perf_counter() - start, 1)
+
+    hasher = PasswordHasher(settings)
+    try:
+        # Warm the pool up so process start-up is not measured.
+        asyncio.run(hasher.run(check_password, 'secret', hashed))
+        start = time.perf_counter()
+        verify_in_pool(hasher, hashed)
+        report('pool', time.perf_counter() - start, settings.workers)
+    finally:
+        hasher.close()
+
+
+if __name__ == '__main__':
+    main()
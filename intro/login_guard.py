@@ -0,0 +1,214 @@
+import collections
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from .passwords import PasswordHasher, check_password
+
+
+class LoginSettings(BaseSettings):
+    """
+       Login throttling configuration read from ``LOGIN_*`` environment variables.
+
+       Every user and every client IP gets a token bucket holding ``*_burst`` attempts that
+       refills at ``*_per_minute``, in memory at most ``bucket_cache_size`` of them are kept.
+       Failed attempts are remembered for ``failure_ttl`` seconds, at most
+       ``failure_cache_size`` of them.
+       """
+    model_config = SettingsConfigDict(env_prefix='LOGIN_', env_file='.env', extra='ignore')
+
+    user_burst: int = 5
+    user_per_minute: float = 5
+    ip_burst: int = 20
+    ip_per_minute: float = 30
+    failure_ttl: float = 300
+    failure_cache_size: int = 10000
+    bucket_cache_size: int = 100000
+
+
+class TooManyAttempts(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Too many login attempts, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+def take_token(tokens, updated, *, capacity, rate, now):
+    """
+       Token bucket step, returns ``(retry_after, tokens)``.
+
+       The bucket holding ``tokens`` at ``updated`` (``None`` for a new, full bucket) is
+       refilled at ``rate`` tokens per second up to ``capacity``. One token is taken and
+       ``retry_after`` is 0, or there is none and it is the seconds until there will be.
+       """
+    tokens = capacity if updated is None else min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return 0.0, tokens - 1
+    return (1 - tokens) / rate, tokens
+
+
+class MemoryBuckets:
+    """
+       Token buckets of one process, in least recently used order.
+
+       A bucket is dropped once it has refilled, like the expiry of ``TOKEN_BUCKET_SCRIPT``,
+       a missing bucket being a full one. Every ``take`` prunes refilled buckets from the
+       least recently used end, and beyond ``maxsize`` the least recently used ones are
+       evicted even if they are not full, so a flood of distinct keys cannot grow memory.
+       """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, *, capacity, rate, now):
+        with self._lock:
+            tokens, updated, _ = self._buckets.pop(key, (None, None, None))
+            retry_after, tokens = take_token(tokens, updated, capacity=capacity, rate=rate, now=now)
+            if tokens < capacity:
+                self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            self.prune(now)
+        return retry_after
+
+    def prune(self, now):
+        """Drops refilled buckets from the least recently used end, the caller holds the lock."""
+        buckets = self._buckets
+        while buckets and (len(buckets) > self.maxsize or next(iter(buckets.values()))[2] <= now):
+            buckets.popitem(last=False)
+
+
+# KEYS[1] bucket hash, ARGV capacity, rate, now. Mirrors take_token, the wait is returned as a
+# string because Redis truncates Lua numbers to integers. The bucket expires once it is full.
+TOKEN_BUCKET_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = capacity
+if state[1] then
+    tokens = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+end
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """
+       Token buckets shared by every process using the same Redis.
+
+       ``client`` only needs ``eval``, e.g. ``redis.Redis`` or ``LocalRedis``. The bucket
+       update runs as one script, so concurrent attempts cannot take the same token.
+       """
+
+    def __init__(self, client, prefix='login:'):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, *, capacity, rate, now):
+        return float(self.client.eval(TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, capacity, rate, now))
+
+
+class LocalRedis:
+    """In-process stand-in for the ``eval`` of ``TOKEN_BUCKET_SCRIPT``, for tests and development."""
+
+    def __init__(self):
+        self.buckets = MemoryBuckets()
+
+    def eval(self, script, numkeys, *keys_and_args):
+        if script != TOKEN_BUCKET_SCRIPT or numkeys != 1:
+            raise NotImplementedError('LocalRedis only runs TOKEN_BUCKET_SCRIPT')
+        key, capacity, rate, now = keys_and_args
+        return str(self.buckets.take(key, capacity=capacity, rate=rate, now=now))
+
+
+class FailureCache:
+    """
+       Recently failed ``(user, stored hash, password)`` attempts.
+
+       Entries are HMAC digests under a per-process key, so the cache holds nothing an
+       offline attack could use. They expire after ``ttl`` seconds, the oldest are evicted
+       beyond ``maxsize``.
+       """
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._key = os.urandom(32)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def digest(self, username, hashed_password, password):
+        message = '\0'.join((username, hashed_password, password)).encode()
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def __contains__(self, digest):
+        with self._lock:
+            expires = self._entries.get(digest)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._entries[digest]
+                return False
+            return True
+
+    def add(self, digest):
+        with self._lock:
+            self._entries[digest] = time.monotonic() + self.ttl
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class LoginGuard:
+    """
+       Rate limits and caches login attempts in front of ``check_password``.
+
+       An attempt first takes a token from the bucket of its user and of its client IP and
+       raises ``TooManyAttempts`` without hashing anything when either is empty. A password
+       that just failed against the same stored hash is rejected from the failure cache,
+       anything else is verified by ``hasher`` (or in the threadpool without one).
+       """
+
+    def __init__(self, buckets=None, settings: LoginSettings | None = None, hasher: PasswordHasher | None = None,
+                 clock=time.time):
+        self.settings = settings or LoginSettings()
+        self.buckets = buckets or MemoryBuckets(self.settings.bucket_cache_size)
+        self.hasher = hasher
+        self.clock = clock
+        self.failures = FailureCache(self.settings.failure_ttl, self.settings.failure_cache_size)
+
+    def allow(self, username, ip):
+        now = self.clock()
+        limits = (
+            (f'user:{username}', self.settings.user_burst, self.settings.user_per_minute),
+            (f'ip:{ip}', self.settings.ip_burst, self.settings.ip_per_minute),
+        )
+        retry_after = max(
+            self.buckets.take(key, capacity=burst, rate=per_minute / 60, now=now)
+            for key, burst, per_minute in limits
+        )
+        if retry_after:
+            raise TooManyAttempts(retry_after)
+
+    async def check_password(self, username, ip, password, hashed_password):
+        self.allow(username, ip)
+        digest = self.failures.digest(username, hashed_password, password)
+        if digest in self.failures:
+            return False
+        if self.hasher is None:
+            valid = await run_in_threadpool(check_password, password, hashed_password)
+        else:
+            valid = await self.hasher.verify(password, hashed_password)
+        if not valid:
+            self.failures.add(digest)
+        return valid
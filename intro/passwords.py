@@ -1,13 +1,85 @@
+import asyncio
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
+from passlib.context import CryptContext
 from passlib.hash import pbkdf2_sha256
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
-def hash_password(password):
-    salt = os.urandom(16)
-    result = pbkdf2_sha256.hash(password, salt=salt)
-    return result
+class PasswordSettings(BaseSettings):
+    """
+       Password hashing configuration read from ``PASSWORD_*`` environment variables.
+
+       ``rounds`` is the PBKDF2 iteration count of new hashes, stored hashes with another
+       count are rehashed the next time they verify. ``workers`` processes hash in parallel
+       (one per core by default) and at most ``max_pending`` jobs queue for them.
+       """
+    model_config = SettingsConfigDict(env_prefix='PASSWORD_', env_file='.env', extra='ignore')
+
+    rounds: int = pbkdf2_sha256.default_rounds
+    workers: int = os.cpu_count() or 1
+    max_pending: int | None = None
+
+
+@lru_cache
+def crypt_context(rounds):
+    """PBKDF2 context hashing with ``rounds`` iterations and flagging hashes with any other count."""
+    return CryptContext(
+        schemes=['pbkdf2_sha256'],
+        pbkdf2_sha256__default_rounds=rounds,
+        pbkdf2_sha256__min_rounds=rounds,
+        pbkdf2_sha256__max_rounds=rounds,
+    )
+
+
+def hash_password(password, rounds=pbkdf2_sha256.default_rounds):
+    return crypt_context(rounds).hash(password)
 
 
 def check_password(password, hashed_password):
     return pbkdf2_sha256.verify(password, hashed_password)
+
+
+def verify_and_update(password, hashed_password, rounds=pbkdf2_sha256.default_rounds):
+    """
+       Returns ``(valid, new_hash)``.
+
+       ``new_hash`` is a fresh hash with ``rounds`` iterations when the password is valid but
+       was hashed with another count, otherwise ``None``.
+       """
+    return crypt_context(rounds).verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+       Hashes and verifies passwords in a pool of worker processes.
+
+       PBKDF2 is CPU-bound by design, in threads it holds the GIL and in the event loop it
+       blocks every other request. The pool spreads logins over the cores, a semaphore keeps
+       bursts waiting in the event loop once ``max_pending`` jobs are queued.
+       """
+
+    def __init__(self, settings: PasswordSettings | None = None):
+        settings = settings or PasswordSettings()
+        self.rounds = settings.rounds
+        self._executor = ProcessPoolExecutor(max_workers=settings.workers)
+        self._slots = asyncio.Semaphore(settings.max_pending or 4 * settings.workers)
+
+    async def run(self, func, *args):
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def hash(self, password):
+        return await self.run(hash_password, password, self.rounds)
+
+    async def verify(self, password, hashed_password):
+        return await self.run(check_password, password, hashed_password)
+
+    async def verify_and_update(self, password, hashed_password):
+        """Async ``verify_and_update``, store ``new_hash`` when it is not ``None``."""
+        return await self.run(verify_and_update, password, hashed_password, self.rounds)
+
+    def close(self):
+        self._executor.shutdown()
@@ -1,9 +1,18 @@
+import asyncio
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, create_engine
+from sqlalchemy import Column, Integer, MetaData, String, Table, event
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
 
+from .login_guard import (LocalRedis, LoginGuard, LoginSettings,
+                          MemoryBuckets, RedisBuckets, TooManyAttempts)
+from .passwords import (PasswordHasher, PasswordSettings, check_password,
+                        hash_password, verify_and_update)
 from .t import Hero, app, get_session
+from .tutorial.bulk_load import bulk_load, iter_csv_rows, iter_ndjson_rows
 
 
 @pytest.fixture(name="session")
@@ -123,3 +132,171 @@ def test_delete_hero(session: Session, client: TestClient):
     assert response.status_code == 200
 
     assert hero_in_db is None
+
+
+def test_verify_and_update_rehashes_other_rounds():
+    hashed = hash_password("secret", rounds=1000)
+
+    assert check_password("secret", hashed)
+    assert verify_and_update("secret", hashed, rounds=1000) == (True, None)
+    assert verify_and_update("wrong", hashed, rounds=2000) == (False, None)
+
+    valid, new_hash = verify_and_update("secret", hashed, rounds=2000)
+    assert valid
+    assert "$2000$" in new_hash
+    assert check_password("secret", new_hash)
+
+
+def test_password_hasher_pool():
+    hasher = PasswordHasher(PasswordSettings(rounds=1000, workers=2, max_pending=2))
+
+    async def scenario():
+        hashed = await hasher.hash("secret")
+        results = await asyncio.gather(*(hasher.verify(password, hashed) for password in ["secret", "wrong"] * 3))
+        stale = hash_password("secret", rounds=500)
+        return hashed, results, await hasher.verify_and_update("secret", stale)
+
+    try:
+        hashed, results, (valid, new_hash) = asyncio.run(scenario())
+    finally:
+        hasher.close()
+
+    assert "$1000$" in hashed
+    assert results == [True, False] * 3
+    assert valid
+    assert "$1000$" in new_hash
+
+
+@pytest.mark.parametrize("buckets", [None, RedisBuckets(LocalRedis())], ids=["memory", "redis"])
+def test_login_guard_limits_before_hashing(monkeypatch, buckets):
+    now = [1000.0]
+    settings = LoginSettings(user_burst=2, user_per_minute=60, ip_burst=4, ip_per_minute=60)
+    guard = LoginGuard(buckets, settings, clock=lambda: now[0])
+    hashed = hash_password("secret", rounds=1000)
+    verified = []
+    monkeypatch.setattr(
+        "intro.login_guard.check_password", lambda *args: verified.append(args) or check_password(*args)
+    )
+
+    assert asyncio.run(guard.check_password("ann", "10.0.0.1", "secret", hashed))
+    assert not asyncio.run(guard.check_password("ann", "10.0.0.1", "wrong", hashed))
+    with pytest.raises(TooManyAttempts) as error:
+        asyncio.run(guard.check_password("ann", "10.0.0.1", "secret", hashed))
+    assert error.value.retry_after == pytest.approx(1)
+    assert len(verified) == 2
+
+    # Rejected attempts count too, another user from the same IP gets the last IP token.
+    assert asyncio.run(guard.check_password("bob", "10.0.0.1", "secret", hashed))
+    with pytest.raises(TooManyAttempts):
+        asyncio.run(guard.check_password("bob", "10.0.0.1", "secret", hashed))
+
+    now[0] += 1
+    assert asyncio.run(guard.check_password("ann", "10.0.0.2", "secret", hashed))
+
+
+def test_login_guard_caches_failures(monkeypatch):
+    guard = LoginGuard(settings=LoginSettings(user_burst=10, ip_burst=10))
+    hashed = hash_password("secret", rounds=1000)
+    verified = []
+    monkeypatch.setattr(
+        "intro.login_guard.check_password", lambda *args: verified.append(args) or check_password(*args)
+    )
+
+    for _ in range(3):
+        assert not asyncio.run(guard.check_password("ann", "10.0.0.1", "wrong", hashed))
+    assert asyncio.run(guard.check_password("ann", "10.0.0.1", "secret", hashed))
+    assert not asyncio.run(guard.check_password("ann", "10.0.0.1", "other", hashed))
+    assert len(verified) == 3
+
+
+def test_memory_buckets_stay_bounded():
+    buckets = MemoryBuckets(maxsize=100)
+    for i in range(50):
+        buckets.take(f"ip:{i}", capacity=2, rate=1, now=0.0)
+    assert len(buckets) == 50
+
+    # Refilled buckets are pruned as later attempts come in.
+    buckets.take("ip:new", capacity=2, rate=1, now=1.0)
+    assert len(buckets) == 1
+
+    for i in range(1000):
+        buckets.take(f"ip:{i}", capacity=2, rate=1, now=2.0)
+    assert len(buckets) == 100
+
+    # A recently used bucket survives the evictions and keeps its state.
+    buckets.take("ip:999", capacity=2, rate=1, now=2.0)
+    assert buckets.take("ip:999", capacity=2, rate=1, now=2.0) == pytest.approx(1)
+
+
+@pytest.fixture(name="people")
+def people_fixture():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    table = Table(
+        "people",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("name", String, unique=True, index=True),
+        Column("age", Integer, index=True),
+    )
+    table.metadata.create_all(engine)
+    batches = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith("INSERT"):
+            batches.append(len(parameters) if executemany else 1)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield engine, table, batches
+    engine.dispose()
+
+
+def test_bulk_load_csv_in_chunks(people, tmp_path):
+    engine, table, batches = people
+    path = tmp_path / "people.csv"
+    path.write_text("name,age,city\nann,31,Oslo\nbob,42,Rome\ncid,25,Lima\ndee,37,Kyiv\neve,29,Faro\n")
+
+    count = bulk_load(engine, table, iter_csv_rows(path, ("name", "age")), columns=("name", "age"),
+                      chunk_size=2, defer_indexes=True)
+    assert count == 5
+    assert batches == [2, 2, 1]
+    with engine.connect() as connection:
+        assert connection.execute(select(table.c.name, table.c.age).order_by(table.c.age)).first() == ("cid", 25)
+    assert {index.name for index in table.indexes} == {"ix_people_age", "ix_people_name"}
+
+    duplicate = tmp_path / "duplicate.csv"
+    duplicate.write_text("name,age\nfay,33\nann,50\n")
+    with pytest.raises(IntegrityError):
+        bulk_load(engine, table, iter_csv_rows(duplicate, ("name", "age")), columns=("name", "age"),
+                  defer_indexes=True)
+    count = bulk_load(engine, table, iter_csv_rows(duplicate, ("name", "age")), columns=("name", "age"),
+                      defer_indexes=True, on_conflict="ignore")
+    assert count == 1
+    with engine.connect() as connection:
+        assert connection.execute(select(table.c.age).where(table.c.name == "ann")).scalar_one() == 31
+
+
+def test_bulk_load_ndjson_conflicts(people, tmp_path):
+    engine, table, batches = people
+    bulk_load(engine, table, [("ann", 30), ("bob", 40)], columns=("name", "age"))
+    path = tmp_path / "people.ndjson"
+    path.write_text('{"name": "ann", "age": 31}\n\n{"name": "cid", "age": 25}\n{"name": "bob", "age": 41}\n')
+
+    def ages():
+        with engine.connect() as connection:
+            return dict(connection.execute(select(table.c.name, table.c.age)).all())
+
+    with pytest.raises(IntegrityError):
+        bulk_load(engine, table, iter_ndjson_rows(path, ("name", "age")), columns=("name", "age"))
+    assert ages() == {"ann": 30, "bob": 40}
+
+    count = bulk_load(engine, table, iter_ndjson_rows(path, ("name", "age")), columns=("name", "age"),
+                      chunk_size=2, on_conflict="ignore")
+    assert count == 1
+    assert ages() == {"ann": 30, "bob": 40, "cid": 25}
+
+    count = bulk_load(engine, table, iter_ndjson_rows(path, ("name", "age")), columns=("name", "age"),
+                      on_conflict="replace")
+    assert count == 3
+    assert ages() == {"ann": 31, "bob": 41, "cid": 25}
+    with pytest.raises(ValueError):
+        bulk_load(engine, table, [], columns=("name", "age"), on_conflict="update")
@@ -0,0 +1,68 @@
+"""
+Compares loading people one ORM object at a time with ``bulk_load``::
+
+    python -m intro.tutorial.bench_bulk_load [rows]
+
+``orm`` is the ``create_person_with_index`` approach: the rows are materialized in a list
+and added to the session one ``PersonIndexed`` at a time before a single commit. ``bulk``
+streams the same rows from a generator through Core inserts and builds the indexes at
+the end. Each run gets a fresh process and database, so its peak RSS is its own. The rows
+are synthetic, Faker costs the same per row in both approaches and would only blur them.
+"""
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+ROWS = 200000
+COLUMNS = ('name', 'age', 'address')
+
+
+def iter_people(count):
+    names = ['Ann', 'Bob', 'Cid', 'Dee', 'Eve', 'Fay', 'Gus', 'Hal']
+    for i in range(count):
+        yield f'{random.choice(names)} {i}', random.randint(18, 80), f'{i} Main Street, Springfield'
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def load(approach, rows):
+    """Runs in a fresh process, returns ``(seconds, peak RSS in MB)``."""
+    from sqlmodel import Session, SQLModel, create_engine
+
+    from intro.tutorial.bulk_load import bulk_load
+    from intro.tutorial.time_checker import PersonIndexed
+
+    engine = create_engine(f'sqlite:///{tempfile.mkdtemp()}/person.db')
+    SQLModel.metadata.create_all(engine, tables=[PersonIndexed.__table__])
+    start = time.perf_counter()
+    if approach == 'orm':
+        with Session(engine) as session:
+            for name, age, address in list(iter_people(rows)):
+                session.add(PersonIndexed(name=name, age=age, address=address))
+            session.commit()
+    else:
+        bulk_load(engine, PersonIndexed.__table__, iter_people(rows), columns=COLUMNS, defer_indexes=True)
+    return time.perf_counter() - start, peak_rss_mb()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    # time_checker opens its databases on import, keep them out of the working directory.
+    os.chdir(tempfile.mkdtemp())
+    for approach in ('orm', 'bulk'):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            seconds, peak = executor.submit(load, approach, rows).result()
+        print(f'{approach}: {rows} rows in {seconds:.2f}s, {rows / seconds:.0f} rows/sec, peak RSS {peak:.0f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import csv
+import json
+from itertools import islice
+
+from sqlalchemy.dialects.sqlite import insert
+
+CHUNK_SIZE = 10000
+
+
+def iter_chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def iter_csv_rows(path, columns):
+    """Yields the ``columns`` values of every row of a CSV file with a header line."""
+    with open(path, newline='') as file:
+        for row in csv.DictReader(file):
+            yield tuple(row[column] for column in columns)
+
+
+def iter_ndjson_rows(path, columns):
+    """Yields the ``columns`` values of every object of an NDJSON file, blank lines are skipped."""
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                row = json.loads(line)
+                yield tuple(row.get(column) for column in columns)
+
+
+def bulk_load(engine, table, rows, *, columns, chunk_size=CHUNK_SIZE, defer_indexes=False, on_conflict=None):
+    """
+       Inserts ``rows``, tuples of ``columns`` values, into ``table`` and returns the number written.
+
+       The rows are consumed ``chunk_size`` at a time and each chunk is one Core
+       ``executemany``, so neither the input nor ORM objects are ever held in full. Everything
+       runs in one transaction. With ``defer_indexes`` the non-unique indexes of the table are
+       dropped first and built once after the load, which is faster than updating them row by
+       row. Unique indexes stay, they are what detects the conflicts below.
+
+       A row violating a unique constraint fails the whole load by default. ``on_conflict``
+       ``'ignore'`` skips it, so it is not counted, and ``'replace'`` overwrites the stored row.
+       """
+    statement = insert(table)
+    if on_conflict == 'ignore':
+        statement = statement.on_conflict_do_nothing()
+    elif on_conflict == 'replace':
+        statement = statement.prefix_with('OR REPLACE')
+    elif on_conflict is not None:
+        raise ValueError(f"on_conflict must be None, 'ignore' or 'replace', not {on_conflict!r}")
+    indexes = [index for index in table.indexes if not index.unique] if defer_indexes else []
+    count = 0
+    with engine.begin() as connection:
+        for index in indexes:
+            index.drop(connection, checkfirst=True)
+        for chunk in iter_chunks(rows, chunk_size):
+            count += connection.execute(statement, [dict(zip(columns, row)) for row in chunk]).rowcount
+        for index in indexes:
+            index.create(connection)
+    return count
@@ -3,7 +3,9 @@ import random
 from faker import Faker
 from sqlmodel import Field, Session, SQLModel, create_engine, select
 
+from another.bench import benchmark
 from another.timer import outer
+from intro.tutorial.bulk_load import bulk_load
 
 sqlite_file_name = "person.db"
 sqlite_url = f"sqlite:///{sqlite_file_name}"
@@ -28,6 +30,12 @@ def generate_random_users(num_users):
     return user_data
 
 
+def iter_random_users(num_users):
+    faker = Faker()
+    for _ in range(num_users):
+        yield faker.name(), random.randint(18, 80), faker.address()
+
+
 class PersonIndexed(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
     name: str = Field(index=True)
@@ -63,6 +71,18 @@ def create_person_with_index():
         session.commit()
 
 
+# Same rows as create_person_with_index, streamed through Core inserts with the indexes built afterwards.
+@outer(1, flag=True)
+def create_person_with_index_bulk():
+    bulk_load(
+        engine,
+        PersonIndexed.__table__,
+        iter_random_users(1000000),
+        columns=('name', 'age', 'address'),
+        defer_indexes=True
+    )
+
+
 @outer(1, flag=True)
 def create_person_without_index():
     with Session(engine2) as session:
@@ -73,31 +93,28 @@ def create_person_without_index():
         session.commit()
 
 
-@outer(1)
+@benchmark(rounds=20, warmup=2, disable_gc=True)
 def show_db_data_index():
     with Session(engine) as session:
         # persons = session.exec(select(PersonIndexed)).all()
-        person = session.exec(select(PersonIndexed).where(PersonIndexed.age >= 32, PersonIndexed.id <= 50)).all()
-        # print(persons)
-        print(person)
-        print('\n'*5)
+        return session.exec(select(PersonIndexed).where(PersonIndexed.age >= 32, PersonIndexed.id <= 50)).all()
 
 
-@outer(1)
+@benchmark(rounds=20, warmup=2, disable_gc=True)
 def show_db_data():
     with Session(engine2) as session:
         # persons = session.exec(select(PersonIndexed)).all()
-        person = session.exec(select(PersonNotIndexed).where(PersonNotIndexed.age >= 32, PersonNotIndexed.age <= 50)).all()
-        # print(persons)
-        print(person)
+        statement = select(PersonNotIndexed).where(PersonNotIndexed.age >= 32, PersonNotIndexed.age <= 50)
+        return session.exec(statement).all()
 
 
 def main():
     # create_db_and_tables()
     # create_person_with_index()
+    # create_person_with_index_bulk()
     # create_person_without_index()
-    show_db_data_index()
-    show_db_data()
+    print(len(show_db_data_index()), 'indexed rows')
+    print(len(show_db_data()), 'rows')
 
 
 if __name__ == '__main__':